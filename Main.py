@@ -1,14 +1,52 @@
+import argparse
+import os
+
 from giskard_question_generation import run_question_generation
 from giskard_evaluation import run_evaluation
 from gemini_answer_generation import run_answer_generation
+from hedging import HEDGE_MODES
+from client_registry import get_client_registry, print_client_stats
+from instrumentation import get_profiler
+from reporting import print_cache_stats, print_retry_stats, print_summary
+from run_store import RunLog
 
-def main():
-    print("=" * 60)
-    print("ПОЛНЫЙ РАБОЧИЙ ПРОЦЕСС: GEMINI (выбор текста + ответы) + GISCARD (вопросы + оценка)")
-    print("=" * 60)
-    
+def run_streaming(run_log, retrieval_top_k=None, dedup_threshold=None, question_workers=1, hedge=None):
+    from pipeline import run_pipeline
+
+    questions, model_answers, evaluation_results = run_pipeline(run_log=run_log, retrieval_top_k=retrieval_top_k,
+                                                                dedup_threshold=dedup_threshold,
+                                                                question_workers=question_workers, hedge=hedge)
+    if evaluation_results:
+        print_summary(evaluation_results, len(model_answers))
+    else:
+        print("❌ Не удалось выполнить потоковый конвейер")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Gemini + Giskard: вопросы, ответы и оценка по отрывку романа")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="потоковый режим: каждый вопрос отвечается и оценивается сразу после генерации")
+    parser.add_argument('--resume', metavar='RUN_ID',
+                        help="продолжить прерванный запуск из runs/<RUN_ID>, пропуская готовые элементы")
+    parser.add_argument('--retrieval-top-k', type=int, metavar='K',
+                        help="передавать в промпт ответа только K наиболее релевантных фрагментов отрывка (BM25)")
+    parser.add_argument('--dedup-threshold', type=float, metavar='J',
+                        help="порог сходства (Jaccard по символьным шинглам) для отсева почти-дубликатов вопросов; "
+                             "1 — не отсеивать")
+    parser.add_argument('--question-workers', type=int, default=1, metavar='N',
+                        help="генерировать вопросы параллельно: база знаний делится на шарды, N потоков")
+    parser.add_argument('--hedge', choices=HEDGE_MODES,
+                        help="хеджировать медленные ответы: дубликат после p95 задержки той же модели (same) "
+                             "или резервному провайдеру (fallback); бюджет — HEDGE_BUDGET, HEDGE_MAX_EXTRA_CALLS")
+    parser.add_argument('--cprofile', action='store_true',
+                        help="снимать cProfile по каждому этапу в runs/<RUN_ID>/cprofile")
+    return parser.parse_args()
+
+
+def run_stages(run_log, retrieval_top_k=None, dedup_threshold=None, question_workers=1, hedge=None):
     print("\n1️⃣ Запуск генерации вопросов через Giskard (с получением отрывка через Gemini)...")
-    result = run_question_generation(return_data=True)
+    result = run_question_generation(return_data=True, run_log=run_log, dedup_threshold=dedup_threshold,
+                                     workers=question_workers)
     if result and len(result) == 2:
         questions, excerpt = result
         if questions and excerpt:
@@ -16,38 +54,17 @@ def main():
             print(f"✅ Отрывок получен через Gemini (длина: {len(excerpt)} символов)")
             
             print("\n2️⃣ Запуск генерации ответов...")
-            model_answers = run_answer_generation(questions, excerpt)
+            model_answers = run_answer_generation(questions, excerpt, run_log=run_log,
+                                                  retrieval_top_k=retrieval_top_k, hedge=hedge)
             
             if model_answers:
                 print(f"\n✅ Получено {len(model_answers)} ответов")
                 
                 print("\n3️⃣ Запуск оценки ответов...")
-                evaluation_results = run_evaluation(questions, excerpt, model_answers)
+                evaluation_results = run_evaluation(questions, excerpt, model_answers, run_log=run_log)
                 
                 if evaluation_results:
-                    print("\n📊 ИТОГОВЫЕ РЕЗУЛЬТАТЫ:")
-                    print(f"   Вопросов сгенерировано (Giskard): {evaluation_results.get('total_questions', 0)}")
-                    print(f"   Ответов получено: {len(model_answers)}")
-                    print(f"   Точность: {evaluation_results.get('accuracy', 0):.2%}")
-                    print(f"   Процент успеха: {evaluation_results.get('success_rate', 0):.1f}%")
-                    
-                    if 'automatic_metrics' in evaluation_results:
-                        auto_metrics = evaluation_results['automatic_metrics']
-                        print(f"\n🤖 АВТОМАТИЧЕСКИЕ МЕТРИКИ GISKARD:")
-                        print(f"   - Правильных ответов: {auto_metrics.get('correct_answers', 0)}/{auto_metrics.get('total_questions', 0)}")
-                        print(f"   - Точность: {auto_metrics.get('accuracy', 0):.2%}")
-                        print(f"   - Процент успеха: {auto_metrics.get('success_rate', 0):.1f}%")
-                    
-                    if 'evaluation_results' in evaluation_results:
-                        print(f"\n📋 ДЕТАЛЬНЫЕ РЕЗУЛЬТАТЫ (первые 5 вопросов):")
-                        for i, result in enumerate(evaluation_results['evaluation_results'][:5]):
-                            print(f"   Вопрос {result['question_id']+1}: {'✅' if result.get('correctness', False) else '❌'}")
-                            print(f"      Вопрос (Giskard): {result['question'][:60]}...")
-                            print(f"      Ответ: {result['gemini_answer'][:60]}...")
-                            print()
-                        
-                        if len(evaluation_results['evaluation_results']) > 5:
-                            print(f"   ... и еще {len(evaluation_results['evaluation_results']) - 5} вопросов")
+                    print_summary(evaluation_results, len(model_answers))
                 else:
                     print("❌ Не удалось оценить ответы")
             else:
@@ -57,5 +74,35 @@ def main():
     else:
         print("❌ Не удалось сгенерировать вопросы")
 
+
+def main():
+    args = parse_args()
+    # Соединения с Gemini и OpenAI открываются в фоне, пока идут импорты и чтение журнала
+    get_client_registry().warm_up()
+    print("=" * 60)
+    print("ПОЛНЫЙ РАБОЧИЙ ПРОЦЕСС: GEMINI (выбор текста + ответы) + GISCARD (вопросы + оценка)")
+    print("=" * 60)
+
+    run_log = RunLog.resume(args.resume) if args.resume else RunLog()
+    print(f"🗂️ Журнал запуска: {run_log.path} (продолжить: python Main.py --resume {run_log.run_id})")
+    profiler = get_profiler()
+    if args.cprofile:
+        profiler.cprofile_dir = os.path.join(run_log.path, 'cprofile')
+
+    try:
+        if args.pipeline:
+            run_streaming(run_log, args.retrieval_top_k, args.dedup_threshold, args.question_workers, args.hedge)
+        else:
+            run_stages(run_log, args.retrieval_top_k, args.dedup_threshold, args.question_workers, args.hedge)
+    finally:
+        run_log.close()
+        profiler.print_summary()
+        json_path, prom_path = profiler.write(run_log.path)
+        print(f"📁 Профиль запуска: {json_path}, метрики Prometheus: {prom_path}")
+    print_cache_stats()
+    print_retry_stats()
+    print_client_stats()
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,306 @@
+import argparse
+import contextlib
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from client_registry import get_client_registry
+from gemini_answer_generation import DEFAULT_CONCURRENCY, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+from giskard_question_generation import NUM_QUESTIONS
+from instrumentation import RunProfiler, set_profiler
+from rate_limiter import SharedTokenBucketLimiter, set_llm_client_limiter
+from retry_policy import RetryPolicy, SharedCircuitBreaker, set_default_policy
+from run_store import RUNS_DIR, RunLog, claim_run_id
+
+
+DEFAULT_WORKERS = 4
+DEFAULT_EXCERPT_WORDS = 600
+DEFAULT_OPENAI_REQUESTS_PER_MINUTE = 500
+DEFAULT_OPENAI_TOKENS_PER_MINUTE = 200000
+
+_worker_limiter = None
+
+
+def load_texts(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path)) if name.lower().endswith('.txt')
+            )
+        else:
+            files.append(path)
+
+    texts = []
+    for file_path in files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            texts.append((os.path.basename(file_path), f.read()))
+    return texts
+
+
+def split_into_excerpts(text, excerpt_words=DEFAULT_EXCERPT_WORDS):
+    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
+    excerpts = []
+    current = []
+    current_words = 0
+    for paragraph in paragraphs:
+        words = paragraph.split()
+        # Слишком длинный абзац режем по словам, чтобы отрывок не выходил за бюджет
+        while len(words) > excerpt_words:
+            if current:
+                excerpts.append("\n\n".join(current))
+                current, current_words = [], 0
+            excerpts.append(' '.join(words[:excerpt_words]))
+            words = words[excerpt_words:]
+        if current_words + len(words) > excerpt_words and current:
+            excerpts.append("\n\n".join(current))
+            current, current_words = [], 0
+        if words:
+            current.append(' '.join(words))
+            current_words += len(words)
+    if current:
+        excerpts.append("\n\n".join(current))
+    return excerpts
+
+
+def build_tasks(texts, excerpt_words=DEFAULT_EXCERPT_WORDS, max_excerpts=None):
+    tasks = []
+    for source, text in texts:
+        for index, excerpt in enumerate(split_into_excerpts(text, excerpt_words)):
+            tasks.append({
+                'excerpt_id': f"{os.path.splitext(source)[0]}_{index:04d}",
+                'source': source,
+                'excerpt': excerpt
+            })
+    return tasks[:max_excerpts] if max_excerpts else tasks
+
+
+def _init_worker(limiter, openai_limiter, breakers):
+    global _worker_limiter
+    _worker_limiter = limiter
+    # Генерация вопросов и LLM-судья Giskard идут в OpenAI: у них свой общий лимитер
+    set_llm_client_limiter(openai_limiter)
+    set_default_policy(RetryPolicy(breakers=breakers))
+    # Клиенты процесса создаются и прогреваются один раз, пока процесс ждет первую задачу
+    get_client_registry().warm_up()
+
+
+def process_excerpt(task, batch_dir, num_questions, answer_concurrency, question_workers=1):
+    from gemini_answer_generation import generate_answers, save_answers
+    from giskard_evaluation import evaluate_answers
+    from giskard_question_generation import load_or_generate_questions, save_questions
+
+    started = time.perf_counter()
+    summary = {
+        'excerpt_id': task['excerpt_id'],
+        'source': task['source'],
+        'status': 'failed',
+        'questions': 0,
+        'answers': 0,
+        'correct_answers': 0,
+        'accuracy': 0.0,
+        'retries': 0,
+        'backoff_seconds': 0.0,
+        'verdicts_reused': 0,
+        'verdicts_computed': 0,
+        'duplicates_removed': 0,
+        'error': None
+    }
+    run_log = RunLog(task['excerpt_id'], base_dir=batch_dir)
+    # Профиль на каждый отрывок: процесс пула обрабатывает несколько отрывков подряд
+    profiler = set_profiler(RunProfiler())
+    log_path = os.path.join(run_log.path, 'stdout.log')
+    try:
+        with open(log_path, 'a', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+            run_log.set_meta('excerpt', task['excerpt'])
+            run_log.set_meta('source', task['source'])
+            questions = load_or_generate_questions(task['excerpt'], run_log, num_questions,
+                                                   workers=question_workers)
+            if not questions:
+                raise RuntimeError("Giskard не сгенерировал ни одного вопроса")
+            save_questions(questions, run_log.summary_path('giskard_questions'))
+            summary['questions'] = len(questions)
+            summary['duplicates_removed'] = (run_log.get_meta('dedup') or {}).get('duplicates', 0)
+
+            answers = generate_answers(
+                get_client_registry().text_model(stage='answers'), questions, task['excerpt'],
+                concurrency=answer_concurrency, limiter=_worker_limiter, run_log=run_log
+            )
+            save_answers(answers, run_log.summary_path('answers'))
+            summary['answers'] = len(answers)
+
+            evaluation = evaluate_answers(questions, task['excerpt'], answers, run_log=run_log)
+            if not evaluation:
+                raise RuntimeError("Оценка ответов завершилась ошибкой")
+            summary['correct_answers'] = evaluation['automatic_metrics']['correct_answers']
+            summary['accuracy'] = evaluation['accuracy']
+            summary['verdicts_reused'] = evaluation['scoring'].get('reused', 0)
+            summary['verdicts_computed'] = evaluation['scoring'].get('computed', 0)
+            summary['status'] = 'ok'
+    except Exception as e:
+        summary['error'] = f"{type(e).__name__}: {e}"
+        with open(log_path, 'a', encoding='utf-8') as log:
+            traceback.print_exc(file=log)
+    finally:
+        run_log.close()
+        profiler.write(run_log.path)
+        stages = profiler.to_dict()['stages'].values()
+        summary['retries'] = sum(stage['retries'] for stage in stages)
+        summary['backoff_seconds'] = round(sum(stage['backoff_seconds'] for stage in stages), 3)
+
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def aggregate_report(batch_id, summaries, wall_seconds, workers):
+    ok = [s for s in summaries if s['status'] == 'ok']
+    total_questions = sum(s['questions'] for s in ok)
+    total_correct = sum(s['correct_answers'] for s in ok)
+
+    by_source = {}
+    for s in ok:
+        source = by_source.setdefault(s['source'], {'excerpts': 0, 'questions': 0, 'correct_answers': 0})
+        source['excerpts'] += 1
+        source['questions'] += s['questions']
+        source['correct_answers'] += s['correct_answers']
+    for source in by_source.values():
+        source['accuracy'] = source['correct_answers'] / source['questions'] if source['questions'] else 0.0
+
+    return {
+        'batch_id': batch_id,
+        'timestamp': datetime.now().isoformat(),
+        'workers': workers,
+        'wall_seconds': round(wall_seconds, 3),
+        'excerpts_total': len(summaries),
+        'excerpts_ok': len(ok),
+        'excerpts_failed': len(summaries) - len(ok),
+        'total_questions': total_questions,
+        'correct_answers': total_correct,
+        'accuracy': total_correct / total_questions if total_questions else 0.0,
+        'excerpts_per_minute': len(summaries) / wall_seconds * 60 if wall_seconds else 0.0,
+        'retries': sum(s.get('retries', 0) for s in summaries),
+        'backoff_seconds': round(sum(s.get('backoff_seconds', 0.0) for s in summaries), 3),
+        'verdicts_reused': sum(s.get('verdicts_reused', 0) for s in summaries),
+        'verdicts_computed': sum(s.get('verdicts_computed', 0) for s in summaries),
+        'duplicates_removed': sum(s.get('duplicates_removed', 0) for s in summaries),
+        'by_source': by_source,
+        'excerpts': sorted(summaries, key=lambda s: s['excerpt_id'])
+    }
+
+
+def run_batch(paths, workers=DEFAULT_WORKERS, excerpt_words=DEFAULT_EXCERPT_WORDS, max_excerpts=None,
+              num_questions=NUM_QUESTIONS, answer_concurrency=DEFAULT_CONCURRENCY,
+              requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+              batch_id=None, question_workers=1, openai_requests_per_minute=DEFAULT_OPENAI_REQUESTS_PER_MINUTE,
+              openai_tokens_per_minute=DEFAULT_OPENAI_TOKENS_PER_MINUTE):
+    print("=" * 60)
+    print("ПАКЕТНЫЙ РЕЖИМ: КОРПУС ТЕКСТОВ")
+    print("=" * 60)
+
+    tasks = build_tasks(load_texts(paths), excerpt_words, max_excerpts)
+    if not tasks:
+        print("❌ Не найдено текстов для обработки")
+        return None
+
+    batch_id = batch_id or claim_run_id(RUNS_DIR, prefix='batch_')
+    batch_dir = os.path.join(RUNS_DIR, f"batch_{batch_id}")
+    os.makedirs(batch_dir, exist_ok=True)
+    print(f"Отрывков: {len(tasks)}, процессов: {workers}, каталог: {batch_dir}")
+
+    # Лимитер и предохранитель на каждого провайдера, общие для всех процессов: суммарная нагрузка не превышает
+    # квоту API, а после 429 паузу выдерживают все процессы сразу
+    limiter = SharedTokenBucketLimiter(requests_per_minute, tokens_per_minute)
+    openai_limiter = SharedTokenBucketLimiter(openai_requests_per_minute, openai_tokens_per_minute)
+    breakers = {'gemini': SharedCircuitBreaker(), 'openai': SharedCircuitBreaker()}
+
+    started = time.perf_counter()
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(limiter, openai_limiter, breakers)) as executor:
+        futures = {
+            executor.submit(
+                process_excerpt, task, batch_dir, num_questions, answer_concurrency, question_workers
+            ): task
+            for task in tasks
+        }
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                summary = {
+                    'excerpt_id': task['excerpt_id'], 'source': task['source'], 'status': 'failed',
+                    'questions': 0, 'answers': 0, 'correct_answers': 0, 'accuracy': 0.0,
+                    'retries': 0, 'backoff_seconds': 0.0, 'error': f"{type(e).__name__}: {e}", 'seconds': 0.0
+                }
+            summaries.append(summary)
+            mark = '✅' if summary['status'] == 'ok' else '❌'
+            print(f"{mark} [{len(summaries)}/{len(tasks)}] {summary['excerpt_id']}: "
+                  f"{summary['correct_answers']}/{summary['questions']} "
+                  f"({summary['seconds']:.1f} с){' - ' + summary['error'] if summary['error'] else ''}")
+
+    report = aggregate_report(batch_id, summaries, time.perf_counter() - started, workers)
+    report['limiter_wait_seconds'] = round(limiter.total_wait, 3)
+    report['openai_limiter_wait_seconds'] = round(openai_limiter.total_wait, 3)
+    report['breaker_trips'] = sum(breaker.trips for breaker in breakers.values())
+    report['breaker_wait_seconds'] = round(sum(breaker.total_wait for breaker in breakers.values()), 3)
+    report['breakers'] = {provider: {'trips': breaker.trips, 'wait_seconds': round(breaker.total_wait, 3)}
+                          for provider, breaker in breakers.items()}
+    report_path = os.path.join(batch_dir, 'batch_report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"\n📊 Отрывков обработано: {report['excerpts_ok']}/{report['excerpts_total']}, "
+          f"ошибок: {report['excerpts_failed']}")
+    print(f"   Точность по корпусу: {report['accuracy']:.2%} ({report['correct_answers']}/{report['total_questions']})")
+    print(f"   Время: {report['wall_seconds']:.1f} с, {report['excerpts_per_minute']:.1f} отрывков/мин")
+    print(f"⏱️ Ожидание лимитеров: Gemini {report['limiter_wait_seconds']:.1f} с, "
+          f"OpenAI {report['openai_limiter_wait_seconds']:.1f} с")
+    print(f"🔁 Повторов: {report['retries']}, backoff {report['backoff_seconds']:.1f} с, "
+          f"пауз предохранителя: {report['breaker_trips']} ({report['breaker_wait_seconds']:.1f} с)")
+    print(f"🧹 Почти-дубликатов вопросов убрано: {report['duplicates_removed']} "
+          f"(столько же запросов ответа сэкономлено)")
+    print(f"♻️ Вердиктов из хранилища: {report['verdicts_reused']}, вычислено заново: {report['verdicts_computed']}")
+    print(f"📁 Отчет сохранен в файл: {report_path}")
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Прогон вопросов, ответов и оценки по корпусу текстов")
+    parser.add_argument('paths', nargs='+', help="файлы .txt или каталоги с ними")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="число процессов")
+    parser.add_argument('--excerpt-words', type=int, default=DEFAULT_EXCERPT_WORDS, help="размер отрывка в словах")
+    parser.add_argument('--max-excerpts', type=int, help="ограничить число отрывков")
+    parser.add_argument('--questions', type=int, default=NUM_QUESTIONS, help="вопросов на отрывок")
+    parser.add_argument('--answer-concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="параллельных запросов ответов внутри процесса")
+    parser.add_argument('--question-workers', type=int, default=1,
+                        help="потоков генерации вопросов внутри процесса (шарды базы знаний)")
+    parser.add_argument('--rpm', type=int, default=DEFAULT_REQUESTS_PER_MINUTE, help="общий лимит запросов в минуту")
+    parser.add_argument('--tpm', type=int, default=DEFAULT_TOKENS_PER_MINUTE, help="общий лимит токенов в минуту")
+    parser.add_argument('--openai-rpm', type=int, default=DEFAULT_OPENAI_REQUESTS_PER_MINUTE,
+                        help="общий лимит запросов Giskard к OpenAI в минуту (вопросы и LLM-судья)")
+    parser.add_argument('--openai-tpm', type=int, default=DEFAULT_OPENAI_TOKENS_PER_MINUTE,
+                        help="общий лимит токенов Giskard к OpenAI в минуту")
+    parser.add_argument('--resume', metavar='BATCH_ID', help="продолжить пакет runs/batch_<BATCH_ID>")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run_batch(
+        args.paths,
+        workers=args.workers,
+        excerpt_words=args.excerpt_words,
+        max_excerpts=args.max_excerpts,
+        num_questions=args.questions,
+        answer_concurrency=args.answer_concurrency,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        batch_id=args.resume,
+        question_workers=args.question_workers,
+        openai_requests_per_minute=args.openai_rpm,
+        openai_tokens_per_minute=args.openai_tpm
+    )
@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import DEFAULT_OVERLAP_TOKENS, DEFAULT_TARGET_TOKENS, chunk_file, chunk_text  # noqa: E402
+from fake_llm import fake_sentence  # noqa: E402
+from rate_limiter import estimate_tokens  # noqa: E402
+
+
+DEFAULT_SIZES_MB = (1, 10, 50)
+MODES = ('file', 'text')
+
+
+def write_novel(path, size_mb, seed=0):
+    # Текст «под роман»: абзацы повествования, диалоги с тире, сокращения и инициалы
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while written < target:
+            if rng.random() < 0.3:
+                paragraph = '\n'.join(
+                    f"— {fake_sentence(rng)[:-1]}? — спросил М. А. Берлиоз. — {fake_sentence(rng)}"
+                    for _ in range(rng.randint(1, 4))
+                )
+            else:
+                sentences = [fake_sentence(rng) for _ in range(rng.randint(3, 9))]
+                sentences[0] = sentences[0][:-1] + ', т. е. в 1930 г. на ул. Садовой.'
+                paragraph = ' '.join(sentences)
+            block = paragraph + '\n\n'
+            f.write(block)
+            written += len(block.encode('utf-8'))
+    return written
+
+
+def consume(fn):
+    count = 0
+    tokens = 0
+    for chunk in fn():
+        count += 1
+        tokens += estimate_tokens(chunk)
+    return count, tokens
+
+
+def measure(fn):
+    # Скорость и пик памяти — отдельными проходами: tracemalloc сам замедляет нарезку примерно вдвое
+    started = time.perf_counter()
+    count, tokens = consume(fn)
+    wall = time.perf_counter() - started
+    tracemalloc.start()
+    consume(fn)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return wall, peak, count, tokens
+
+
+def run(sizes, modes, target_tokens, overlap_tokens):
+    results = []
+    directory = tempfile.mkdtemp(prefix='bench_chunking_')
+    for size_mb in sizes:
+        path = os.path.join(directory, f'novel_{size_mb}mb.txt')
+        size_bytes = write_novel(path, size_mb)
+        for mode in modes:
+            if mode == 'file':
+                # Потоковое чтение: в памяти только блок чтения и текущий фрагмент
+                wall, peak, count, tokens = measure(lambda: chunk_file(path, target_tokens, overlap_tokens))
+            else:
+                with open(path, encoding='utf-8') as f:
+                    text = f.read()
+                wall, peak, count, tokens = measure(lambda: chunk_text(text, target_tokens, overlap_tokens))
+                del text
+            row = {
+                'mode': mode,
+                'size_mb': round(size_bytes / 1024 / 1024, 2),
+                'wall_seconds': round(wall, 3),
+                'mb_per_second': round(size_bytes / 1024 / 1024 / wall, 2) if wall else None,
+                'chunks': count,
+                'mean_chunk_tokens': round(tokens / count, 1) if count else 0,
+                'peak_memory_mb': round(peak / 1024 / 1024, 2)
+            }
+            results.append(row)
+            print_row(row)
+        os.remove(path)
+    return results
+
+
+def print_row(row):
+    print(f"{row['mode']:<5} {row['size_mb']:>8.2f} МБ  {row['wall_seconds']:>8.3f} с  {row['mb_per_second'] or 0:>7.2f} МБ/с  "
+          f"фрагментов {row['chunks']:>7}  ~{row['mean_chunk_tokens']:>6.1f} ток.  пик {row['peak_memory_mb']:>8.2f} МБ")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Пропускная способность нарезки текста на фрагменты")
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES_MB), help="размеры текста в МБ через запятую")
+    parser.add_argument('--modes', default=','.join(MODES), help="file — потоково из файла, text — из строки в памяти")
+    parser.add_argument('--target-tokens', type=int, default=DEFAULT_TARGET_TOKENS, help="бюджет токенов фрагмента")
+    parser.add_argument('--overlap-tokens', type=int, default=DEFAULT_OVERLAP_TOKENS, help="перекрытие соседних фрагментов")
+    parser.add_argument('--output', help="сохранить результаты в JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run(
+        [float(s) for s in args.sizes.split(',') if s.strip()],
+        [m.strip() for m in args.modes.split(',') if m.strip()],
+        args.target_tokens, args.overlap_tokens
+    )
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,92 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LLM_BACKEND', 'fake')
+os.environ.setdefault('LLM_CACHE_PATH', os.path.join(tempfile.mkdtemp(prefix='bench_cache_'), 'llm_cache.sqlite'))
+
+from fake_llm import FakeGenerativeModel, LatencyModel  # noqa: E402
+from hedging import HEDGE_MODES, HedgedModel  # noqa: E402
+from rate_limiter import TokenBucketLimiter  # noqa: E402
+
+
+DEFAULT_BUDGETS = (0.0, 0.05, 0.1)
+
+
+def make_questions(n, seed):
+    # Свой набор вопросов на каждый прогон: детерминированная задержка замены зависит от промпта
+    return [{'question': f"Что произошло в эпизоде {seed}-{i}?", 'answer': f"Эталонный ответ номер {i}."}
+            for i in range(n)]
+
+
+def bench_hedging(n, latency, concurrency, mode, budget, quantile, seed):
+    from gemini_answer_generation import generate_answers
+
+    # Все прогоны идут по одним и тем же промптам и seed: основная модель отвечает с теми же задержками,
+    # и разница p99 объясняется только дубликатами
+    primary = FakeGenerativeModel(latency=latency, seed=seed)
+    fallback = FakeGenerativeModel('models/fake-fallback', latency=latency, seed=seed + 1) if mode == 'fallback' else None
+    model = HedgedModel(primary, fallback, quantile=quantile, budget=budget)
+    limiter = TokenBucketLimiter(10 ** 9, None)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate_answers(model, make_questions(n, seed), "Отрывок.", concurrency=concurrency, limiter=limiter)
+    wall = time.perf_counter() - started
+    stats = model.hedge_stats()
+    provider_calls = primary.stats.calls + (fallback.stats.calls if fallback else 0)
+    return {
+        'mode': mode,
+        'budget': budget,
+        'questions': n,
+        'wall_seconds': round(wall, 3),
+        'provider_calls': provider_calls,
+        'extra_calls': stats['extra_calls'],
+        'extra_call_rate': round(stats['extra_call_rate'], 4),
+        'hedge_wins': stats['hedge_wins'],
+        'latency_p50_ms': stats['latency_p50_ms'],
+        'latency_p99_ms': stats['latency_p99_ms'],
+        'unhedged_p99_ms': stats['unhedged_p99_ms'],
+        'p99_improvement': round(stats['p99_improvement'], 3)
+    }
+
+
+def print_row(row):
+    print(f"{row['mode']:<9} бюджет {row['budget']:>5.0%}  вызовов {row['provider_calls']:>6} "
+          f"(доп. {row['extra_calls']:>4}, {row['extra_call_rate']:>5.1%}; выиграли {row['hedge_wins']:>4})  "
+          f"p50 {row['latency_p50_ms']:>7.1f} мс  p99 {row['latency_p99_ms']:>7.1f} мс "
+          f"против {row['unhedged_p99_ms']:>7.1f} мс ({row['p99_improvement']:.0%})  {row['wall_seconds']:.1f} с")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Хеджирование медленных запросов: p99 и цена в доп. вызовах")
+    parser.add_argument('--questions', type=int, default=1000, help="вопросов на прогон")
+    parser.add_argument('--modes', nargs='+', choices=HEDGE_MODES, default=list(HEDGE_MODES))
+    parser.add_argument('--budgets', nargs='+', type=float, default=list(DEFAULT_BUDGETS),
+                        help="доли доп. вызовов; 0 — прогон без хеджирования для сравнения")
+    parser.add_argument('--quantile', type=float, default=0.95, help="квантиль задержки, после которого идет дубликат")
+    parser.add_argument('--concurrency', type=int, default=16, help="параллельных запросов")
+    parser.add_argument('--median-ms', type=float, default=20.0, help="медиана задержки замены LLM")
+    parser.add_argument('--sigma', type=float, default=1.0, help="sigma логнормальной задержки: чем больше, тем тяжелее хвост")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="сохранить результаты в JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    latency = LatencyModel('lognormal', args.median_ms, args.sigma)
+    results = []
+    for mode in args.modes:
+        for budget in args.budgets:
+            row = bench_hedging(args.questions, latency, args.concurrency, mode, budget, args.quantile, args.seed)
+            results.append(row)
+            print_row(row)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
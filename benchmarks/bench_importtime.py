@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+COMMANDS = ('excerpt', 'questions', 'answer', 'evaluate')
+HEAVY_PACKAGES = ('giskard', 'pandas', 'google.generativeai', 'openai', 'litellm', 'numpy')
+
+
+def parse_importtime(stderr):
+    # Строки `-X importtime`: "import time: self [us] | cumulative | пакет", вложенность — отступом;
+    # общее время — сумма модулей верхнего уровня, для тяжелых пакетов — их cumulative на любой глубине
+    total_us = 0
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|', 2)
+        if not name.startswith('  '):
+            total_us += int(cumulative)
+        name = name.strip()
+        if name in HEAVY_PACKAGES:
+            packages[name] = int(cumulative) / 1000
+    return total_us / 1000, packages
+
+
+def run_command(args, cwd, env):
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=cwd, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} завершилась с кодом {completed.returncode}")
+    import_ms, packages = parse_importtime(completed.stderr)
+    return wall, import_ms, packages
+
+
+def bench_cli(repeat, env):
+    # Каждый повтор — новый запуск: excerpt создает его, остальные команды читают файлы предыдущего этапа
+    samples = {name: [] for name in ('eager',) + COMMANDS}
+    for _ in range(repeat):
+        workdir = tempfile.mkdtemp(prefix='bench_importtime_')
+        # Точка отсчета: то, что раньше платил любой запуск Main.py, — giskard и pandas при импорте модулей этапов
+        samples['eager'].append(run_command(['-c', 'import giskard.rag, pandas'], workdir, env))
+        for command in COMMANDS:
+            samples[command].append(run_command([os.path.join(ROOT, 'cli.py'), command, '--run-id', 'bench'],
+                                                workdir, env))
+    return samples
+
+
+def summarize(name, runs):
+    walls = [wall for wall, _, _ in runs]
+    imports = [import_ms for _, import_ms, _ in runs]
+    packages = runs[-1][2]
+    heavy = {package: round(packages[package], 1) for package in HEAVY_PACKAGES if package in packages}
+    return {
+        'command': name,
+        'wall_seconds': round(statistics.median(walls), 3),
+        'import_ms': round(statistics.median(imports), 1),
+        'heavy_packages_ms': heavy
+    }
+
+
+def print_row(row):
+    heavy = ', '.join(f"{name} {ms:.0f}" for name, ms in row['heavy_packages_ms'].items()) or '-'
+    print(f"{row['command']:<10} процесс {row['wall_seconds']:>7.2f} с  импорт {row['import_ms']:>9.1f} мс  "
+          f"тяжелые пакеты (мс): {heavy}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Время импорта по командам cli.py (python -X importtime)")
+    parser.add_argument('--repeat', type=int, default=3, help="повторов, в отчет идет медиана")
+    parser.add_argument('--output', help="сохранить результаты в JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # Команды идут на локальной замене LLM: ключи и сеть не нужны, а кэши лежат во временном каталоге
+    cache_dir = tempfile.mkdtemp(prefix='bench_importtime_cache_')
+    env = dict(os.environ, PYTHONPATH=ROOT, GSK_DISABLE_ANALYTICS='True')
+    env.setdefault('LLM_BACKEND', 'fake')
+    env.setdefault('FAKE_LLM_MEDIAN_MS', '5')
+    env.setdefault('LLM_CACHE_PATH', os.path.join(cache_dir, 'llm_cache.sqlite'))
+    env.setdefault('EVAL_STORE_PATH', os.path.join(cache_dir, 'evaluations.sqlite'))
+    env.setdefault('EMBEDDING_STORE_DIR', os.path.join(cache_dir, 'embeddings'))
+
+    results = [summarize(name, runs) for name, runs in bench_cli(args.repeat, env).items()]
+    for row in results:
+        print_row(row)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
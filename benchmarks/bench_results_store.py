@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_llm import fake_sentence  # noqa: E402
+
+
+def make_run(run_index, questions, seed):
+    # Синтетический запуск: точность дрейфует от запуска к запуску, задержка — логнормальная
+    rng = random.Random(seed * 1000003 + run_index)
+    accuracy = 0.6 + 0.3 * rng.random()
+    return [{
+        'question_id': i,
+        'question': fake_sentence(rng, 8)[:-1] + '?',
+        'gemini_answer': fake_sentence(rng),
+        'reference_answer': fake_sentence(rng),
+        'correctness': rng.random() < accuracy,
+        'verdict_source': 'local_pass',
+        'score': rng.random(),
+        'latency_ms': round(rng.lognormvariate(6.0, 0.5), 1),
+        'prompt_tokens': rng.randint(200, 2000),
+        'output_tokens': rng.randint(20, 200)
+    } for i in range(questions)]
+
+
+def run_id_for(index):
+    # По 24 запуска в день: даты разделов растут вместе с номером запуска
+    day, hour = divmod(index, 24)
+    return f"2026{1 + day // 28 % 12:02d}{1 + day % 28:02d}_{hour:02d}0000"
+
+
+def phase_write(args):
+    from results_store import ResultsStore
+
+    store = ResultsStore(os.path.join(args.workdir, 'results'))
+    json_dir = os.path.join(args.workdir, 'json')
+    os.makedirs(json_dir, exist_ok=True)
+    parquet_seconds = json_seconds = 0.0
+    for index in range(args.runs):
+        records = make_run(index, args.questions, args.seed)
+        started = time.perf_counter()
+        store.write_run(run_id_for(index), records)
+        parquet_seconds += time.perf_counter() - started
+        if index < args.json_runs:
+            # Как save_evaluation: по JSON-файлу с отступами на запуск
+            started = time.perf_counter()
+            with open(os.path.join(json_dir, f"giskard_evaluation_{run_id_for(index)}.json"), 'w',
+                      encoding='utf-8') as f:
+                json.dump({'evaluation_results': records}, f, ensure_ascii=False, indent=2)
+            json_seconds += time.perf_counter() - started
+    return {'parquet_write_seconds': parquet_seconds, 'json_write_seconds': json_seconds}
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def phase_query(args):
+    from results_store import ResultsStore, _pyarrow
+
+    # Импорт pyarrow и запуск интерпретатора не входят в замер: время и прирост памяти — только запроса
+    _pyarrow()
+    baseline = _peak_rss_mb()
+    started = time.perf_counter()
+    groups = len(ResultsStore(os.path.join(args.workdir, 'results')).trends(by=args.by))
+    return {'groups': groups, 'seconds': time.perf_counter() - started, 'baseline_rss_mb': baseline}
+
+
+def phase_json(args):
+    # Прежний способ: загрузить каждую сводку целиком и посчитать точность и p99 по запуску
+    json_dir = os.path.join(args.workdir, 'json')
+    baseline = _peak_rss_mb()
+    started = time.perf_counter()
+    groups = 0
+    for name in sorted(os.listdir(json_dir)):
+        with open(os.path.join(json_dir, name), 'r', encoding='utf-8') as f:
+            results = json.load(f)['evaluation_results']
+        latencies = sorted(r['latency_ms'] for r in results)
+        _ = (sum(r['correctness'] for r in results) / len(results), latencies[int(0.99 * (len(latencies) - 1))])
+        groups += 1
+    return {'groups': groups, 'seconds': time.perf_counter() - started, 'baseline_rss_mb': baseline}
+
+
+PHASES = {'write': phase_write, 'query': phase_query, 'json': phase_json}
+
+
+def run_phase(phase, args, by='run'):
+    # Каждая фаза — отдельный процесс: пик RSS не смешивается с генерацией данных и другими фазами
+    command = [sys.executable, os.path.abspath(__file__), '--phase', phase, '--workdir', args.workdir,
+               '--runs', str(args.runs), '--questions', str(args.questions), '--json-runs', str(args.json_runs),
+               '--seed', str(args.seed), '--by', by]
+    completed = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def print_row(row):
+    print(f"{row['name']:<22} строк {row['rows']:>9}  {row['seconds']:>7.2f} с  "
+          f"{row['rows_per_second']:>11.0f} строк/с  прирост RSS {row['rss_growth_mb']:>7.1f} МБ")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Хранилище результатов: Parquet-датасет против JSON-сводок")
+    parser.add_argument('--runs', type=int, default=1000, help="число запусков")
+    parser.add_argument('--questions', type=int, default=1000, help="вопросов в запуске")
+    parser.add_argument('--json-runs', type=int, default=50,
+                        help="сколько запусков писать еще и в JSON для сравнения (JSON растет в ~10 раз быстрее)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="каталог данных (по умолчанию — временный)")
+    parser.add_argument('--phase', choices=PHASES, help=argparse.SUPPRESS)
+    parser.add_argument('--by', default='run', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help="сохранить результаты в JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.phase:
+        result = PHASES[args.phase](args)
+        result['peak_rss_mb'] = _peak_rss_mb()
+        print(json.dumps(result))
+        sys.exit(0)
+
+    args.workdir = args.workdir or tempfile.mkdtemp(prefix='bench_results_store_')
+    json_runs = min(args.json_runs, args.runs)
+    rows = args.runs * args.questions
+    json_rows = json_runs * args.questions
+    write = run_phase('write', args)
+    measurements = [
+        ('parquet_write', rows, write['parquet_write_seconds'], None),
+        ('json_write', json_rows, write['json_write_seconds'], None)
+    ]
+    for by in ('run', 'day'):
+        query = run_phase('query', args, by=by)
+        measurements.append((f"parquet_trends_by_{by}", rows, query['seconds'],
+                             query['peak_rss_mb'] - query['baseline_rss_mb']))
+    if json_runs:
+        baseline = run_phase('json', args)
+        measurements.append(('json_load_by_run', json_rows, baseline['seconds'],
+                             baseline['peak_rss_mb'] - baseline['baseline_rss_mb']))
+
+    results = []
+    for name, count, seconds, growth in measurements:
+        row = {'name': name, 'rows': count, 'seconds': round(seconds, 3),
+               'rows_per_second': count / seconds if seconds else 0.0,
+               'rss_growth_mb': round(growth, 1) if growth is not None else 0.0}
+        results.append(row)
+        print_row(row)
+    parquet_mb = directory_size(os.path.join(args.workdir, 'results')) / 1024 / 1024
+    json_mb = directory_size(os.path.join(args.workdir, 'json')) / 1024 / 1024
+    print(f"На диске: Parquet {parquet_mb:.1f} МБ на {rows} строк, JSON {json_mb:.1f} МБ на {json_rows} строк")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'rows': results, 'parquet_mb': parquet_mb, 'json_mb': json_mb}, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,241 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LLM_BACKEND', 'fake')
+os.environ.setdefault('LLM_CACHE_PATH', os.path.join(tempfile.mkdtemp(prefix='bench_cache_'), 'llm_cache.sqlite'))
+os.environ.setdefault('EMBEDDING_STORE_DIR', tempfile.mkdtemp(prefix='bench_embeddings_'))
+
+from fake_llm import FakeEmbedding, FakeGenerativeModel, FakeLLMClient, LatencyModel, fake_sentence  # noqa: E402
+from rate_limiter import TokenBucketLimiter  # noqa: E402
+
+
+DEFAULT_SIZES = (20, 1000, 10000)
+STAGES = ('answers', 'knowledge_base', 'knowledge_base_warm', 'questions', 'evaluation', 'dedup')
+
+
+def make_excerpt(paragraphs, seed=0):
+    import random
+
+    rng = random.Random(seed)
+    return "\n\n".join(' '.join(fake_sentence(rng) for _ in range(6)) for _ in range(paragraphs))
+
+
+def make_questions(n):
+    return [{'question': f"Что произошло в эпизоде {i}?", 'answer': f"Эталонный ответ номер {i} по отрывку."}
+            for i in range(n)]
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn()
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, wall, peak
+
+
+def bench_answers(n, latency, concurrency, batch_size):
+    from gemini_answer_generation import generate_answers
+
+    model = FakeGenerativeModel(latency=latency)
+    questions = make_questions(n)
+    excerpt = make_excerpt(8)
+    limiter = TokenBucketLimiter(10 ** 9, None)
+    _, wall, peak = measure(lambda: generate_answers(
+        model, questions, excerpt, concurrency=concurrency, limiter=limiter, batch_size=batch_size
+    ))
+    return wall, peak, model.stats.summary()
+
+
+def bench_knowledge_base(n, latency, concurrency, batch_size, warm=False):
+    import embedding_store
+    from fake_llm import install_fake_giskard_backends
+    from giskard_question_generation import create_knowledge_base_from_text
+
+    # Отдельное хранилище эмбеддингов на прогон; warm — повторная сборка той же базы из хранилища
+    embedding_store._default_store = embedding_store.EmbeddingStore(tempfile.mkdtemp(prefix='bench_embeddings_'))
+    text = make_excerpt(n)
+
+    def build():
+        knowledge_base = create_knowledge_base_from_text(text)
+        _ = knowledge_base._embeddings
+        return knowledge_base
+
+    if warm:
+        install_fake_giskard_backends(FakeLLMClient(latency=latency), FakeEmbedding(latency=latency))
+        with contextlib.redirect_stdout(io.StringIO()):
+            build()
+    embedding = FakeEmbedding(latency=latency)
+    install_fake_giskard_backends(FakeLLMClient(latency=latency), embedding)
+    _, wall, peak = measure(build)
+    return wall, peak, embedding.stats.summary()
+
+
+def bench_knowledge_base_warm(n, latency, concurrency, batch_size):
+    return bench_knowledge_base(n, latency, concurrency, batch_size, warm=True)
+
+
+_question_runs = itertools.count()
+
+
+def bench_questions(n, latency, concurrency, batch_size):
+    from fake_llm import install_fake_giskard_backends
+    from giskard_question_generation import generate_questions
+
+    # concurrency здесь — число потоков шардированной генерации; 1 — исходный последовательный generate_testset
+    # Свой отрывок на каждый прогон: иначе промпты прогрева совпадут и замер уйдет в кэш LLM
+    client = FakeLLMClient(latency=latency)
+    install_fake_giskard_backends(client, FakeEmbedding())
+    excerpt = make_excerpt(40, seed=next(_question_runs))
+    _, wall, peak = measure(lambda: generate_questions(excerpt, n, workers=concurrency))
+    return wall, peak, client.stats.summary()
+
+
+_evaluation_runs = itertools.count()
+
+
+def bench_evaluation(n, latency, concurrency, batch_size):
+    import random
+
+    import evaluation_store
+    from fake_llm import install_fake_giskard_backends
+    from giskard_evaluation import evaluate_answers
+
+    # Свое хранилище вердиктов и свои вопросы на каждый прогон: иначе замер повторит вердикты прогрева
+    # и меньших размеров из хранилища и кэша LLM вместо вызовов судьи
+    evaluation_store._default_store = evaluation_store.EvaluationStore(
+        os.path.join(tempfile.mkdtemp(prefix='bench_eval_store_'), 'evaluations.sqlite')
+    )
+    client = FakeLLMClient(latency=latency)
+    install_fake_giskard_backends(client, FakeEmbedding())
+    run = next(_evaluation_runs)
+    questions = [dict(qa, question=f"[{run}] {qa['question']}") for qa in make_questions(n)]
+    # Треть ответов совпадает с эталоном, треть частично, треть не по теме: проверяются все уровни оценки
+    rng = random.Random(n)
+    answer_texts = [
+        qa['answer'] if i % 3 == 0 else
+        f"Речь о рукописи, бале и луне, номер {i}." if i % 3 == 1 else fake_sentence(rng)
+        for i, qa in enumerate(questions)
+    ]
+    answers = [{'question': qa['question'], 'gemini_answer': text, 'reference_answer': qa['answer'],
+                'question_id': i} for i, (qa, text) in enumerate(zip(questions, answer_texts))]
+    excerpt = make_excerpt(8)
+
+    workdir = tempfile.mkdtemp(prefix='bench_eval_')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        _, wall, peak = measure(lambda: evaluate_answers(questions, excerpt, answers))
+    finally:
+        os.chdir(cwd)
+    return wall, peak, client.stats.summary()
+
+
+def bench_dedup(n, latency, concurrency, batch_size):
+    import random
+
+    from dedup import QuestionDeduplicator
+    from fake_llm import FAKE_WORDS
+
+    # Словарь шире FAKE_WORDS, как у настоящих вопросов; каждый пятый вопрос — перефразированный повтор
+    rng = random.Random(n)
+    syllables = 'ба ве ги до жу за ки ло му не по ра су те фу ха це чи ша'.split()
+    vocabulary = list(FAKE_WORDS) + [''.join(rng.choice(syllables) for _ in range(3)) for _ in range(3000)]
+    questions = []
+    for i in range(n):
+        if i % 5 == 4:
+            text = questions[rng.randrange(i)]['question'].rstrip('?') + ', верно?'
+        else:
+            text = ' '.join(rng.choice(vocabulary) for _ in range(8)).capitalize() + '?'
+        questions.append({'question': text})
+    deduplicator = QuestionDeduplicator()
+    _, wall, peak = measure(lambda: deduplicator.filter(questions))
+    return wall, peak, {'calls': 0, 'latency_p50_ms': None, 'latency_p99_ms': None,
+                        'prompt_tokens': 0, 'output_tokens': 0}
+
+
+BENCHMARKS = {
+    'answers': bench_answers,
+    'knowledge_base': bench_knowledge_base,
+    'knowledge_base_warm': bench_knowledge_base_warm,
+    'questions': bench_questions,
+    'evaluation': bench_evaluation,
+    'dedup': bench_dedup
+}
+
+
+def run(stages, sizes, latency, concurrency, batch_size):
+    results = []
+    for stage in stages:
+        # Прогрев: ленивые импорты и первые инициализации не должны попадать в замер
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                BENCHMARKS[stage](min(sizes), LatencyModel('constant', 0.0), concurrency, batch_size)
+        except ImportError:
+            pass
+        for n in sizes:
+            row = {'stage': stage, 'size': n}
+            try:
+                wall, peak, calls = BENCHMARKS[stage](n, latency, concurrency, batch_size)
+                row.update({
+                    'wall_seconds': round(wall, 3),
+                    'items_per_second': round(n / wall, 1) if wall else None,
+                    'peak_memory_mb': round(peak / 1024 / 1024, 2),
+                    'calls': calls['calls'],
+                    'latency_p50_ms': calls['latency_p50_ms'],
+                    'latency_p99_ms': calls['latency_p99_ms'],
+                    'prompt_tokens': calls['prompt_tokens'],
+                    'output_tokens': calls['output_tokens']
+                })
+            except ImportError as e:
+                row['skipped'] = f"не установлена зависимость: {e.name}"
+            results.append(row)
+            print_row(row)
+    return results
+
+
+def print_row(row):
+    if 'skipped' in row:
+        print(f"{row['stage']:<15} {row['size']:>6}  пропущено ({row['skipped']})")
+        return
+    p50 = f"{row['latency_p50_ms']:.1f}" if row['latency_p50_ms'] is not None else '-'
+    p99 = f"{row['latency_p99_ms']:.1f}" if row['latency_p99_ms'] is not None else '-'
+    print(f"{row['stage']:<15} {row['size']:>6}  {row['wall_seconds']:>9.3f} с  {row['items_per_second'] or 0:>9.1f}/с  "
+          f"p50 {p50:>7} мс  p99 {p99:>7} мс  вызовов {row['calls']:>6}  пик {row['peak_memory_mb']:>8.2f} МБ")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк этапов на локальной замене LLM (без сети)")
+    parser.add_argument('--stages', default=','.join(STAGES), help="этапы через запятую: " + ', '.join(STAGES))
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES), help="размеры через запятую")
+    parser.add_argument('--latency', default='lognormal', help="constant, uniform, exponential или lognormal")
+    parser.add_argument('--median-ms', type=float, default=20.0, help="медиана задержки вызова, мс")
+    parser.add_argument('--sigma', type=float, default=0.5, help="разброс логнормального распределения")
+    parser.add_argument('--concurrency', type=int, default=16, help="параллельных запросов при генерации ответов")
+    parser.add_argument('--batch-size', type=int, default=1, help="вопросов в одном запросе ответа")
+    parser.add_argument('--output', help="сохранить результаты в JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    latency = LatencyModel(args.latency, args.median_ms, args.sigma)
+    results = run(
+        [s.strip() for s in args.stages.split(',') if s.strip()],
+        [int(s) for s in args.sizes.split(',') if s.strip()],
+        latency, args.concurrency, args.batch_size
+    )
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
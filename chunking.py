@@ -0,0 +1,145 @@
+import io
+import re
+
+from rate_limiter import estimate_tokens
+
+
+DEFAULT_TARGET_TOKENS = 256
+DEFAULT_OVERLAP_TOKENS = 32
+MIN_CHUNKS = 2
+READ_BLOCK_SIZE = 1 << 16
+
+# Сокращения, после точки в которых предложение не заканчивается
+ABBREVIATIONS = frozenset(
+    "т е д п др пр см ср г гг в вв им ул д кв стр рис тыс млн млрд руб коп проф акад доц тов гр св ст"
+    .split()
+)
+
+
+def _abbreviation_lookbehinds():
+    # Сокращения и инициалы («М. А. Булгаков») проверяются в самом регулярном выражении:
+    # по одному lookbehind фиксированной ширины на каждую длину слова, без отдельного прохода по тексту
+    by_length = {}
+    for word in ABBREVIATIONS:
+        by_length.setdefault(len(word), []).append(word)
+    lookbehinds = [r"(?<!\b[A-ZА-ЯЁ]\.)"]
+    for words in by_length.values():
+        lookbehinds.append(r"(?<!\b(?i:%s)\.)" % '|'.join(sorted(words)))
+    return ''.join(lookbehinds)
+
+
+# Конец предложения: знак препинания не после сокращения, закрывающие кавычки или скобки, пробелы и начало
+# следующего предложения (заглавная буква, цифра, открывающая кавычка или тире новой реплики; «— спросил он»
+# после «?» — продолжение той же реплики); пустая строка — граница абзаца
+_BOUNDARY_RE = re.compile(
+    r"((?:[!?…]|\.%s)[.!?…]*)" % _abbreviation_lookbehinds()
+    + r"([\"»”')]*)(\s+)(?=[«\"„(A-ZА-ЯЁ0-9]|[—–-]\s*[«\"„A-ZА-ЯЁ])|\n[ \t]*\n\s*"
+)
+_WORD_RE = re.compile(r"\S+\s*")
+
+
+def _blocks(source, block_size=READ_BLOCK_SIZE):
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    if hasattr(source, 'read'):
+        while True:
+            block = source.read(block_size)
+            if not block:
+                return
+            yield block
+    else:
+        yield from source
+
+
+def iter_sentences(source, block_size=READ_BLOCK_SIZE):
+    # Отдает (предложение, начинается_ли_с_нового_абзаца); в памяти — только текущий блок и хвост предложения
+    buffer = ''
+    new_paragraph = True
+    for block in _blocks(source, block_size):
+        buffer += block
+        start = 0
+        for match in _BOUNDARY_RE.finditer(buffer):
+            if match.group(1) is not None:
+                end = match.end(2)
+                paragraph_break = match.group(3).count('\n') >= 2
+            else:
+                end = match.start()
+                paragraph_break = True
+            sentence = buffer[start:end].strip()
+            if sentence:
+                yield sentence, new_paragraph
+                new_paragraph = paragraph_break
+            elif paragraph_break:
+                new_paragraph = True
+            start = match.end()
+        buffer = buffer[start:]
+    tail = buffer.strip()
+    if tail:
+        yield tail, new_paragraph
+
+
+def _split_long_sentence(sentence, target_tokens):
+    # Предложение длиннее бюджета режется по словам
+    piece = ''
+    for match in _WORD_RE.finditer(sentence):
+        word = match.group(0)
+        if piece and estimate_tokens(piece + word) > target_tokens:
+            yield piece.strip()
+            piece = ''
+        piece += word
+    if piece.strip():
+        yield piece.strip()
+
+
+def _join(parts):
+    text = ''
+    for sentence, new_paragraph, _ in parts:
+        text += ('\n\n' if new_paragraph else ' ') + sentence if text else sentence
+    return text
+
+
+def iter_chunks(source, target_tokens=DEFAULT_TARGET_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS,
+                block_size=READ_BLOCK_SIZE):
+    # Фрагменты по границам предложений в пределах бюджета токенов; следующий фрагмент начинается
+    # с хвостовых предложений предыдущего общим размером не больше overlap_tokens
+    parts = []
+    tokens = 0
+    fresh = 0
+    for sentence, new_paragraph in iter_sentences(source, block_size):
+        size = estimate_tokens(sentence)
+        pieces = [(sentence, size)] if size <= target_tokens else [
+            (piece, estimate_tokens(piece)) for piece in _split_long_sentence(sentence, target_tokens)
+        ]
+        for piece, piece_tokens in pieces:
+            if parts and tokens + piece_tokens > target_tokens:
+                if fresh:
+                    yield _join(parts)
+                overlap = []
+                overlap_size = 0
+                for part in reversed(parts):
+                    if overlap_size + part[2] > overlap_tokens or overlap_size + part[2] + piece_tokens > target_tokens:
+                        break
+                    overlap.insert(0, part)
+                    overlap_size += part[2]
+                parts, tokens, fresh = overlap, overlap_size, 0
+            parts.append((piece, new_paragraph, piece_tokens))
+            tokens += piece_tokens
+            fresh += 1
+            new_paragraph = False
+    if fresh:
+        yield _join(parts)
+
+
+def chunk_text(text, target_tokens=DEFAULT_TARGET_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
+    chunks = list(iter_chunks(text, target_tokens, overlap_tokens))
+    if len(chunks) < MIN_CHUNKS and text and text.strip():
+        # Короткий отрывок: Giskard нужно хотя бы два фрагмента, бюджет уменьшается под размер текста
+        budget = max(1, estimate_tokens(text) // MIN_CHUNKS)
+        chunks = list(iter_chunks(text, budget, 0)) or chunks
+    return chunks
+
+
+def chunk_file(path, target_tokens=DEFAULT_TARGET_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS,
+               encoding='utf-8'):
+    with open(path, encoding=encoding) as f:
+        yield from iter_chunks(f, target_tokens, overlap_tokens)
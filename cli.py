@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import sys
+
+from client_registry import get_client_registry, print_client_stats
+from hedging import HEDGE_MODES
+from instrumentation import get_profiler
+from run_store import RUNS_DIR, RunLog
+
+# Модули этапов импортируются внутри команд: `answer` не тянет giskard и pandas,
+# `excerpt` и `answer` не требуют ключа OpenAI, а `questions` и `evaluate` — ключа Gemini
+
+
+def latest_run_id(base_dir=RUNS_DIR):
+    if not os.path.isdir(base_dir):
+        return None
+    runs = sorted(
+        name for name in os.listdir(base_dir)
+        if os.path.isfile(os.path.join(base_dir, name, 'meta.json'))
+    )
+    return runs[-1] if runs else None
+
+
+def open_run(run_id, create=False):
+    if run_id == 'latest' or (run_id is None and not create):
+        run_id = latest_run_id()
+        if run_id is None:
+            raise FileNotFoundError(f"В {RUNS_DIR} нет ни одного запуска — начните с команды excerpt")
+    run_log = RunLog.resume(run_id) if run_id and not create else RunLog(run_id)
+    print(f"🗂️ Журнал запуска: {run_log.path}")
+    return run_log
+
+
+def require_excerpt(run_log):
+    excerpt = run_log.get_meta('excerpt')
+    if not excerpt:
+        raise RuntimeError(f"В запуске {run_log.run_id} нет отрывка — сначала выполните: python cli.py excerpt")
+    return excerpt
+
+
+def require_records(run_log, stage, command):
+    records = run_log.read(stage)
+    if not records:
+        raise RuntimeError(f"В запуске {run_log.run_id} нет записей этапа {stage} — сначала выполните: "
+                           f"python cli.py {command} --run-id {run_log.run_id}")
+    return records
+
+
+def cmd_excerpt(args, run_log):
+    from giskard_question_generation import load_or_fetch_excerpt
+
+    excerpt = load_or_fetch_excerpt(run_log)
+    if not excerpt:
+        print("❌ Не удалось получить отрывок")
+        return 1
+    print(f"✅ Отрывок сохранен в {run_log.path}/meta.json (длина: {len(excerpt)} символов)")
+    print(f"   Дальше: python cli.py questions --run-id {run_log.run_id}")
+    return 0
+
+
+def cmd_questions(args, run_log):
+    from giskard_question_generation import NUM_QUESTIONS, load_or_generate_questions, save_questions
+
+    excerpt = require_excerpt(run_log)
+    questions = load_or_generate_questions(excerpt, run_log, args.num_questions or NUM_QUESTIONS,
+                                           dedup_threshold=args.dedup_threshold, workers=args.question_workers)
+    if not questions:
+        print("❌ Не удалось сгенерировать вопросы")
+        return 1
+    filename = save_questions(questions, run_log.summary_path('giskard_questions'))
+    print(f"✅ {len(questions)} вопросов сохранено: {filename}")
+    print(f"   Дальше: python cli.py answer --run-id {run_log.run_id}")
+    return 0
+
+
+def cmd_answer(args, run_log):
+    from gemini_answer_generation import DEFAULT_CONCURRENCY, run_answer_generation
+
+    excerpt = require_excerpt(run_log)
+    questions = require_records(run_log, 'questions', 'questions')
+    answers = run_answer_generation(questions, excerpt, concurrency=args.concurrency or DEFAULT_CONCURRENCY,
+                                    batch_size=args.batch_size, run_log=run_log, retrieval_top_k=args.retrieval_top_k,
+                                    hedge=args.hedge)
+    if not answers:
+        print("❌ Не удалось получить ответы")
+        return 1
+    print(f"   Дальше: python cli.py evaluate --run-id {run_log.run_id}")
+    return 0
+
+
+def cmd_evaluate(args, run_log):
+    from giskard_evaluation import run_evaluation
+    from reporting import print_summary
+
+    excerpt = require_excerpt(run_log)
+    questions = require_records(run_log, 'questions', 'questions')
+    answers_by_id = {a['question_id']: a for a in require_records(run_log, 'answers', 'answer')}
+    missing = len(questions) - len(answers_by_id)
+    if missing > 0:
+        print(f"⚠️ Без ответа {missing} вопросов — они будут оценены как неверные")
+    model_answers = [answers_by_id.get(i, {'question_id': i, 'gemini_answer': ''}) for i in range(len(questions))]
+    results = run_evaluation(questions, excerpt, model_answers, run_log=run_log)
+    if not results:
+        print("❌ Не удалось оценить ответы")
+        return 1
+    print_summary(results, len(answers_by_id))
+    return 0
+
+
+def cmd_trends(args, run_log=None):
+    from results_store import ResultsStore, print_trends
+
+    store = ResultsStore(args.store_dir)
+    if args.backfill:
+        print(f"🗃️ Перенесено запусков из {RUNS_DIR}: {store.backfill()}")
+    rows = store.trends(by=args.by, since=args.since, until=args.until, last=args.last)
+    print_trends(rows, by=args.by)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+COMMANDS = {
+    'excerpt': cmd_excerpt,
+    'questions': cmd_questions,
+    'answer': cmd_answer,
+    'evaluate': cmd_evaluate,
+    'trends': cmd_trends
+}
+# Какой провайдер прогревать: Gemini отвечает за отрывок и ответы, OpenAI (через Giskard) — за вопросы и судью
+COMMAND_PROVIDERS = {
+    'excerpt': ('gemini',),
+    'questions': ('openai',),
+    'answer': ('gemini',),
+    'evaluate': ('openai',)
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Этапы по отдельности: отрывок → вопросы → ответы → оценка; "
+                    "каждый читает результат предыдущего из runs/<RUN_ID>"
+    )
+    parser.add_argument('--cprofile', action='store_true', help="снимать cProfile этапа в runs/<RUN_ID>/cprofile")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    excerpt = subparsers.add_parser('excerpt', help="получить отрывок через Gemini и начать запуск")
+    excerpt.add_argument('--run-id', help="идентификатор нового запуска (по умолчанию — текущее время)")
+
+    questions = subparsers.add_parser('questions', help="сгенерировать вопросы Giskard по отрывку запуска")
+    answer = subparsers.add_parser('answer', help="ответить на вопросы запуска через Gemini")
+    evaluate = subparsers.add_parser('evaluate', help="оценить ответы запуска")
+    for stage in (questions, answer, evaluate):
+        stage.add_argument('--run-id', default='latest', help="запуск из runs/ (по умолчанию — последний)")
+
+    questions.add_argument('--num-questions', type=int, metavar='N', help="число вопросов (по умолчанию 20)")
+    questions.add_argument('--dedup-threshold', type=float, metavar='J',
+                           help="порог отсева почти-дубликатов вопросов; 1 — не отсеивать")
+    questions.add_argument('--question-workers', type=int, default=1, metavar='N',
+                           help="параллельная генерация вопросов по шардам базы знаний")
+
+    answer.add_argument('--concurrency', type=int, help="параллельных запросов (по умолчанию 4)")
+    answer.add_argument('--batch-size', type=int, default=1, help="вопросов в одном запросе")
+    answer.add_argument('--retrieval-top-k', type=int, metavar='K',
+                        help="передавать в промпт только K наиболее релевантных фрагментов (BM25)")
+    answer.add_argument('--hedge', choices=HEDGE_MODES,
+                        help="дубликат медленного запроса после p95 задержки: той же модели или резервному провайдеру")
+
+    trends = subparsers.add_parser('trends', help="точность и задержка по запускам или дням из хранилища результатов")
+    trends.add_argument('--by', choices=('run', 'day'), default='run', help="группировка (по умолчанию — по запуску)")
+    trends.add_argument('--since', metavar='ГГГГ-ММ-ДД', help="только запуски не раньше этой даты")
+    trends.add_argument('--until', metavar='ГГГГ-ММ-ДД', help="только запуски не позже этой даты")
+    trends.add_argument('--last', type=int, metavar='N', help="только N последних групп")
+    trends.add_argument('--backfill', action='store_true',
+                        help=f"сначала перенести в хранилище оцененные запуски из {RUNS_DIR}/")
+    trends.add_argument('--store-dir', help="каталог хранилища (по умолчанию RESULTS_STORE_DIR или results)")
+    trends.add_argument('--output', help="сохранить строки отчета в JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'trends':
+        # Запрос к хранилищу не относится к запуску и не вызывает LLM
+        try:
+            return cmd_trends(args)
+        except ImportError as e:
+            print(f"❌ {e}")
+            return 1
+    get_client_registry().warm_up(COMMAND_PROVIDERS[args.command])
+    try:
+        run_log = open_run(args.run_id, create=args.command == 'excerpt')
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        return 1
+    profiler = get_profiler()
+    if args.cprofile:
+        profiler.cprofile_dir = os.path.join(run_log.path, 'cprofile')
+
+    try:
+        return COMMANDS[args.command](args, run_log)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        run_log.close()
+        # Профиль каждой команды пишется отдельно, чтобы этапы одного запуска не перезаписывали друг друга
+        if profiler.to_dict()['stages']:
+            from reporting import print_cache_stats, print_retry_stats
+
+            profiler.print_summary()
+            json_path, _ = profiler.write(run_log.path, prefix=f"{args.command}_profile")
+            print(f"📁 Профиль этапа: {json_path}")
+            print_cache_stats()
+            print_retry_stats()
+            print_client_stats()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+import time
+
+
+KEYS_PATH = 'Key.json'
+GEMINI_MODEL = 'gemini-2.5-flash'
+OPENAI_EMBEDDING_MODEL = 'text-embedding-ada-002'
+DEFAULT_POOL_SIZE = 16
+CONNECT_TIMEOUT = 10.0
+REQUEST_TIMEOUT = 120.0
+PROVIDERS = ('gemini', 'openai')
+
+
+def use_fake_backend():
+    return os.environ.get('LLM_BACKEND', 'gemini').lower() == 'fake'
+
+
+class ClientRegistry:
+    # Ключи читаются, а клиенты создаются один раз на процесс: этапы и потоки получают общие экземпляры
+    # и общий пул HTTP-соединений, поэтому TLS-рукопожатие не повторяется в каждом этапе
+    def __init__(self, keys_path=KEYS_PATH, pool_size=None):
+        self.keys_path = keys_path
+        self.pool_size = pool_size or int(os.environ.get('LLM_POOL_SIZE', DEFAULT_POOL_SIZE))
+        self._lock = threading.RLock()
+        self._keys = None
+        self._gemini_model = None
+        self._text_models = {}
+        self._hedged_models = {}
+        self._openai_client = None
+        self._giskard_installed = False
+        self.created = {'keys': 0, 'gemini': 0, 'openai': 0}
+        self.warmup_seconds = {}
+
+    def api_keys(self):
+        with self._lock:
+            if self._keys is None:
+                if use_fake_backend():
+                    self._keys = {'gemini_api_key': None, 'openai_api_key': None}
+                else:
+                    # Переменные окружения перекрывают Key.json, без файла ключи берутся только из них
+                    data = {}
+                    if os.path.exists(self.keys_path):
+                        with open(self.keys_path, 'r', encoding='utf-8') as f:
+                            data = json.load(f)
+                    self._keys = {
+                        'gemini_api_key': os.environ.get('GEMINI_API_KEY') or data.get('gemini_api_key'),
+                        'openai_api_key': os.environ.get('OPENAI_API_KEY') or data.get('openai_api_key')
+                    }
+                self.created['keys'] += 1
+            return self._keys
+
+    def gemini_model(self):
+        with self._lock:
+            if self._gemini_model is None:
+                if use_fake_backend():
+                    from fake_llm import FakeGenerativeModel
+                    self._gemini_model = FakeGenerativeModel.from_env()
+                else:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_keys()['gemini_api_key'])
+                    self._gemini_model = genai.GenerativeModel(GEMINI_MODEL)
+                self.created['gemini'] += 1
+            return self._gemini_model
+
+    def fallback_model(self):
+        # Резерв для хеджирования и переключения при троттлинге: модель OpenAI на общем клиенте
+        # или вторая независимая локальная замена
+        if use_fake_backend():
+            from fake_llm import FakeGenerativeModel, backend_options_from_env
+            options = backend_options_from_env()
+            options['seed'] += 1
+            return FakeGenerativeModel('models/fake-fallback', **options)
+        from hedging import OPENAI_FALLBACK_MODEL, OpenAIChatModel
+        return OpenAIChatModel(self.openai_client(), os.environ.get('HEDGE_FALLBACK_MODEL', OPENAI_FALLBACK_MODEL))
+
+    def hedged_model(self, mode):
+        # Один хеджирующий слой на режим: окно задержек и бюджет общие для всех этапов и потоков
+        with self._lock:
+            model = self._hedged_models.get(mode)
+            if model is None:
+                from hedging import HedgedModel, hedge_options_from_env
+
+                fallback = self.fallback_model() if mode == 'fallback' else None
+                model = HedgedModel(self.gemini_model(), fallback, **hedge_options_from_env())
+                self._hedged_models[mode] = model
+            return model
+
+    def text_model(self, stage=None, use_cache=True, hedge=None):
+        # Обертки кэша и метрик легкие и тоже переиспользуются; профайлер они берут в момент вызова.
+        # Хеджирование стоит под кэшем: дубликаты уходят только на промахи кэша
+        from hedging import hedge_mode_from_env
+
+        hedge = hedge or hedge_mode_from_env()
+        key = (stage, use_cache, hedge)
+        with self._lock:
+            model = self._text_models.get(key)
+            if model is None:
+                from llm_cache import CachedModel, get_default_cache
+
+                model = self.hedged_model(hedge) if hedge else self.gemini_model()
+                if use_cache:
+                    model = CachedModel(model, get_default_cache())
+                if stage:
+                    from instrumentation import InstrumentedModel
+                    model = InstrumentedModel(model, stage)
+                self._text_models[key] = model
+            return model
+
+    def openai_client(self):
+        with self._lock:
+            if self._openai_client is None:
+                import httpx
+                from openai import OpenAI
+
+                http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                    timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+                )
+                # Повторы делает retry_policy: встроенные повторы SDK удвоили бы паузы и число попыток
+                self._openai_client = OpenAI(api_key=self.api_keys()['openai_api_key'], http_client=http_client,
+                                             max_retries=0)
+                self.created['openai'] += 1
+            return self._openai_client
+
+    def install_giskard_clients(self):
+        # LLM-клиент и эмбеддинги Giskard используют один клиент OpenAI вместо двух своих; устанавливаются
+        # один раз, чтобы не снять обертки кэша и метрик, которые этапы надевают поверх
+        with self._lock:
+            if self._giskard_installed:
+                return
+            if use_fake_backend():
+                from fake_llm import install_fake_giskard_backends
+                install_fake_giskard_backends(keep_existing=True)
+            else:
+                from giskard.llm.client import get_default_llm_api, set_default_client
+                from giskard.llm.client.openai import OpenAIClient
+                from giskard.llm.embeddings import set_default_embedding
+                from giskard.llm.embeddings.openai import OpenAIEmbedding
+
+                if get_default_llm_api() == 'openai':
+                    client = self.openai_client()
+                    set_default_client(OpenAIClient(model=os.environ.get('GSK_LLM_MODEL', 'gpt-4'), client=client))
+                    set_default_embedding(OpenAIEmbedding(client=client, model=OPENAI_EMBEDDING_MODEL))
+            self._giskard_installed = True
+
+    def _warm(self, provider):
+        started = time.perf_counter()
+        try:
+            if provider == 'gemini':
+                self.gemini_model()
+                if not use_fake_backend():
+                    import google.generativeai as genai
+                    genai.get_model(f"models/{GEMINI_MODEL}")
+            elif provider == 'openai' and not use_fake_backend():
+                # Бесплатный запрос метаданных открывает соединение и оставляет его в пуле
+                self.openai_client().models.retrieve(os.environ.get('GSK_LLM_MODEL', 'gpt-4'))
+        except Exception as e:
+            print(f"⚠️ Прогрев клиента {provider} не удался: {e}")
+            return
+        with self._lock:
+            self.warmup_seconds[provider] = time.perf_counter() - started
+
+    def warm_up(self, providers=PROVIDERS, wait=False):
+        # Прогрев идет в фоне и перекрывается с импортами и чтением файлов; LLM_WARMUP=0 отключает его
+        if os.environ.get('LLM_WARMUP', '1') == '0':
+            return []
+        threads = [threading.Thread(target=self._warm, args=(provider,), name=f'warmup-{provider}', daemon=True)
+                   for provider in providers]
+        for thread in threads:
+            thread.start()
+        if wait:
+            for thread in threads:
+                thread.join()
+        return threads
+
+    def stats(self):
+        with self._lock:
+            return {
+                'created': dict(self.created),
+                'text_models': len(self._text_models),
+                'hedge': {mode: model.hedge_stats() for mode, model in self._hedged_models.items()},
+                'warmup_seconds': {name: round(seconds, 3) for name, seconds in self.warmup_seconds.items()}
+            }
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_client_registry():
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = ClientRegistry()
+        return _default_registry
+
+
+def _reset_after_fork():
+    # Соединения и блокировки родителя непригодны в дочернем процессе пула: там реестр создается заново
+    global _default_registry, _default_registry_lock
+    _default_registry = None
+    _default_registry_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def print_client_stats():
+    stats = get_client_registry().stats()
+    created = stats['created']
+    warmup = ', '.join(f"{name} {seconds:.2f} с" for name, seconds in stats['warmup_seconds'].items()) or 'нет'
+    print(f"🔌 Клиентов создано: Gemini {created['gemini']}, OpenAI {created['openai']}, "
+          f"чтений ключей {created['keys']}; прогрев: {warmup}")
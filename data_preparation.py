@@ -1,24 +1,17 @@
-import json
-import google.generativeai as genai
+from client_registry import get_client_registry
+from retry_policy import get_default_policy
 
-def load_api_keys():
-    with open('Key.json', 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        return {
-            'gemini_api_key': data.get('gemini_api_key'),
-            'openai_api_key': data.get('openai_api_key')
-        }
-
-def initialize_text_model(api_keys):
-    genai.configure(api_key=api_keys['gemini_api_key'])
-    return genai.GenerativeModel('gemini-2.5-flash')
+def configure_giskard_llm():
+    get_client_registry().install_giskard_clients()
 
 def get_excerpt(model):
     prompt = """Выбери значительный отрывок из романа "Мастер и Маргарита" Михаила Булгакова (примерно 500-800 слов). 
     Отрывок должен быть содержательным и подходящим для создания вопросов. 
     Верни только текст отрывка без дополнительных комментариев."""
     try:
-        response = model.generate_content(prompt)
+        response = get_default_policy().call(
+            model.generate_content, prompt, stage='fetch', label="Получение отрывка"
+        )
         return response.text.strip()
     except Exception as e:
         print(f"Ошибка при получении отрывка: {e}")
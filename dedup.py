@@ -0,0 +1,151 @@
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+# np.trapz в NumPy 2 объявлен устаревшим и заменен на np.trapezoid
+_trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
+
+DEFAULT_THRESHOLD = 0.7
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE_SIZE = 4
+FALSE_POSITIVE_WEIGHT = 0.25
+# Простое число Мерсенна 2^31 - 1: a * x < 2^62 и хэши перестановок считаются в int64 без переполнения
+_PRIME = (1 << 31) - 1
+
+
+def normalize_question(text):
+    text = (text or '').lower().replace('ё', 'е')
+    return ' '.join(re.findall(r"\w+", text))
+
+
+def char_shingles(text, size=DEFAULT_SHINGLE_SIZE):
+    text = normalize_question(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def shingle_hashes(text, size=DEFAULT_SHINGLE_SIZE):
+    # Отсортированные уникальные crc32 шинглов: компактнее множества строк и годятся для точного Jaccard
+    shingles = char_shingles(text, size)
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint32, count=len(shingles))
+    return np.unique(hashes)
+
+
+def jaccard(a, b):
+    if not len(a) and not len(b):
+        return 1.0
+    common = len(np.intersect1d(a, b, assume_unique=True))
+    return common / (len(a) + len(b) - common)
+
+
+def _lsh_bands(threshold, num_perm):
+    # Число корзин b и строк r минимизирует площадь ложных срабатываний ниже порога и пропусков выше него;
+    # пропуски весят больше: ложного кандидата отсеет точный Jaccard, а пропущенный дубликат стоит двух вызовов LLM
+    grid = np.linspace(0.0, 1.0, 201)
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        collision = 1 - (1 - grid ** rows) ** bands
+        false_positive = _trapezoid(np.where(grid < threshold, collision, 0.0), grid)
+        false_negative = _trapezoid(np.where(grid >= threshold, 1 - collision, 0.0), grid)
+        error = FALSE_POSITIVE_WEIGHT * false_positive + (1 - FALSE_POSITIVE_WEIGHT) * false_negative
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class QuestionDeduplicator:
+    # Инкрементальный MinHash/LSH: каждый новый вопрос сравнивается только с кандидатами из своих корзин
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE,
+                 seed=1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _lsh_bands(threshold, num_perm)
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _PRIME, size=num_perm).astype(np.int64)
+        self._b = rng.randint(0, _PRIME, size=num_perm).astype(np.int64)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._hashes = []
+        self.questions = []
+        self._lock = threading.Lock()
+        self.seen = 0
+        self.duplicates = 0
+        self.comparisons = 0
+
+    def signature(self, hashes):
+        if not len(hashes):
+            return np.full(self.num_perm, _PRIME, dtype=np.int64)
+        values = hashes.astype(np.int64) % _PRIME
+        return ((np.outer(self._a, values) + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def add(self, text):
+        # Возвращает номер ранее добавленного похожего вопроса или None, если вопрос новый
+        hashes = shingle_hashes(text, self.shingle_size)
+        signature = self.signature(hashes)
+        band_keys = [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+        with self._lock:
+            self.seen += 1
+            candidates = set()
+            for buckets, key in zip(self._buckets, band_keys):
+                candidates.update(buckets.get(key, ()))
+            for candidate in sorted(candidates):
+                self.comparisons += 1
+                if jaccard(hashes, self._hashes[candidate]) >= self.threshold:
+                    self.duplicates += 1
+                    return candidate
+            index = len(self._hashes)
+            self._hashes.append(hashes)
+            self.questions.append(text)
+            for buckets, key in zip(self._buckets, band_keys):
+                buckets.setdefault(key, []).append(index)
+            return None
+
+    def filter(self, questions):
+        kept = []
+        dropped = []
+        for qa in questions:
+            duplicate_of = self.add(qa['question'])
+            if duplicate_of is None:
+                kept.append(qa)
+            else:
+                dropped.append((qa['question'], self.questions[duplicate_of]))
+        return kept, dropped
+
+    def stats(self):
+        # Каждый выброшенный дубликат экономит вызов ответа и, если F1 не решил сам, вызов судьи
+        return {
+            'threshold': self.threshold,
+            'num_perm': self.num_perm,
+            'bands': self.bands,
+            'rows': self.rows,
+            'seen': self.seen,
+            'duplicates': self.duplicates,
+            'comparisons': self.comparisons,
+            'saved_answer_calls': self.duplicates,
+            'saved_judge_calls_max': self.duplicates
+        }
+
+
+def dedup_threshold_from_env():
+    return float(os.environ.get('QUESTION_DEDUP_THRESHOLD', DEFAULT_THRESHOLD))
+
+
+def make_deduplicator(threshold=None):
+    # Порог 1 и выше отключает фильтр почти-дубликатов
+    threshold = dedup_threshold_from_env() if threshold is None else threshold
+    if threshold >= 1:
+        return None
+    return QuestionDeduplicator(threshold=threshold)
+
+
+def print_dedup_stats(stats, dropped=()):
+    print(f"🧹 Почти-дубликатов вопросов убрано: {stats['duplicates']} из {stats['seen']} (порог {stats['threshold']}); "
+          f"сэкономлено запросов ответа: {stats['saved_answer_calls']}, вызовов судьи: до {stats['saved_judge_calls_max']}")
+    for question, original in dropped[:3]:
+        print(f"   - «{question[:50]}» ≈ «{original[:50]}»")
@@ -0,0 +1,193 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+
+DEFAULT_STORE_DIR = os.path.join('.llm_cache', 'embeddings')
+# SQLite ограничивает число параметров запроса, поэтому ключи читаются пачками
+_LOOKUP_BATCH = 500
+
+
+def make_embedding_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\0{text}".encode('utf-8')).hexdigest()
+
+
+def embedding_model_name(embedding):
+    for attribute in ('model_name', 'model'):
+        value = getattr(embedding, attribute, None)
+        if isinstance(value, str) and value:
+            return value
+    return type(embedding).__name__
+
+
+class EmbeddingStore:
+    # Векторы лежат в append-only файлах float32 (по одному на размерность) и читаются через memmap,
+    # SQLite хранит только ключ -> (файл, строка): в память попадают лишь запрошенные строки
+    def __init__(self, directory=DEFAULT_STORE_DIR):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._memmaps = {}
+
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, 'index.sqlite'), timeout=30,
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "key TEXT PRIMARY KEY, dimension INTEGER NOT NULL, row INTEGER NOT NULL)"
+        )
+
+    def _path(self, dimension):
+        return os.path.join(self.directory, f"vectors_{dimension}.f32")
+
+    def _memmap(self, dimension, needed):
+        # memmap пересоздается, только если файл вырос после последнего открытия (дописал другой процесс)
+        memmap = self._memmaps.get(dimension)
+        if memmap is None or len(memmap) < needed:
+            path = self._path(dimension)
+            count = os.path.getsize(path) // (4 * dimension) if os.path.exists(path) else 0
+            if not count:
+                return None
+            memmap = np.memmap(path, dtype=np.float32, mode='r', shape=(count, dimension))
+            self._memmaps[dimension] = memmap
+        return memmap
+
+    def get_many(self, keys):
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            locations = []
+            for start in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[start:start + _LOOKUP_BATCH]
+                locations.extend(self._conn.execute(
+                    f"SELECT key, dimension, row FROM vectors WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+            by_dimension = {}
+            for key, dimension, row in locations:
+                by_dimension.setdefault(dimension, []).append((key, row))
+            for dimension, entries in by_dimension.items():
+                memmap = self._memmap(dimension, max(row for _, row in entries) + 1)
+                # Строки за концом файла — записи индекса без целого вектора (файл обрезан сбоем): это промах
+                entries = [(key, row) for key, row in entries if memmap is not None and row < len(memmap)]
+                if not entries:
+                    continue
+                vectors = np.asarray(memmap[np.asarray([row for _, row in entries])])
+                for (key, _), vector in zip(entries, vectors):
+                    found[key] = vector
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, keys, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(keys):
+            return
+        dimension = vectors.shape[1]
+        with self._lock:
+            # BEGIN IMMEDIATE — межпроцессная блокировка: номер строки и дозапись в файл идут атомарно
+            self._conn.execute("BEGIN IMMEDIATE")
+            path = self._path(dimension)
+            # Оборванный хвост (сбой посреди записи или откат) отрезается: иначе новые строки легли бы
+            # со сдвигом и индекс указывал бы на чужие байты
+            first_row = os.path.getsize(path) // (4 * dimension) if os.path.exists(path) else 0
+            valid_size = first_row * 4 * dimension
+            self._memmaps.pop(dimension, None)
+            try:
+                # Записи индекса, чьи векторы потеряны вместе с хвостом, указали бы на новые строки
+                self._conn.execute("DELETE FROM vectors WHERE dimension = ? AND row >= ?", (dimension, first_row))
+                with open(path, 'ab') as f:
+                    f.truncate(valid_size)
+                    f.write(vectors.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO vectors (key, dimension, row) VALUES (?, ?, ?)",
+                    [(key, dimension, first_row + i) for i, key in enumerate(keys)]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                if os.path.exists(path):
+                    os.truncate(path, valid_size)
+                raise
+
+    def stats(self):
+        total = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+        size = sum(
+            os.path.getsize(os.path.join(self.directory, name))
+            for name in os.listdir(self.directory) if name.endswith('.f32')
+        )
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+            'size_bytes': size
+        }
+
+    def close(self):
+        with self._lock:
+            self._memmaps.clear()
+            self._conn.close()
+
+
+class CachedEmbedding:
+    # Обертка над эмбеддинг-моделью Giskard: досчитываются только фрагменты, которых нет в хранилище
+    def __init__(self, embedding, store):
+        self._embedding = embedding
+        self.store = store
+        self.model_name = embedding_model_name(embedding)
+
+    def embed(self, texts):
+        if isinstance(texts, str):
+            texts = [texts]
+        keys = [make_embedding_key(self.model_name, text) for text in texts]
+        found = self.store.get_many(keys)
+
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing:
+            text_by_key = dict(zip(keys, texts))
+            computed = np.asarray(self._embedding.embed([text_by_key[key] for key in missing]), dtype=np.float32)
+            self.store.put_many(missing, computed)
+            found.update(zip(missing, computed))
+        return np.stack([found[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._embedding, name)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_embedding_store():
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = EmbeddingStore(os.environ.get('EMBEDDING_STORE_DIR', DEFAULT_STORE_DIR))
+        return _default_store
+
+
+def default_embedding_store_stats():
+    # None, если в этом процессе хранилище не открывалось (например, вопросы восстановлены из журнала)
+    with _default_store_lock:
+        store = _default_store
+    return store.stats() if store is not None else None
+
+
+def cached_default_embedding():
+    from giskard.llm.embeddings import get_default_embedding
+
+    embedding = get_default_embedding()
+    if isinstance(embedding, CachedEmbedding):
+        return embedding
+    return CachedEmbedding(embedding, get_default_embedding_store())
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_STORE_PATH = os.path.join('.llm_cache', 'evaluations.sqlite')
+# SQLite ограничивает число параметров запроса, поэтому ключи читаются пачками
+_LOOKUP_BATCH = 500
+
+
+def make_evaluation_key(question, reference, answer, judge_config):
+    payload = json.dumps(
+        {'question': question, 'reference': reference, 'answer': answer, 'judge': judge_config},
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class EvaluationStore:
+    # Вердикты между запусками: ключ — хэш (вопрос, эталон, ответ, настройки судьи)
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, verdict TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(keys), _LOOKUP_BATCH):
+                batch = keys[start:start + _LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, verdict FROM verdicts WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, verdict in rows:
+                    found[key] = json.loads(verdict)
+        return found
+
+    def put_many(self, entries):
+        now = time.time()
+        rows = [(key, json.dumps(verdict, ensure_ascii=False), now) for key, verdict in entries]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO verdicts (key, verdict, created) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        return {'path': self.path, 'entries': entries}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = EvaluationStore(path=os.environ.get('EVAL_STORE_PATH', DEFAULT_STORE_PATH))
+        return _default_store
@@ -0,0 +1,256 @@
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from rate_limiter import estimate_tokens
+
+
+FAKE_WORDS = (
+    "Маргарита Воланд Мастер Берлиоз Бездомный Коровьев Бегемот Азазелло Пилат Иешуа Москва "
+    "Патриаршие пруды роман рукопись бал луна трамвай Аннушка масло гроза Ершалаим прокуратор"
+).split()
+
+
+class FakeLLMError(Exception):
+    pass
+
+
+class FakeRateLimitError(FakeLLMError):
+    def __init__(self, retry_after):
+        super().__init__(f"429 Resource has been exhausted (e.g. check quota). Please retry in {retry_after:.1f}s.")
+        self.retry_after = retry_after
+
+
+class LatencyModel:
+    # Распределения задержки в миллисекундах: constant, uniform, exponential, lognormal
+    def __init__(self, distribution='lognormal', median_ms=50.0, sigma=0.5, min_ms=0.0, max_ms=None):
+        if distribution not in ('constant', 'uniform', 'exponential', 'lognormal'):
+            raise ValueError(f"Неизвестное распределение задержки: {distribution}")
+        self.distribution = distribution
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+
+    def sample(self, rng):
+        if self.distribution == 'constant':
+            value = self.median_ms
+        elif self.distribution == 'uniform':
+            value = rng.uniform(0, 2 * self.median_ms)
+        elif self.distribution == 'exponential':
+            value = rng.expovariate(math.log(2) / self.median_ms) if self.median_ms > 0 else 0.0
+        else:
+            value = rng.lognormvariate(math.log(self.median_ms), self.sigma) if self.median_ms > 0 else 0.0
+        value = max(self.min_ms, value)
+        if self.max_ms is not None:
+            value = min(self.max_ms, value)
+        return value / 1000.0
+
+
+class CallStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.latencies = []
+
+    def record(self, latency, prompt_tokens=0, output_tokens=0, failure=False, rate_limited=False):
+        with self._lock:
+            self.calls += 1
+            self.failures += int(failure)
+            self.rate_limited += int(rate_limited)
+            self.prompt_tokens += prompt_tokens
+            self.output_tokens += output_tokens
+            self.latencies.append(latency)
+
+    def percentile(self, q):
+        with self._lock:
+            values = sorted(self.latencies)
+        if not values:
+            return None
+        index = min(len(values) - 1, max(0, int(math.ceil(q / 100.0 * len(values))) - 1))
+        return values[index]
+
+    def summary(self):
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'rate_limited': self.rate_limited,
+            'prompt_tokens': self.prompt_tokens,
+            'output_tokens': self.output_tokens,
+            'latency_p50_ms': round(self.percentile(50) * 1000, 3) if self.latencies else None,
+            'latency_p99_ms': round(self.percentile(99) * 1000, 3) if self.latencies else None
+        }
+
+
+class _FakeBackend:
+    def __init__(self, latency=None, failure_rate=0.0, rate_limit_rate=0.0, retry_after=1.0, seed=0,
+                 sleep=True):
+        self.latency = latency or LatencyModel()
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.sleep = sleep
+        self.stats = CallStats()
+        self._attempts = {}
+        self._attempts_lock = threading.Lock()
+
+    def _rng(self, prompt):
+        # Детерминизм при любом порядке потоков: RNG зависит только от seed, промпта и номера попытки
+        with self._attempts_lock:
+            attempt = self._attempts.get(prompt, 0)
+            self._attempts[prompt] = attempt + 1
+        digest = hashlib.sha256(f"{self.seed}:{attempt}:{prompt}".encode('utf-8')).digest()
+        return random.Random(int.from_bytes(digest[:8], 'big'))
+
+    def _call(self, prompt, make_text):
+        rng = self._rng(prompt)
+        latency = self.latency.sample(rng)
+        prompt_tokens = estimate_tokens(prompt)
+        if self.sleep and latency:
+            time.sleep(latency)
+
+        roll = rng.random()
+        if roll < self.rate_limit_rate:
+            self.stats.record(latency, prompt_tokens, rate_limited=True)
+            raise FakeRateLimitError(self.retry_after)
+        if roll < self.rate_limit_rate + self.failure_rate:
+            self.stats.record(latency, prompt_tokens, failure=True)
+            raise FakeLLMError("500 Internal error encountered.")
+
+        text = make_text(prompt, rng)
+        output_tokens = estimate_tokens(text)
+        self.stats.record(latency, prompt_tokens, output_tokens)
+        return text, prompt_tokens, output_tokens
+
+
+def backend_options_from_env():
+    latency = LatencyModel(
+        distribution=os.environ.get('FAKE_LLM_LATENCY', 'lognormal'),
+        median_ms=float(os.environ.get('FAKE_LLM_MEDIAN_MS', 50)),
+        sigma=float(os.environ.get('FAKE_LLM_SIGMA', 0.5))
+    )
+    return {
+        'latency': latency,
+        'failure_rate': float(os.environ.get('FAKE_LLM_FAILURE_RATE', 0)),
+        'rate_limit_rate': float(os.environ.get('FAKE_LLM_RATE_LIMIT_RATE', 0)),
+        'retry_after': float(os.environ.get('FAKE_LLM_RETRY_AFTER', 1.0)),
+        'seed': int(os.environ.get('FAKE_LLM_SEED', 0))
+    }
+
+
+def fake_sentence(rng, words=12):
+    return ' '.join(rng.choice(FAKE_WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def _fake_gemini_text(prompt, rng):
+    batch_ids = re.findall(r"^\[(\d+)\]", prompt, re.MULTILINE)
+    if batch_ids:
+        return json.dumps({qid: fake_sentence(rng) for qid in batch_ids}, ensure_ascii=False)
+    if "Выбери значительный отрывок" in prompt:
+        return "\n\n".join(' '.join(fake_sentence(rng) for _ in range(8)) for _ in range(6))
+    return f"{fake_sentence(rng)} {fake_sentence(rng, 8)}"
+
+
+class FakeGenerativeModel:
+    # Локальная замена genai.GenerativeModel с тем же generate_content
+    def __init__(self, model_name='models/fake-gemini', **backend_options):
+        self.model_name = model_name
+        self._backend = _FakeBackend(**backend_options)
+
+    @property
+    def stats(self):
+        return self._backend.stats
+
+    def generate_content(self, contents, **kwargs):
+        text, prompt_tokens, output_tokens = self._backend._call(str(contents), _fake_gemini_text)
+        usage = SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    @classmethod
+    def from_env(cls):
+        return cls(**backend_options_from_env())
+
+
+def _fake_giskard_text(prompt, rng):
+    if 'correctness' in prompt:
+        return json.dumps({'correctness': rng.random() < 0.8, 'correctness_reason': ''})
+    return json.dumps({'question': fake_sentence(rng, 8)[:-1] + '?', 'answer': fake_sentence(rng)},
+                      ensure_ascii=False)
+
+
+class FakeLLMClient:
+    # Замена LLM-клиента Giskard (интерфейс complete) для генерации вопросов и LLM-судьи
+    def __init__(self, model='fake-gpt', **backend_options):
+        self.model = model
+        self._backend = _FakeBackend(**backend_options)
+
+    @property
+    def stats(self):
+        return self._backend.stats
+
+    def complete(self, messages, temperature=1, max_tokens=None, caller_id=None, seed=None, format=None):
+        from giskard.llm.client import ChatMessage
+
+        prompt = "\n".join(f"{m.role}: {m.content}" for m in messages)
+        text, _, _ = self._backend._call(prompt, _fake_giskard_text)
+        return ChatMessage(role='assistant', content=text)
+
+    @classmethod
+    def from_env(cls):
+        return cls(**backend_options_from_env())
+
+
+class FakeEmbedding:
+    # Детерминированные псевдо-эмбеддинги по хэшу текста, без сети
+    def __init__(self, dimension=256, **backend_options):
+        self.model = f'fake-embedding-{dimension}'
+        self.dimension = dimension
+        backend_options.setdefault('latency', LatencyModel('constant', 0.0))
+        self._backend = _FakeBackend(**backend_options)
+
+    @property
+    def stats(self):
+        return self._backend.stats
+
+    def embed(self, texts):
+        import numpy as np
+
+        if isinstance(texts, str):
+            texts = [texts]
+        self._backend._call("\n".join(texts), lambda prompt, rng: '')
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+            vectors[i] = np.random.default_rng(seed).standard_normal(self.dimension)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+
+_installed_backends = None
+
+
+def install_fake_giskard_backends(llm_client=None, embedding=None, keep_existing=False):
+    # keep_existing: не подменять уже установленные заглушки (их статистику читают бенчмарки)
+    global _installed_backends
+    from giskard.llm.client import set_default_client
+    from giskard.llm.embeddings import set_default_embedding
+
+    if keep_existing and _installed_backends is not None and llm_client is None and embedding is None:
+        return _installed_backends
+    llm_client = llm_client or FakeLLMClient.from_env()
+    embedding = embedding or FakeEmbedding()
+    set_default_client(llm_client)
+    set_default_embedding(embedding)
+    _installed_backends = (llm_client, embedding)
+    return _installed_backends
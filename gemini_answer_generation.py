@@ -1,20 +1,32 @@
 import json
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from data_preparation import load_api_keys, initialize_text_model
+from client_registry import get_client_registry
+from instrumentation import get_profiler
+from rate_limiter import TokenBucketLimiter, estimate_tokens
+from retrieval import DEFAULT_TOP_K
+from retry_policy import get_default_policy
 
 
-def generate_answers(model, questions, excerpt):
-    print("=" * 60)
-    print("ГЕНЕРАЦИЯ ОТВЕТОВ")
-    print("=" * 60)
-    
-    answers = []
-    for i, qa in enumerate(questions):
-        question = qa['question']
-        print(f"Обработка вопроса {i+1}/{len(questions)}: {question[:50]}...")
-        
-        prompt = f"""Ответь на вопрос на основе следующего отрывка из "Мастера и Маргарита":
+DEFAULT_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_MINUTE = 30
+DEFAULT_TOKENS_PER_MINUTE = 250000
+STAGE = 'answers'
+
+ANSWER_ERROR = "Ошибка получения ответа"
+ANSWER_USAGE_FIELDS = ('latency_ms', 'prompt_tokens', 'output_tokens')
+
+LOW_QUALITY_INDICATORS = [
+    "не могу ответить", "нет информации", "нужно больше контекста",
+    "не предоставлен", "нет данных", "не знаю", "отсутствует",
+    "невозможно определить", "не указано", "не упоминается"
+]
+
+
+def build_answer_prompt(question, excerpt):
+    return f"""Ответь на вопрос на основе следующего отрывка из "Мастера и Маргарита":
 
 ОТРЫВОК:
 {excerpt}
@@ -28,63 +40,303 @@ def generate_answers(model, questions, excerpt):
 - Не добавляй информацию, которой нет в отрывке
 - Максимум 2-3 предложения в ответе"""
 
-        max_retries = 3
-        for attempt in range(max_retries):
+
+def normalize_answer(answer):
+    if answer and len(answer) > 10:
+        is_low_quality = any(indicator in answer.lower() for indicator in LOW_QUALITY_INDICATORS)
+        if not is_low_quality:
+            return answer
+    return "Недостаточно информации в отрывке для ответа"
+
+
+def _response_token_usage(response):
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return None
+    return (getattr(usage, 'prompt_token_count', 0) or 0) + (getattr(usage, 'candidates_token_count', 0) or 0)
+
+
+def _call_usage(response, latency):
+    usage = getattr(response, 'usage_metadata', None)
+    return {
+        'latency_ms': round(latency * 1000, 1),
+        'prompt_tokens': getattr(usage, 'prompt_token_count', 0) or 0,
+        'output_tokens': getattr(usage, 'candidates_token_count', 0) or 0
+    }
+
+
+def _call_model(model, prompt, limiter, label, expected_output_tokens=200):
+    # Возвращает текст и задержку с токенами успешной попытки; при ошибке — (None, None)
+    estimated_tokens = estimate_tokens(prompt) + expected_output_tokens
+    profiler = get_profiler()
+
+    def attempt():
+        # Каждая попытка, включая повторные, проходит через лимитер
+        profiler.record_limiter_wait(STAGE, limiter.acquire(estimated_tokens))
+        started = time.perf_counter()
+        response = model.generate_content(prompt)
+        latency = time.perf_counter() - started
+        text = response.text.strip()
+
+        used_tokens = _response_token_usage(response)
+        if used_tokens:
+            limiter.adjust(used_tokens - estimated_tokens)
+        return text, _call_usage(response, latency)
+
+    try:
+        return get_default_policy().call(attempt, stage=STAGE, label=label)
+    except Exception as e:
+        print(f"{label}: Ошибка при запросе к Gemini: {e}")
+        return None, None
+
+
+def _answer_record(qa, question_id, answer, usage=None):
+    record = {
+        'question': qa['question'],
+        'gemini_answer': answer,
+        'reference_answer': qa.get('answer', ''),
+        'question_id': question_id
+    }
+    if usage:
+        record.update(usage)
+    return record
+
+
+def _context_for(questions, excerpt, retriever, top_k):
+    if retriever is None:
+        return excerpt
+    return retriever.context(questions, top_k)
+
+
+def answer_question(model, qa, question_id, excerpt, limiter, retriever=None, top_k=DEFAULT_TOP_K):
+    prompt = build_answer_prompt(qa['question'], _context_for(qa['question'], excerpt, retriever, top_k))
+    answer, usage = _call_model(model, prompt, limiter, f"Вопрос {question_id + 1}")
+    if answer is None:
+        return _answer_record(qa, question_id, ANSWER_ERROR)
+
+    print(f"✅ Ответ на вопрос {question_id + 1} получен: {answer[:50]}...")
+    return _answer_record(qa, question_id, normalize_answer(answer), usage)
+
+
+def build_batch_prompt(batch, excerpt):
+    questions_block = "\n".join(f"[{question_id}] {qa['question']}" for question_id, qa in batch)
+    example = ", ".join(f'"{question_id}": "..."' for question_id, _ in batch[:2])
+    return f"""Ответь на вопросы на основе следующего отрывка из "Мастера и Маргарита":
+
+ОТРЫВОК:
+{excerpt}
+
+ВОПРОСЫ:
+{questions_block}
+
+ИНСТРУКЦИИ:
+- Отвечай ТОЛЬКО на основе предоставленного отрывка
+- Если в отрывке нет информации для ответа, так и скажи
+- Дай краткий и точный ответ на каждый вопрос
+- Не добавляй информацию, которой нет в отрывке
+- Максимум 2-3 предложения в каждом ответе
+
+ФОРМАТ ОТВЕТА:
+Верни только JSON-объект без комментариев, где ключ - номер вопроса в квадратных скобках (строкой), а значение - ответ.
+Пример: {{{example}}}"""
+
+
+def _extract_json(text):
+    text = text.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)\s*```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    try:
+        return json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        pass
+    brackets = sorted((('{', '}'), ('[', ']')), key=lambda pair: (text.find(pair[0]) == -1, text.find(pair[0])))
+    for open_char, close_char in brackets:
+        start, end = text.find(open_char), text.rfind(close_char)
+        if start != -1 and end > start:
             try:
-                response = model.generate_content(prompt)
-                answer = response.text.strip()
-
-                if answer and len(answer) > 10:
-                    low_quality_indicators = [
-                        "не могу ответить", "нет информации", "нужно больше контекста",
-                        "не предоставлен", "нет данных", "не знаю", "отсутствует",
-                        "невозможно определить", "не указано", "не упоминается"
-                    ]
-                    is_low_quality = any(indicator in answer.lower() for indicator in low_quality_indicators)
-
-                    if not is_low_quality:
-                        answers.append({
-                            'question': question,
-                            'gemini_answer': answer,
-                            'reference_answer': qa.get('answer', ''),
-                            'question_id': i
-                        })
-                    else:
-                        answers.append({
-                            'question': question,
-                            'gemini_answer': "Недостаточно информации в отрывке для ответа",
-                            'reference_answer': qa.get('answer', ''),
-                            'question_id': i
-                        })
-                else:
-                    answers.append({
-                        'question': question,
-                        'gemini_answer': "Недостаточно информации в отрывке для ответа",
-                        'reference_answer': qa.get('answer', ''),
-                        'question_id': i
-                    })
-                
-                print(f"✅ Ответ получен: {answer[:50]}...")
-                time.sleep(2)
-                break
-                
-            except Exception as e:
-                print(f"Попытка {attempt + 1}/{max_retries}: Ошибка при запросе к Gemini: {e}")
-                if "429" in str(e) or "quota" in str(e).lower():
-                    wait_time = (attempt + 1) * 30
-                    print(f"Превышена квота API. Ожидание {wait_time} секунд...")
-                    time.sleep(wait_time)
-                else:
-                    if attempt == max_retries - 1:
-                        answers.append({
-                            'question': question,
-                            'gemini_answer': "Ошибка получения ответа",
-                            'reference_answer': qa.get('answer', ''),
-                            'question_id': i
-                        })
-                    break
-    
+                return json.loads(text[start:end + 1], strict=False)
+            except json.JSONDecodeError:
+                continue
+    return None
+
+
+def _parse_question_id(value):
+    match = re.search(r"\d+", str(value))
+    return int(match.group()) if match else None
+
+
+def parse_batch_response(text, expected_ids):
+    data = _extract_json(text or "")
+    if isinstance(data, dict) and isinstance(data.get('answers'), (list, dict)):
+        data = data['answers']
+
+    items = []
+    if isinstance(data, dict):
+        items = list(data.items())
+    elif isinstance(data, list):
+        for item in data:
+            if isinstance(item, dict):
+                key = item.get('question_id', item.get('id'))
+                items.append((key, item.get('answer')))
+
+    expected_ids = set(expected_ids)
+    parsed = {}
+    for key, value in items:
+        if isinstance(value, dict):
+            value = value.get('answer')
+        question_id = _parse_question_id(key)
+        if question_id in expected_ids and isinstance(value, str) and value.strip():
+            parsed[question_id] = value.strip()
+    return parsed
+
+
+def _single_context_tokens(excerpt, retriever, top_k):
+    if retriever is None:
+        return estimate_tokens(excerpt)
+    if not retriever.chunks:
+        return 0
+    average = sum(estimate_tokens(chunk) for chunk in retriever.chunks) / len(retriever.chunks)
+    return int(average * min(top_k, len(retriever.chunks)))
+
+
+def answer_batch(model, batch, excerpt, limiter, retriever=None, top_k=DEFAULT_TOP_K):
+    context = _context_for([qa['question'] for _, qa in batch], excerpt, retriever, top_k)
+    prompt = build_batch_prompt(batch, context)
+    first_id, last_id = batch[0][0], batch[-1][0]
+    label = f"Пакет вопросов {first_id + 1}-{last_id + 1}"
+    text, usage = _call_model(model, prompt, limiter, label, expected_output_tokens=150 * len(batch))
+    parsed = parse_batch_response(text, [question_id for question_id, _ in batch]) if text else {}
+    if usage:
+        # Задержка пакета общая для его вопросов, токены делятся поровну
+        usage = dict(usage, prompt_tokens=usage['prompt_tokens'] // len(batch),
+                     output_tokens=usage['output_tokens'] // len(batch))
+
+    records = []
+    missing = []
+    for question_id, qa in batch:
+        if question_id in parsed:
+            records.append(_answer_record(qa, question_id, normalize_answer(parsed[question_id]), usage))
+        else:
+            missing.append((question_id, qa))
+
+    # Резервный путь: вопросы, на которые пакет не дал разбираемого ответа, задаем по одному
+    for question_id, qa in missing:
+        records.append(answer_question(model, qa, question_id, excerpt, limiter, retriever, top_k))
+
+    # Контекст одиночного запроса оценивается по размеру фрагментов, а не повторным поиском BM25 на каждый вопрос
+    context_tokens = _single_context_tokens(excerpt, retriever, top_k)
+
+    def single_prompt_tokens(items):
+        return sum(estimate_tokens(build_answer_prompt(qa['question'], '')) + context_tokens for _, qa in items)
+
+    single_tokens = single_prompt_tokens(batch)
+    fallback_tokens = single_prompt_tokens(missing)
+    stats = {
+        'questions': [question_id for question_id, _ in batch],
+        'answered_in_batch': len(batch) - len(missing),
+        'fallback_questions': len(missing),
+        'tokens_saved': single_tokens - estimate_tokens(prompt) - fallback_tokens
+    }
+    print(f"✅ {label}: {stats['answered_in_batch']}/{len(batch)} ответов из пакета, "
+          f"сэкономлено ~{stats['tokens_saved']} входных токенов")
+    return records, stats
+
+
+def generate_answers(model, questions, excerpt, concurrency=DEFAULT_CONCURRENCY, limiter=None,
+                     batch_size=1, report=None, run_log=None, retrieval_top_k=None):
+    with get_profiler().stage(STAGE):
+        return _generate_answers(model, questions, excerpt, concurrency, limiter, batch_size, report, run_log,
+                                 retrieval_top_k)
+
+
+def _generate_answers(model, questions, excerpt, concurrency, limiter, batch_size, report, run_log,
+                      retrieval_top_k):
+    print("=" * 60)
+    print("ГЕНЕРАЦИЯ ОТВЕТОВ")
+    print("=" * 60)
+
+    if limiter is None:
+        limiter = TokenBucketLimiter(DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE)
+    # Дубликаты хеджирования тоже расходуют квоту: модель берет ее из того же лимитера
+    set_limiter = getattr(model, 'set_limiter', None)
+    if set_limiter is not None:
+        set_limiter(limiter)
+
+    concurrency = max(1, min(concurrency, len(questions) or 1))
+    print(f"Параллельных запросов: {concurrency}, лимит: {limiter.requests_per_minute} RPM / "
+          f"{limiter.tokens_per_minute or '∞'} TPM")
+
+    retriever = None
+    if retrieval_top_k:
+        from chunking import chunk_text
+        from retrieval import BM25Index
+
+        retriever = BM25Index(chunk_text(excerpt))
+        print(f"🔎 Индекс BM25 по {len(retriever.chunks)} фрагментам построен за "
+              f"{retriever.build_seconds * 1000:.1f} мс, в промпт идут top-{retrieval_top_k} фрагментов")
+
+    answers = []
+    if run_log is not None:
+        answers = [a for a in run_log.read('answers') if a['gemini_answer'] != ANSWER_ERROR]
+        if answers:
+            print(f"♻️ {len(answers)} ответов восстановлено из запуска {run_log.run_id}")
+    done_ids = {a['question_id'] for a in answers}
+    pending = [(i, qa) for i, qa in enumerate(questions) if i not in done_ids]
+
+    def collect(record):
+        answers.append(record)
+        if run_log is not None:
+            run_log.append('answers', record)
+
+    batch_stats = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if batch_size > 1:
+            batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+            print(f"Пакетный режим: {len(batches)} пакетов по {batch_size} вопросов")
+            futures = [executor.submit(answer_batch, model, batch, excerpt, limiter, retriever, retrieval_top_k)
+                       for batch in batches]
+            for future in as_completed(futures):
+                records, stats = future.result()
+                for record in records:
+                    collect(record)
+                batch_stats.append(stats)
+        else:
+            futures = []
+            for i, qa in pending:
+                print(f"Обработка вопроса {i+1}/{len(questions)}: {qa['question'][:50]}...")
+                futures.append(executor.submit(answer_question, model, qa, i, excerpt, limiter,
+                                               retriever, retrieval_top_k))
+            for future in as_completed(futures):
+                collect(future.result())
+
+    if run_log is not None:
+        run_log.flush()
+    answers.sort(key=lambda a: a['question_id'])
+    batch_stats.sort(key=lambda b: b['questions'][0])
+
     print(f"✅ Успешно сгенерировано {len(answers)} ответов")
+    if batch_stats:
+        print(f"📦 Сэкономлено ~{sum(b['tokens_saved'] for b in batch_stats)} входных токенов, "
+              f"резервных одиночных запросов: {sum(b['fallback_questions'] for b in batch_stats)}")
+    if retriever is not None:
+        retrieval_stats = retriever.stats()
+        print(f"🔎 Поиск фрагментов: {retrieval_stats['queries']} запросов, "
+              f"в среднем {retrieval_stats['query_seconds_avg'] * 1000:.2f} мс")
+    if limiter.total_wait:
+        print(f"⏱️ Ожидание лимитера: {limiter.total_wait:.1f} с")
+    # Статистику отдает хеджирующий слой под кэшем и метриками, если он включен
+    hedge_stats = getattr(model, 'hedge_stats', None)
+    if hedge_stats is not None:
+        from hedging import print_hedge_stats
+        print_hedge_stats(hedge_stats())
+    if report is not None:
+        if hedge_stats is not None:
+            report['hedge'] = hedge_stats()
+        report['batches'] = batch_stats
+        report['limiter_wait_seconds'] = limiter.total_wait
+        if retriever is not None:
+            report['retrieval'] = retriever.stats()
     return answers
 
 
@@ -106,16 +358,20 @@ def save_answers(answers, filename=None):
     return filename
 
 
-def run_answer_generation(questions, excerpt):
+def run_answer_generation(questions, excerpt, concurrency=DEFAULT_CONCURRENCY,
+                          requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                          tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, batch_size=1, run_log=None,
+                          retrieval_top_k=None, hedge=None):
     print("Запуск генерации ответов...")
     
-    api_keys = load_api_keys()
-    model = initialize_text_model(api_keys)
+    model = get_client_registry().text_model(stage=STAGE, hedge=hedge)
+    limiter = TokenBucketLimiter(requests_per_minute, tokens_per_minute)
     
-    answers = generate_answers(model, questions, excerpt)
+    answers = generate_answers(model, questions, excerpt, concurrency=concurrency, limiter=limiter,
+                               batch_size=batch_size, run_log=run_log, retrieval_top_k=retrieval_top_k)
     
     if answers:
-        filename = save_answers(answers)
+        filename = save_answers(answers, run_log.summary_path('answers') if run_log else None)
         print(f"\n✅ Ответы сохранены в файл: {filename}")
         
     
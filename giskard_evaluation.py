@@ -1,121 +1,227 @@
+import hashlib
 import json
-import pandas as pd
-from giskard.rag import QATestset
-from giskard.rag.testset import QuestionSample
-from giskard.rag.testset import test_llm_correctness
 from datetime import datetime
+from data_preparation import configure_giskard_llm
+from evaluation_store import get_default_store
+from gemini_answer_generation import ANSWER_ERROR, ANSWER_USAGE_FIELDS
+from giskard_question_generation import AGENT_DESCRIPTION, PENDING_REFERENCE_ANSWER
+from instrumentation import get_profiler, instrument_giskard_client
+from llm_cache import install_giskard_cache
+from results_store import record_run_results
+from scoring import TieredScorer
 
 
-def evaluate_answers(questions, excerpt, model_answers=None):
+def make_giskard_judge():
+    import giskard
+    from giskard.rag.base import AgentAnswer
+    from giskard.rag.metrics.correctness import CorrectnessMetric
+    from giskard.rag.testset import QuestionSample
+
+    # Судья получает собственного клиента: метрики и повторы пишутся в этап evaluation
+    configure_giskard_llm()
+    install_giskard_cache()
+    llm_client = instrument_giskard_client('evaluation', set_default=False)
+    metric = CorrectnessMetric(name='correctness', llm_client=llm_client, agent_description=AGENT_DESCRIPTION)
+
+    def judge(question, answer, reference):
+        sample = QuestionSample(
+            id='judge', question=question, reference_answer=reference, reference_context='',
+            conversation_history=[], metadata={}
+        )
+        verdict = metric(sample, AgentAnswer(message=answer))
+        return verdict['correctness'], verdict.get('correctness_reason', '')
+
+    # Промпт судьи зашит в версию Giskard, поэтому она входит в ключ хранилища вердиктов
+    judge.config = {
+        'metric': type(metric).__name__,
+        'model': str(getattr(llm_client, 'model', type(llm_client).__name__)),
+        'giskard_version': giskard.__version__,
+        'agent_description': hashlib.sha256(AGENT_DESCRIPTION.encode('utf-8')).hexdigest()[:16]
+    }
+    return judge
+
+
+def build_scorer(**kwargs):
+    try:
+        judge = make_giskard_judge()
+    except Exception as e:
+        print(f"⚠️ LLM-судья Giskard не подключен, неуверенные ответы решаются локально: {e}")
+        judge = None
+    kwargs.setdefault('store', get_default_store())
+    return TieredScorer(judge=judge, **kwargs)
+
+
+def _scoring_item(qa, answer_data):
+    answer = answer_data.get('gemini_answer', '')
+    reference = qa.get('answer', '')
+    return {
+        'question': qa['question'],
+        'answer': '' if answer == ANSWER_ERROR else answer,
+        'reference': reference,
+        'has_reference': bool(reference) and reference != PENDING_REFERENCE_ANSWER
+    }
+
+
+def _evaluation_record(question_id, qa, answer_data, verdict):
+    record = {
+        'question_id': question_id,
+        'question': qa['question'],
+        'gemini_answer': answer_data.get('gemini_answer', ''),
+        'reference_answer': qa.get('answer', ''),
+        'correctness': verdict['correctness'],
+        'correctness_reason': verdict['correctness_reason'],
+        'verdict_source': verdict['verdict_source'],
+        'score': verdict['score'],
+        'max_score': 1.0
+    }
+    # Задержка и токены ответа переносятся в оценку, чтобы хранилище результатов брало все из одной записи
+    record.update({field: answer_data[field] for field in ANSWER_USAGE_FIELDS if field in answer_data})
+    return record
+
+
+def evaluate_answer_batch(items, scorer=None):
+    # items — (question_id, qa, answer_data): один векторный проход F1, неуверенные уходят судье параллельно
+    scorer = scorer or build_scorer()
+    verdicts = scorer.score([_scoring_item(qa, answer_data) for _, qa, answer_data in items])
+    return [_evaluation_record(question_id, qa, answer_data, verdict)
+            for (question_id, qa, answer_data), verdict in zip(items, verdicts)]
+
+
+def is_counted_correct(evaluation_result):
+    return bool(evaluation_result.get('correctness'))
+
+
+def summarize_scoring(evaluation_results):
+    # Сводка по уже записанным вердиктам, включая восстановленные из журнала
+    total = len(evaluation_results)
+    sources = {}
+    for result in evaluation_results:
+        source = result.get('verdict_source', 'unknown')
+        sources[source] = sources.get(source, 0) + 1
+    scores = [result['score'] for result in evaluation_results if 'score' in result]
+    return {
+        'verdict_sources': sources,
+        # Доля вердиктов судьи среди всех, включая взятые из хранилища; judge_call_rate скорера — вызовы этого запуска
+        'judge_verdict_share': sources.get('judge', 0) / total if total else 0.0,
+        'mean_score': sum(scores) / len(scores) if scores else 0.0
+    }
+
+
+def summarize_evaluation(evaluation_results, total_correct, total_questions, questions_evaluated):
+    accuracy = total_correct / total_questions if total_questions > 0 else 0
+
+    automatic_metrics = {
+        'accuracy': accuracy,
+        'correct_answers': total_correct,
+        'total_questions': total_questions,
+        'success_rate': accuracy * 100
+    }
+
+    return {
+        'total_questions': total_questions,
+        'evaluation_timestamp': datetime.now().isoformat(),
+        'questions_evaluated': questions_evaluated,
+        'evaluation_results': evaluation_results,
+        'automatic_metrics': automatic_metrics,
+        'accuracy': accuracy,
+        'success_rate': accuracy * 100,
+        'scoring': summarize_scoring(evaluation_results)
+    }
+
+
+def save_evaluation(results, filename=None):
+    if filename is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"giskard_evaluation_{timestamp}.json"
+
+    evaluation_data = {
+        "evaluator": "Giskard (Автоматические метрики)",
+        "timestamp": datetime.now().isoformat(),
+        "total_questions": results['total_questions'],
+        "questions_evaluated": results['questions_evaluated'],
+        "accuracy": results['accuracy'],
+        "success_rate": results['success_rate'],
+        "automatic_metrics": results['automatic_metrics'],
+        "scoring": results.get('scoring', {}),
+        "evaluation_results": results['evaluation_results']
+    }
+    if 'pipeline_stats' in results:
+        evaluation_data['pipeline_stats'] = results['pipeline_stats']
+
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(evaluation_data, f, ensure_ascii=False, indent=2)
+
+    return filename
+
+
+def evaluate_answers(questions, excerpt, model_answers=None, run_log=None):
+    with get_profiler().stage('evaluation'):
+        return _evaluate_answers(questions, excerpt, model_answers, run_log)
+
+
+def _evaluate_answers(questions, excerpt, model_answers, run_log):
     print("=" * 60)
     print("ОЦЕНКА ОТВЕТОВ GISKARD")
     print("=" * 60)
-    
+
     try:
-        testset_data = []
-        for i, qa in enumerate(questions):
-            agent_answer = None
-            if model_answers and i < len(model_answers):
-                agent_answer = model_answers[i].get('gemini_answer', '')
-            
-            question_obj = QuestionSample(
-                id=f"question_{i}",
-                question=qa['question'],
-                reference_answer=qa.get('answer', ''),
-                reference_context=excerpt[:1000],
-                conversation_history=[],
-                metadata={'source': 'giskard_generation'},
-                agent_answer=agent_answer,
-                correctness=None
-            )
-            testset_data.append(question_obj)
-        
-        testset = QATestset(testset_data)
-        
-        print("🔍 Запуск автоматической оценки с помощью метрик Giskard...")
-        
-        def get_model_answer(question):
-            for answer_data in model_answers:
-                if answer_data.get('question') == question:
-                    return answer_data.get('gemini_answer', '')
-            return ""
-        
-        evaluation_suite = test_llm_correctness(
-            testset=testset,
-            llm_function=get_model_answer,
-            threshold=0.5
-        )
-        
-        evaluation_results = []
-        total_correct = 0
-        total_questions = len(testset_data)
-        
-        for i, qa in enumerate(questions):
-            if model_answers and i < len(model_answers):
-                gemini_answer = model_answers[i].get('gemini_answer', '')
-                reference_answer = qa.get('answer', '')
-                
-                evaluation_result = {
-                    'question_id': i,
-                    'question': qa['question'],
-                    'gemini_answer': gemini_answer,
-                    'reference_answer': reference_answer,
-                    'correctness': True,
-                    'score': 1.0,
-                    'max_score': 1.0
-                }
-                
-                evaluation_results.append(evaluation_result)
-                
-                if gemini_answer and len(gemini_answer) > 20:
-                    total_correct += 1
-        
-        accuracy = total_correct / total_questions if total_questions > 0 else 0
-        avg_score = accuracy * 100
-        
-        automatic_metrics = {
-            'accuracy': accuracy,
-            'correct_answers': total_correct,
-            'total_questions': total_questions,
-            'success_rate': accuracy * 100
-        }
-        
+        answered = [(i, qa) for i, qa in enumerate(questions) if model_answers and i < len(model_answers)]
+        total_questions = len(questions)
+
+        logged = {r['question_id']: r for r in run_log.read('evaluations')} if run_log else {}
+        evaluation_results = {}
+        pending = []
+        for i, qa in answered:
+            previous = logged.get(i)
+            # Старые записи без verdict_source получены до появления настоящей оценки и пересчитываются
+            if (previous and 'verdict_source' in previous
+                    and previous.get('gemini_answer') == model_answers[i].get('gemini_answer', '')):
+                evaluation_results[i] = previous
+            else:
+                pending.append((i, qa))
+        if run_log and evaluation_results:
+            print(f"♻️ {len(evaluation_results)} оценок восстановлено из запуска {run_log.run_id}")
+
+        scorer = build_scorer()
+        print(f"🔍 Локальная оценка token F1 для {len(pending)} ответов, неуверенные "
+              f"({scorer.fail_threshold} < F1 < {scorer.pass_threshold}) уходят LLM-судье...")
+        verdicts = scorer.score([_scoring_item(qa, model_answers[i]) for i, qa in pending])
+        for (i, qa), verdict in zip(pending, verdicts):
+            evaluation_result = _evaluation_record(i, qa, model_answers[i], verdict)
+            evaluation_results[i] = evaluation_result
+            if run_log:
+                run_log.append('evaluations', evaluation_result)
+        if run_log:
+            run_log.flush()
+
+        evaluation_results = [evaluation_results[i] for i in sorted(evaluation_results)]
+        total_correct = sum(1 for r in evaluation_results if is_counted_correct(r))
+
+        results = summarize_evaluation(evaluation_results, total_correct, total_questions, len(evaluation_results))
+        results['scoring'].update(scorer.stats())
+        automatic_metrics = results['automatic_metrics']
+        accuracy = results['accuracy']
+        scoring = results['scoring']
+
         print(f"✅ Автоматическая оценка завершена")
         print(f"📊 Результаты автоматической оценки:")
         print(f"   - Правильных ответов: {total_correct}/{total_questions}")
         print(f"   - Точность: {accuracy:.2%}")
         print(f"   - Процент успеха: {accuracy * 100:.1f}%")
+        print(f"   - Решено локально: {scoring['local_pass']} верных, {scoring['local_fail']} неверных; "
+              f"LLM-судье: {scoring['judged']} ({scoring['judge_call_rate']:.0%} вызовов в этом запуске), "
+              f"доля вердиктов судьи {scoring['judge_verdict_share']:.0%}, средний F1 {scoring['mean_score']:.2f}")
+        print(f"   - Вердиктов из хранилища: {scoring['reused']}, вычислено заново: {scoring['computed']}")
 
-        results = {
-            'total_questions': len(questions),
-            'evaluation_timestamp': datetime.now().isoformat(),
-            'questions_evaluated': len(testset_data),
-            'evaluation_results': evaluation_results,
-            'automatic_metrics': automatic_metrics,
-            'accuracy': accuracy,
-            'success_rate': accuracy * 100
-        }
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        evaluation_filename = f"giskard_evaluation_{timestamp}.json"
-
-        evaluation_data = {
-            "evaluator": "Giskard (Автоматические метрики)",
-            "timestamp": datetime.now().isoformat(),
-            "total_questions": len(questions),
-            "questions_evaluated": len(testset_data),
-            "accuracy": accuracy,
-            "success_rate": accuracy * 100,
-            "automatic_metrics": automatic_metrics,
-            "evaluation_results": evaluation_results
-        }
-
-        with open(evaluation_filename, 'w', encoding='utf-8') as f:
-            json.dump(evaluation_data, f, ensure_ascii=False, indent=2)
+        evaluation_filename = save_evaluation(
+            results, run_log.summary_path('giskard_evaluation') if run_log else None
+        )
 
         print(f"📁 Результаты автоматической оценки сохранены в файл: {evaluation_filename}")
+        if run_log:
+            record_run_results(run_log, evaluation_results)
 
-        print(f"✅ Успешно оценено {len(testset_data)} вопросов")
+        print(f"✅ Успешно оценено {len(evaluation_results)} вопросов")
         print(f"📊 Автоматические результаты:")
         print(f"   - Точность: {accuracy:.2%}")
         print(f"   - Процент успеха: {accuracy * 100:.1f}%")
@@ -128,9 +234,9 @@ def evaluate_answers(questions, excerpt, model_answers=None):
         return {}
 
 
-def run_evaluation(questions, excerpt, model_answers=None):
+def run_evaluation(questions, excerpt, model_answers=None, run_log=None):
     print("Запуск оценки ответов...")
-    return evaluate_answers(questions, excerpt, model_answers)
+    return evaluate_answers(questions, excerpt, model_answers, run_log=run_log)
+
 
 
-    
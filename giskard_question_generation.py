@@ -1,72 +1,108 @@
 import json
-import os
-import pandas as pd
-from giskard.rag import generate_testset, KnowledgeBase
-from giskard.rag.question_generators import (
-    simple_questions,
-    complex_questions,
-    situational_questions,
-    double_questions,
-    conversational_questions,
-    distracting_questions
-)
 from datetime import datetime
+from typing import TYPE_CHECKING
+from chunking import chunk_text
+from data_preparation import configure_giskard_llm
+from dedup import make_deduplicator, print_dedup_stats
+from embedding_store import cached_default_embedding
+from instrumentation import get_profiler, instrument_giskard_client
+from llm_cache import install_giskard_cache
+from question_sharding import iter_sharded_samples
+
+if TYPE_CHECKING:
+    from giskard.rag import KnowledgeBase
+
+# фиксированный seed: одинаковый отрывок дает одинаковые промпты генерации, и повторный запуск берет их из кэша
+KNOWLEDGE_BASE_SEED = 1234
 
-#ручное создание бз ибо гискард криво парсирует вопросы и ответы, вызывая оишбки
-def create_knowledge_base_from_text(text: str) -> KnowledgeBase:
-    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
-    chunks = paragraphs if len(paragraphs) >= 3 else []
-
-    if not chunks:
-        words = text.split()
-        chunk_size = 120
-        chunks = [' '.join(words[i:i + chunk_size]).strip() for i in range(0, len(words), chunk_size)]
-        chunks = [c for c in chunks if c]
-
-    if len(chunks) < 2 and text:
-        lines = [l.strip() for l in text.split('\n') if l.strip()]
-        if len(lines) >= 2:
-            mid = len(lines) // 2
-            chunks = [' '.join(lines[:mid]).strip(), ' '.join(lines[mid:]).strip()]
-        else:
-            mid = max(200, len(text) // 2)
-            chunks = [text[:mid].strip(), text[mid:].strip()]
 
+# giskard и pandas импортируются внутри функций: этапы, которым они не нужны (отрывок, ответы), стартуют без них
+def create_knowledge_base_from_text(text: str) -> 'KnowledgeBase':
+    import pandas as pd
+    from giskard.rag import KnowledgeBase
+
+    # Фрагменты по границам предложений в пределах бюджета токенов с перекрытием
+    chunks = chunk_text(text)
     df = pd.DataFrame({
         'id': [f'doc_{i}' for i in range(len(chunks))],
         'content': chunks,
         'source': ['Мастер и Маргарита'] * len(chunks)
     })
-    return KnowledgeBase(df)
+    # Эмбеддинги фрагментов берутся из дискового хранилища: неизменный отрывок не эмбеддится повторно
+    return KnowledgeBase(df, seed=KNOWLEDGE_BASE_SEED, embedding_model=cached_default_embedding())
+
 
+NUM_QUESTIONS = 20
+AGENT_DESCRIPTION = "Чат-бот, отвечающий на вопросы по роману 'Мастер и Маргарита' Михаила Булгакова"
+PENDING_REFERENCE_ANSWER = 'Ответ будет сгенерирован позже'
 
-def generate_questions(excerpt):
+
+def question_generators():
+    from giskard.rag.question_generators import complex_questions, simple_questions
+
+    return [simple_questions, complex_questions]
+
+
+def _sample_to_question(sample):
+    q = sample['question'] if isinstance(sample, dict) else getattr(sample, 'question', None)
+    a = sample.get('reference_answer') if isinstance(sample, dict) else getattr(sample, 'reference_answer', None)
+    metadata = sample.get('metadata') if isinstance(sample, dict) else getattr(sample, 'metadata', None)
+    if not q:
+        return None
+    qa = {
+        'question': str(q),
+        'answer': str(a) if a else PENDING_REFERENCE_ANSWER
+    }
+    if isinstance(metadata, dict) and metadata.get('question_type'):
+        qa['question_type'] = metadata['question_type']
+    return qa
+
+
+def _iter_sharded_questions(knowledge_base, num_questions, workers):
+    return iter_sharded_samples(
+        knowledge_base, num_questions, question_generators(), workers=workers, seed=KNOWLEDGE_BASE_SEED,
+        agent_description=AGENT_DESCRIPTION, language='ru'
+    )
+
+
+def generate_questions(excerpt, num_questions=NUM_QUESTIONS, workers=1):
+    with get_profiler().stage('questions'):
+        return _generate_questions(excerpt, num_questions, workers)
+
+
+def _generate_questions(excerpt, num_questions, workers=1):
     print("=" * 60)
     print("ГЕНЕРАЦИЯ ВОПРОСОВ ЧЕРЕЗ GISCARD")
     print("=" * 60)
     print("Создание базы знаний (ручное разбиение и индексация)...")
-    knowledge_base = create_knowledge_base_from_text(excerpt)
-    if hasattr(knowledge_base, 'documents'):
-        print(f"Создано {len(knowledge_base.documents)} фрагментов текста")
-    else:
-        print("База знаний успешно создана.")
-
-    print("\nГенерация тестового набора вопросов...")
     try:
-        if not os.environ.get('OPENAI_API_KEY'):
-            try:
-                from data_preparation import load_api_keys
-                keys = load_api_keys()
-                if keys.get('openai_api_key'):
-                    os.environ['OPENAI_API_KEY'] = keys['openai_api_key']
-            except Exception:
-                pass
+        # Клиент OpenAI создается внутри try: без ключа этап возвращает пустой список, а не падает
+        configure_giskard_llm()
+        install_giskard_cache()
+        instrument_giskard_client('questions')
+        knowledge_base = create_knowledge_base_from_text(excerpt)
+        if hasattr(knowledge_base, 'documents'):
+            print(f"Создано {len(knowledge_base.documents)} фрагментов текста")
+        else:
+            print("База знаний успешно создана.")
+
+        print("\nГенерация тестового набора вопросов...")
+        if workers > 1:
+            # Порядок (генератор, шард, номер) вместо порядка готовности: question_id не зависит от потоков
+            samples = [sample for _, sample in sorted(
+                _iter_sharded_questions(knowledge_base, num_questions, workers), key=lambda item: item[0]
+            )]
+            print(f"Успешно сгенерировано {len(samples)} вопросов")
+            return [qa for qa in map(_sample_to_question, samples) if qa]
+
+        from giskard.rag import generate_testset
+
         testset = generate_testset(
             knowledge_base=knowledge_base,
-            num_questions=20,
+            num_questions=num_questions,
             language='ru',
-            question_generators=[simple_questions, complex_questions],
-            agent_description="Чат-бот, отвечающий на вопросы по роману 'Мастер и Маргарита' Михаила Булгакова"
+            question_generators=question_generators(),
+            agent_description=AGENT_DESCRIPTION
         )
         if hasattr(testset, 'questions'):
             samples = testset.questions
@@ -78,20 +114,48 @@ def generate_questions(excerpt):
         print(f"Успешно сгенерировано {len(samples)} вопросов")
         questions_and_answers = []
         for sample in samples:
-            q = sample['question'] if isinstance(sample, dict) else getattr(sample, 'question', None)
-            a = sample.get('reference_answer') if isinstance(sample, dict) else getattr(sample, 'reference_answer',
-                                                                                        None)
-            if q:
-                questions_and_answers.append({
-                    'question': str(q),
-                    'answer': str(a) if a else 'Ответ будет сгенерирован позже'
-                })
+            qa = _sample_to_question(sample)
+            if qa:
+                questions_and_answers.append(qa)
         return questions_and_answers
     except Exception as e:
         print(f"❌ Ошибка генерации вопросов через Giskard: {e}")
         return []
 
 
+def iter_questions(excerpt, num_questions=NUM_QUESTIONS, workers=1):
+    # Потоковый вариант generate_testset: вопросы отдаются по мере генерации
+    configure_giskard_llm()
+    install_giskard_cache()
+    instrument_giskard_client('questions')
+    knowledge_base = create_knowledge_base_from_text(excerpt)
+    # sample_key — место вопроса в детерминированном потоке генерации: по нему продолжение запуска пропускает
+    # уже записанные вопросы, которые кэш LLM и фиксированный seed отдают заново
+    if workers > 1:
+        for key, sample in _iter_sharded_questions(knowledge_base, num_questions, workers):
+            qa = _sample_to_question(sample)
+            if qa:
+                yield dict(qa, sample_key=':'.join(str(part) for part in key))
+        return
+    _ = knowledge_base.topics
+
+    generators = question_generators()
+    generator_num_questions = [
+        num_questions // len(generators) + (1 if i < num_questions % len(generators) else 0)
+        for i in range(len(generators))
+    ]
+    for generator_index, (generator, n) in enumerate(zip(generators, generator_num_questions)):
+        for position, sample in enumerate(generator.generate_questions(
+            knowledge_base,
+            num_questions=n,
+            agent_description=AGENT_DESCRIPTION,
+            language='ru'
+        )):
+            qa = _sample_to_question(sample)
+            if qa:
+                yield dict(qa, sample_key=f"{generator_index}:{position}")
+
+
 def save_questions(questions, filename=None):
     if filename is None:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -108,38 +172,77 @@ def save_questions(questions, filename=None):
 
 
 # Импорт функций для работы с Gemini только для получения отрывка
-from data_preparation import load_api_keys, initialize_text_model, get_excerpt
+from client_registry import get_client_registry
+from data_preparation import get_excerpt
 
 
 def fetch_excerpt():
     try:
-        api_keys = load_api_keys()
-        model = initialize_text_model(api_keys)
-        excerpt = get_excerpt(model)
+        with get_profiler().stage('fetch'):
+            model = get_client_registry().text_model(stage='fetch')
+            excerpt = get_excerpt(model)
         return excerpt
     except Exception as e:
         print(f"Ошибка при получении отрывка: {e}")
         return None
 
 
-def run_question_generation(return_data=False):
+def load_or_fetch_excerpt(run_log):
+    excerpt = run_log.get_meta('excerpt') if run_log else None
+    if excerpt:
+        print(f"♻️ Отрывок восстановлен из запуска {run_log.run_id}")
+        return excerpt
+    excerpt = fetch_excerpt()
+    if excerpt and run_log:
+        run_log.set_meta('excerpt', excerpt)
+    return excerpt
+
+
+def remove_near_duplicates(questions, threshold=None, run_log=None):
+    # Перефразированные повторы отсеиваются до ответа и оценки: каждый стоил бы вызова Gemini и судьи
+    deduplicator = make_deduplicator(threshold)
+    if deduplicator is None or not questions:
+        return questions
+    kept, dropped = deduplicator.filter(questions)
+    stats = deduplicator.stats()
+    print_dedup_stats(stats, dropped)
+    if run_log:
+        run_log.set_meta('dedup', stats)
+    return kept
+
+
+def load_or_generate_questions(excerpt, run_log, num_questions=NUM_QUESTIONS, dedup_threshold=None, workers=1):
+    if run_log and run_log.get_meta('questions_complete'):
+        questions = run_log.read('questions')
+        print(f"♻️ {len(questions)} вопросов восстановлено из запуска {run_log.run_id}")
+        return questions
+    questions = remove_near_duplicates(generate_questions(excerpt, num_questions, workers), dedup_threshold, run_log)
+    if questions and run_log:
+        for i, qa in enumerate(questions):
+            run_log.append('questions', dict(qa, question_id=i))
+        run_log.flush()
+        run_log.set_meta('questions_complete', True)
+    return questions
+
+
+def run_question_generation(return_data=False, run_log=None, dedup_threshold=None, workers=1):
     print("=" * 60)
     print("ГЕНЕРАЦИЯ ВОПРОСОВ ЧЕРЕЗ GISCARD")
     print("=" * 60)
     print("Получение отрывка из романа...")
-    excerpt = fetch_excerpt()
+    excerpt = load_or_fetch_excerpt(run_log)
     if not excerpt:
         print("ОШИБКА: Не удалось получить отрывок через Gemini")
         return (None, None) if return_data else None
     print(f"✅ Отрывок получен (длина: {len(excerpt)} символов)")
 
     print("\nГенерация вопросов...")
-    questions = generate_questions(excerpt)
+    questions = load_or_generate_questions(excerpt, run_log, dedup_threshold=dedup_threshold, workers=workers)
     if not questions:
         print("ОШИБКА: Не удалось сгенерировать вопросы через Giskard")
         return (None, excerpt) if return_data else None
 
-    filename = save_questions(questions)
+    filename = save_questions(questions, run_log.summary_path('giskard_questions') if run_log else None)
     print(f"\n✅ Вопросы сгенерированы и сохранены в файл: {filename}")
     print("\nПримеры сгенерированных вопросов:")
     print("-" * 40)
@@ -151,5 +254,3 @@ def run_question_generation(return_data=False):
     if return_data:
         return questions, excerpt
     return filename
-
-
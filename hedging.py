@@ -0,0 +1,251 @@
+import collections
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from types import SimpleNamespace
+
+from instrumentation import get_profiler
+from rate_limiter import estimate_tokens, get_llm_client_limiter
+from retry_policy import is_rate_limit_error
+
+
+HEDGE_MODES = ('same', 'fallback')
+DEFAULT_QUANTILE = 0.95
+DEFAULT_BUDGET = 0.1
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_WINDOW = 500
+DEFAULT_MAX_WORKERS = 64
+EXPECTED_OUTPUT_TOKENS = 200
+HEDGE_STAGE = 'hedge'
+OPENAI_FALLBACK_MODEL = 'gpt-4o-mini'
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(math.ceil(q * len(values))) - 1))]
+
+
+class OpenAIChatModel:
+    # Адаптер chat.completions OpenAI к интерфейсу generate_content модели Gemini (text и usage_metadata)
+    def __init__(self, client, model_name=OPENAI_FALLBACK_MODEL):
+        self._client = client
+        self.model_name = model_name
+
+    def generate_content(self, contents, **kwargs):
+        response = self._client.chat.completions.create(
+            model=self.model_name, messages=[{'role': 'user', 'content': str(contents)}]
+        )
+        usage = response.usage
+        return SimpleNamespace(
+            text=response.choices[0].message.content or '',
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=getattr(usage, 'prompt_tokens', 0),
+                candidates_token_count=getattr(usage, 'completion_tokens', 0)
+            )
+        )
+
+
+class HedgedModel:
+    # Если основной вызов не уложился в свой p95, дубликат уходит той же модели или резервному провайдеру;
+    # побеждает первый успешный ответ, второй отменяется (уже начатый HTTP-запрос дорабатывает, его ответ отбрасывается).
+    # Дополнительные вызовы ограничены бюджетом: долей от основных (budget) и абсолютным числом (max_extra_calls)
+    def __init__(self, primary, fallback=None, quantile=DEFAULT_QUANTILE, budget=DEFAULT_BUDGET,
+                 max_extra_calls=None, min_delay=0.0, min_samples=DEFAULT_MIN_SAMPLES, window=DEFAULT_WINDOW,
+                 max_workers=DEFAULT_MAX_WORKERS):
+        self._primary = primary
+        self._backup = fallback or primary
+        self.has_fallback = fallback is not None
+        self.model_name = getattr(primary, 'model_name', type(primary).__name__)
+        self.quantile = quantile
+        self.budget = budget
+        self.max_extra_calls = max_extra_calls
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._window = collections.deque(maxlen=window)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.budget_denied = 0
+        self.limiter_denied = 0
+        self.cancelled = 0
+        self.limiter = None
+        self._latencies = []
+        self._primary_latencies = []
+
+    def hedge_delay(self):
+        # Пока основных ответов меньше min_samples, p95 не оценить и дубликаты не отправляются
+        with self._lock:
+            if len(self._window) < self.min_samples:
+                return None
+            return max(self.min_delay, _percentile(self._window, self.quantile))
+
+    def _take_budget(self):
+        with self._lock:
+            extra = self.hedges + self.failovers
+            if self.max_extra_calls is not None and extra >= self.max_extra_calls:
+                self.budget_denied += 1
+                return False
+            if extra + 1 > self.budget * self.calls:
+                self.budget_denied += 1
+                return False
+            return True
+
+    def set_limiter(self, limiter):
+        # Лимитер этапа ответов: основные вызовы проходят через него в вызывающем коде, доп. вызовы — здесь
+        self.limiter = limiter
+
+    def _take_quota(self, contents):
+        # Дубликат не ждет квоту: если лимитер пуст, он только отнял бы ее у следующих основных вызовов.
+        # Резервный провайдер ограничивается лимитером OpenAI пакетного режима, а вне его — лимитером этапа
+        limiter = self.limiter
+        if self.has_fallback:
+            limiter = get_llm_client_limiter() or self.limiter
+        if limiter is None or limiter.try_acquire(estimate_tokens(str(contents)) + EXPECTED_OUTPUT_TOKENS):
+            return True
+        with self._lock:
+            self.limiter_denied += 1
+        return False
+
+    def _record_extra(self, contents, latency, response=None):
+        # Победителя считает обертка метрик этапа, а дубликат — здесь, в отдельном этапе hedge:
+        # иначе токены второго запроса не попали бы в профиль
+        if response is None:
+            get_profiler().record_call(HEDGE_STAGE, latency, estimate_tokens(str(contents)), error=True)
+            return
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            input_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+            output_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+        else:
+            input_tokens = estimate_tokens(str(contents))
+            output_tokens = estimate_tokens(response.text)
+        get_profiler().record_call(HEDGE_STAGE, latency, input_tokens, output_tokens)
+
+    def _run(self, model, contents, kwargs, primary):
+        started = time.perf_counter()
+        try:
+            response = model.generate_content(contents, **kwargs)
+        except Exception:
+            if not primary:
+                self._record_extra(contents, time.perf_counter() - started)
+            raise
+        latency = time.perf_counter() - started
+        if not primary:
+            self._record_extra(contents, latency, response)
+            return response
+        # Задержку основного вызова пишем, даже если он проиграл: по ней считается p95 и p99 без хеджирования
+        with self._lock:
+            self._window.append(latency)
+            self._primary_latencies.append(latency)
+        return response
+
+    def _finish(self, started, response, hedged_win=False):
+        with self._lock:
+            self._latencies.append(time.perf_counter() - started)
+            self.hedge_wins += int(hedged_win)
+        return response
+
+    def generate_content(self, contents, **kwargs):
+        started = time.perf_counter()
+        with self._lock:
+            self.calls += 1
+        primary = self._executor.submit(self._run, self._primary, contents, kwargs, True)
+        done, _ = wait([primary], timeout=self.hedge_delay())
+
+        if done:
+            error = primary.exception()
+            if error is None:
+                return self._finish(started, primary.result())
+            # Троттлинг основного провайдера: вместо паузы запрос сразу уходит резервному, если он есть
+            if not (self.has_fallback and is_rate_limit_error(error) and self._take_budget()
+                    and self._take_quota(contents)):
+                raise error
+            with self._lock:
+                self.failovers += 1
+            # В сравнение p99 переключения не входят: без них вызов ждал бы паузы повтора, а не ответа
+            return self._backup.generate_content(contents, **kwargs)
+
+        if not (self._take_budget() and self._take_quota(contents)):
+            return self._finish(started, primary.result())
+        with self._lock:
+            self.hedges += 1
+        hedge = self._executor.submit(self._run, self._backup, contents, kwargs, False)
+
+        pending = {primary, hedge}
+        errors = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                    continue
+                for loser in pending:
+                    with self._lock:
+                        self.cancelled += int(loser.cancel())
+                return self._finish(started, future.result(), hedged_win=future is hedge)
+        raise errors[0]
+
+    def hedge_stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            primary_latencies = list(self._primary_latencies)
+            calls, hedges, failovers = self.calls, self.hedges, self.failovers
+            stats = {
+                'calls': calls,
+                'hedges': hedges,
+                'hedge_wins': self.hedge_wins,
+                'failovers': failovers,
+                'cancelled': self.cancelled,
+                'budget_denied': self.budget_denied,
+                'limiter_denied': self.limiter_denied,
+                'extra_calls': hedges + failovers,
+                'extra_call_rate': (hedges + failovers) / calls if calls else 0.0
+            }
+        # p99 «без хеджирования» — по задержкам основных вызовов, которые дорабатывают и при проигрыше
+        p99 = _percentile(latencies, 0.99)
+        p99_unhedged = _percentile(primary_latencies, 0.99)
+        stats.update({
+            'latency_p50_ms': round(_percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+            'latency_p99_ms': round(p99 * 1000, 1) if p99 is not None else None,
+            'unhedged_p99_ms': round(p99_unhedged * 1000, 1) if p99_unhedged is not None else None,
+            'p99_improvement': 1 - p99 / p99_unhedged if p99 and p99_unhedged else 0.0
+        })
+        return stats
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._primary, name)
+
+
+def hedge_mode_from_env():
+    mode = os.environ.get('HEDGE_MODE', '').lower()
+    return mode if mode in HEDGE_MODES else None
+
+
+def hedge_options_from_env():
+    max_extra = os.environ.get('HEDGE_MAX_EXTRA_CALLS')
+    return {
+        'quantile': float(os.environ.get('HEDGE_QUANTILE', DEFAULT_QUANTILE)),
+        'budget': float(os.environ.get('HEDGE_BUDGET', DEFAULT_BUDGET)),
+        'max_extra_calls': int(max_extra) if max_extra else None,
+        'min_delay': float(os.environ.get('HEDGE_MIN_DELAY_MS', 0)) / 1000.0
+    }
+
+
+def print_hedge_stats(stats):
+    if not stats or not stats['calls']:
+        return
+    improvement = f"{stats['p99_improvement']:.0%}" if stats['unhedged_p99_ms'] else '-'
+    print(f"🏁 Хеджирование: дубликатов {stats['hedges']} (выиграли {stats['hedge_wins']}), "
+          f"переключений на резерв {stats['failovers']}, доп. вызовов {stats['extra_calls']} "
+          f"({stats['extra_call_rate']:.1%} от {stats['calls']}), отказано бюджетом {stats['budget_denied']}, "
+          f"лимитером {stats['limiter_denied']}; "
+          f"p99 {stats['latency_p99_ms']} мс против {stats['unhedged_p99_ms']} мс без хеджирования ({improvement})")
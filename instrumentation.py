@@ -0,0 +1,345 @@
+import contextlib
+import cProfile
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from rate_limiter import estimate_tokens
+
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Линейная интерполяция внутри корзины, как histogram_quantile в Prometheus
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                # Верхняя граница не выше наблюдаемого максимума: иначе редкие быстрые вызовы дают p99 по границе корзины
+                upper = min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum_seconds': round(self.sum, 6),
+            'max_seconds': round(self.max, 6),
+            'p50_seconds': round(self.quantile(0.5), 6) if self.count else None,
+            'p95_seconds': round(self.quantile(0.95), 6) if self.count else None,
+            'p99_seconds': round(self.quantile(0.99), 6) if self.count else None,
+            'buckets': {str(b): c for b, c in zip(list(self.buckets) + ['+Inf'], self.counts)}
+        }
+
+
+class StageMetrics:
+    def __init__(self):
+        self.latency = Histogram()
+        self.wall_seconds = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.errors = 0
+        self.retries = 0
+        self.backoff_seconds = 0.0
+        self.limiter_wait_seconds = 0.0
+        self.breaker_wait_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._active = 0
+        self._active_since = None
+
+    def to_dict(self):
+        return {
+            'wall_seconds': round(self.wall_seconds, 6),
+            'calls': self.latency.count,
+            'latency': self.latency.to_dict(),
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'errors': self.errors,
+            'retries': self.retries,
+            'backoff_seconds': round(self.backoff_seconds, 6),
+            'limiter_wait_seconds': round(self.limiter_wait_seconds, 6),
+            'breaker_wait_seconds': round(self.breaker_wait_seconds, 6),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses
+        }
+
+
+class RunProfiler:
+    def __init__(self, cprofile_dir=None):
+        self.cprofile_dir = cprofile_dir
+        self.started_at = datetime.now().isoformat()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def _metrics(self, stage):
+        metrics = self._stages.get(stage)
+        if metrics is None:
+            metrics = self._stages[stage] = StageMetrics()
+        return metrics
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        # Время этапа считается как объединение интервалов: параллельные потоки одного этапа не складываются
+        with self._lock:
+            metrics = self._metrics(name)
+            if metrics._active == 0:
+                metrics._active_since = time.perf_counter()
+            metrics._active += 1
+        profile = None
+        if self.cprofile_dir:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Другой профилировщик уже активен в этом потоке
+                profile = None
+        try:
+            yield metrics
+        finally:
+            if profile is not None:
+                profile.disable()
+                os.makedirs(self.cprofile_dir, exist_ok=True)
+                profile.dump_stats(os.path.join(
+                    self.cprofile_dir, f"{name}_{threading.get_ident()}_{int(time.time() * 1000)}.prof"
+                ))
+            with self._lock:
+                metrics._active -= 1
+                if metrics._active == 0:
+                    metrics.wall_seconds += time.perf_counter() - metrics._active_since
+
+    def record_call(self, stage, latency, input_tokens=0, output_tokens=0, cache_hit=None, error=False):
+        with self._lock:
+            metrics = self._metrics(stage)
+            metrics.latency.observe(latency)
+            metrics.input_tokens += input_tokens
+            metrics.output_tokens += output_tokens
+            if error:
+                metrics.errors += 1
+            if cache_hit is True:
+                metrics.cache_hits += 1
+            elif cache_hit is False:
+                metrics.cache_misses += 1
+
+    def record_retry(self, stage, backoff_seconds):
+        with self._lock:
+            metrics = self._metrics(stage)
+            metrics.retries += 1
+            metrics.backoff_seconds += backoff_seconds
+
+    def record_limiter_wait(self, stage, seconds):
+        if not seconds:
+            return
+        with self._lock:
+            self._metrics(stage).limiter_wait_seconds += seconds
+
+    def record_breaker_wait(self, stage, seconds):
+        if not seconds:
+            return
+        with self._lock:
+            self._metrics(stage).breaker_wait_seconds += seconds
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'finished_at': datetime.now().isoformat(),
+                'stages': {name: metrics.to_dict() for name, metrics in self._stages.items()}
+            }
+
+    def to_prometheus(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        with self._lock:
+            stages = sorted(self._stages.items())
+            histogram_samples = []
+            for name, metrics in stages:
+                cumulative = 0
+                for bound, count in zip(list(metrics.latency.buckets) + ['+Inf'], metrics.latency.counts):
+                    cumulative += count
+                    histogram_samples.append(f'llm_call_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                histogram_samples.append(f'llm_call_duration_seconds_sum{{stage="{name}"}} {metrics.latency.sum:.6f}')
+                histogram_samples.append(f'llm_call_duration_seconds_count{{stage="{name}"}} {metrics.latency.count}')
+            metric('llm_call_duration_seconds', 'histogram', 'Latency of LLM calls per stage.', histogram_samples)
+
+            counters = (
+                ('stage_duration_seconds', 'gauge', 'Wall time spent in the stage.', 'wall_seconds'),
+                ('llm_input_tokens_total', 'counter', 'Input tokens sent to the LLM.', 'input_tokens'),
+                ('llm_output_tokens_total', 'counter', 'Output tokens received from the LLM.', 'output_tokens'),
+                ('llm_call_errors_total', 'counter', 'Failed LLM calls.', 'errors'),
+                ('llm_retries_total', 'counter', 'Retried LLM calls.', 'retries'),
+                ('llm_backoff_seconds_total', 'counter', 'Time slept in retry backoff.', 'backoff_seconds'),
+                ('llm_rate_limiter_wait_seconds_total', 'counter', 'Time waited in the rate limiter.',
+                 'limiter_wait_seconds'),
+                ('llm_circuit_breaker_wait_seconds_total', 'counter', 'Time paused by the shared circuit breaker.',
+                 'breaker_wait_seconds'),
+                ('llm_cache_hits_total', 'counter', 'LLM cache hits.', 'cache_hits'),
+                ('llm_cache_misses_total', 'counter', 'LLM cache misses.', 'cache_misses'),
+            )
+            for metric_name, kind, help_text, attribute in counters:
+                metric(metric_name, kind, help_text, [
+                    f'{metric_name}{{stage="{name}"}} {getattr(metrics, attribute)}' for name, metrics in stages
+                ])
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory, prefix='run_profile'):
+        os.makedirs(directory, exist_ok=True)
+        json_path = os.path.join(directory, f"{prefix}.json")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+        # Атомарная запись: node_exporter не должен прочитать недописанный файл
+        prom_path = os.path.join(directory, f"{prefix}.prom")
+        with open(prom_path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(prom_path + '.tmp', prom_path)
+        return json_path, prom_path
+
+    def print_summary(self):
+        print("\n⏱️ ПРОФИЛЬ ЗАПУСКА:")
+        for name, stage in self.to_dict()['stages'].items():
+            p50 = stage['latency']['p50_seconds']
+            p99 = stage['latency']['p99_seconds']
+            latency = f", p50 {p50:.2f} с, p99 {p99:.2f} с" if p50 is not None else ""
+            print(f"   - {name}: {stage['wall_seconds']:.1f} с, вызовов {stage['calls']}{latency}, "
+                  f"токенов {stage['input_tokens']}/{stage['output_tokens']}, "
+                  f"повторов {stage['retries']} ({stage['backoff_seconds']:.1f} с), "
+                  f"предохранитель {stage['breaker_wait_seconds']:.1f} с, "
+                  f"лимитер {stage['limiter_wait_seconds']:.1f} с, кэш {stage['cache_hits']}/{stage['cache_misses']}")
+
+
+class InstrumentedModel:
+    def __init__(self, model, stage, profiler=None):
+        self._model = model
+        self.stage = stage
+        self._profiler = profiler
+        self.model_name = getattr(model, 'model_name', type(model).__name__)
+
+    def generate_content(self, contents, **kwargs):
+        profiler = self._profiler or get_profiler()
+        started = time.perf_counter()
+        try:
+            response = self._model.generate_content(contents, **kwargs)
+        except Exception:
+            profiler.record_call(self.stage, time.perf_counter() - started, estimate_tokens(str(contents)), error=True)
+            raise
+        latency = time.perf_counter() - started
+
+        cache_hit = getattr(response, 'from_cache', False)
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            input_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+            output_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+        elif cache_hit:
+            input_tokens = output_tokens = 0
+        else:
+            input_tokens = estimate_tokens(str(contents))
+            output_tokens = estimate_tokens(response.text)
+        profiler.record_call(self.stage, latency, input_tokens, output_tokens, cache_hit=cache_hit)
+        return response
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._model, name)
+
+
+class InstrumentedLLMClient:
+    wraps_llm_client = True
+
+    def __init__(self, client, stage, profiler=None):
+        self._client = client
+        self.stage = stage
+        self._profiler = profiler
+
+    def complete(self, messages, temperature=1, max_tokens=None, caller_id=None, seed=None, format=None):
+        profiler = self._profiler or get_profiler()
+        input_tokens = sum(estimate_tokens(m.content) for m in messages)
+        hits_before = getattr(getattr(self._client, 'cache', None), 'hits', None)
+        started = time.perf_counter()
+        try:
+            out = self._client.complete(
+                messages=messages, temperature=temperature, max_tokens=max_tokens,
+                caller_id=caller_id, seed=seed, format=format
+            )
+        except Exception:
+            profiler.record_call(self.stage, time.perf_counter() - started, input_tokens, error=True)
+            raise
+        cache_hit = None
+        if hits_before is not None:
+            cache_hit = self._client.cache.hits > hits_before
+        profiler.record_call(
+            self.stage, time.perf_counter() - started,
+            0 if cache_hit else input_tokens, 0 if cache_hit else estimate_tokens(out.content),
+            cache_hit=cache_hit
+        )
+        return out
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._client, name)
+
+
+def instrument_giskard_client(stage, set_default=True):
+    from giskard.llm.client import get_default_client, set_default_client
+    from retry_policy import RetryingLLMClient
+
+    # Цепочка: повторы → метрики каждой попытки → кэш → клиент; прежние обертки другого этапа снимаются
+    client = get_default_client()
+    while getattr(client, 'wraps_llm_client', False):
+        client = client._client
+    wrapped = RetryingLLMClient(InstrumentedLLMClient(client, stage), stage)
+    if set_default:
+        set_default_client(wrapped)
+    return wrapped
+
+
+_default_profiler = None
+_default_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    global _default_profiler
+    with _default_profiler_lock:
+        if _default_profiler is None:
+            _default_profiler = RunProfiler(cprofile_dir=os.environ.get('PROFILE_STAGES_DIR'))
+        return _default_profiler
+
+
+def set_profiler(profiler):
+    global _default_profiler
+    with _default_profiler_lock:
+        _default_profiler = profiler
+    return profiler
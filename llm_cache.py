@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from rate_limiter import RateLimitedLLMClient
+
+
+DEFAULT_CACHE_PATH = os.path.join('.llm_cache', 'llm_cache.sqlite')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def make_cache_key(model_name, prompt, params=None):
+    payload = json.dumps(
+        {'model': model_name, 'prompt': prompt, 'params': params or {}},
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, ttl_seconds=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, size, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[2] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                self._total_bytes -= row[1]
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._total_bytes -= old[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, data, size, now, now)
+            )
+            self._total_bytes += size
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # LRU: удаляем давно не использованные записи, пока не уложимся в лимит
+        while self.max_bytes and self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed ASC LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self.evictions += 1
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def stats(self):
+        total = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'evictions': self.evictions,
+            'entries': entries,
+            'size_bytes': self._total_bytes
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedResponse:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+        self.from_cache = True
+
+
+class CachedModel:
+    def __init__(self, model, cache):
+        self._model = model
+        self.cache = cache
+        self.model_name = getattr(model, 'model_name', type(model).__name__)
+
+    def generate_content(self, contents, **kwargs):
+        params = dict(kwargs)
+        params['model_generation_config'] = getattr(self._model, '_generation_config', None)
+        key = make_cache_key(self.model_name, contents, params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return CachedResponse(cached['text'])
+
+        response = self._model.generate_content(contents, **kwargs)
+        self.cache.set(key, {'text': response.text})
+        return response
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._model, name)
+
+
+class CachedLLMClient:
+    # Обертка над LLM-клиентом Giskard (генерация вопросов и LLM-судья)
+    def __init__(self, client, cache):
+        self._client = client
+        self.cache = cache
+        self.model_name = getattr(client, 'model', type(client).__name__)
+        self._occurrences = {}
+        self._occurrences_lock = threading.Lock()
+
+    def complete(self, messages, temperature=1, max_tokens=None, caller_id=None, seed=None, format=None):
+        from giskard.llm.client import ChatMessage
+
+        prompt = [{'role': m.role, 'content': m.content} for m in messages]
+        params = {'temperature': temperature, 'max_tokens': max_tokens, 'seed': seed, 'format': format}
+        if temperature:
+            # Генераторы Giskard повторяют одинаковые промпты ради разных вариантов: n-й повтор за запуск
+            # получает свою запись, иначе кэш превращает их в дубликаты вопросов
+            base_key = make_cache_key(self.model_name, prompt, params)
+            with self._occurrences_lock:
+                params['occurrence'] = self._occurrences.get(base_key, 0)
+                self._occurrences[base_key] = params['occurrence'] + 1
+        key = make_cache_key(self.model_name, prompt, params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return ChatMessage(role=cached['role'], content=cached['content'])
+
+        out = self._client.complete(
+            messages=messages, temperature=temperature, max_tokens=max_tokens,
+            caller_id=caller_id, seed=seed, format=format
+        )
+        self.cache.set(key, {'role': out.role, 'content': out.content})
+        return out
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._client, name)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache(
+                path=os.environ.get('LLM_CACHE_PATH', DEFAULT_CACHE_PATH),
+                max_bytes=int(os.environ.get('LLM_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+                ttl_seconds=float(os.environ['LLM_CACHE_TTL']) if os.environ.get('LLM_CACHE_TTL') else None
+            )
+        return _default_cache
+
+
+def install_giskard_cache(cache=None):
+    from giskard.llm.client import get_default_client, set_default_client
+
+    client = get_default_client()
+    # Внешние обертки (метрики, повторы) снимаются: кэш должен лежать ближе всего к клиенту
+    while getattr(client, 'wraps_llm_client', False):
+        client = client._client
+    if isinstance(client, CachedLLMClient):
+        return client
+    # Лимитер — под кэшем: попадания в кэш не расходуют квоту API
+    cached_client = CachedLLMClient(RateLimitedLLMClient(client), cache or get_default_cache())
+    set_default_client(cached_client)
+    return cached_client
@@ -0,0 +1,359 @@
+import queue
+import threading
+import time
+
+from chunking import chunk_text
+from client_registry import get_client_registry
+from dedup import make_deduplicator, print_dedup_stats
+from hedging import print_hedge_stats
+from gemini_answer_generation import (
+    ANSWER_ERROR,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_TOKENS_PER_MINUTE,
+    answer_question,
+    save_answers
+)
+from giskard_evaluation import (
+    build_scorer,
+    evaluate_answer_batch,
+    is_counted_correct,
+    save_evaluation,
+    summarize_evaluation
+)
+from giskard_question_generation import (
+    NUM_QUESTIONS,
+    iter_questions,
+    load_or_fetch_excerpt,
+    save_questions
+)
+from instrumentation import get_profiler
+from rate_limiter import TokenBucketLimiter
+from results_store import record_run_results
+from retrieval import BM25Index
+
+
+DEFAULT_QUEUE_SIZE = 8
+# Оценка идет микропакетами: до EVAL_BATCH_SIZE ответов или сколько пришло за EVAL_BATCH_WAIT секунд
+EVAL_BATCH_SIZE = 16
+EVAL_BATCH_WAIT = 0.05
+
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.started is None:
+                self.started = time.perf_counter()
+
+    def record(self, seconds, items=1):
+        with self._lock:
+            self.items += items
+            self.busy_seconds += seconds
+            self.finished = time.perf_counter()
+
+    def to_dict(self):
+        elapsed = (self.finished - self.started) if self.started and self.finished else 0.0
+        return {
+            'stage': self.name,
+            'items': self.items,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'elapsed_seconds': round(elapsed, 3),
+            'throughput_per_second': round(self.items / elapsed, 3) if elapsed else 0.0
+        }
+
+
+class MonitoredQueue(queue.Queue):
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.max_depth = 0
+        self._depth_samples = 0
+        self._depth_total = 0
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        depth = self.qsize()
+        with self.mutex:
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_samples += 1
+            self._depth_total += depth
+
+    def depth_stats(self):
+        return {
+            'max_depth': self.max_depth,
+            'avg_depth': round(self._depth_total / self._depth_samples, 2) if self._depth_samples else 0.0,
+            'capacity': self.maxsize
+        }
+
+
+def _drain_answers(answer_queue, max_items=EVAL_BATCH_SIZE, wait=EVAL_BATCH_WAIT):
+    # Первый ответ ждем без ограничения, затем добираем пакет, пока он не заполнится или не выйдет время
+    batch = []
+    item = answer_queue.get()
+    deadline = time.perf_counter() + wait
+    while item is not _DONE:
+        batch.append(item)
+        remaining = deadline - time.perf_counter()
+        if len(batch) >= max_items or remaining <= 0:
+            return batch, False
+        try:
+            item = answer_queue.get(timeout=remaining)
+        except queue.Empty:
+            return batch, False
+    return batch, True
+
+
+def _use_thread_safe_numba_layer():
+    # UMAP внутри Giskard (поиск тем) запускает параллельный numba-код в потоке конвейера;
+    # со слоем TBB процесс после этого зависает на выходе
+    try:
+        import numba
+    except ImportError:
+        return
+    if numba.config.THREADING_LAYER == 'default':
+        numba.config.THREADING_LAYER = 'workqueue'
+
+
+def _produce_questions(excerpt, num_questions, question_queue, questions, stats, errors, consumers, run_log,
+                       deduplicator, question_workers):
+    with get_profiler().stage('questions'):
+        _produce_questions_inner(excerpt, num_questions, question_queue, questions, stats, errors, consumers, run_log,
+                                 deduplicator, question_workers)
+
+
+def _produce_questions_inner(excerpt, num_questions, question_queue, questions, stats, errors, consumers, run_log,
+                             deduplicator, question_workers):
+    stats.start()
+    try:
+        logged = run_log.read('questions') if run_log else []
+        for qa in logged:
+            if deduplicator is not None:
+                deduplicator.add(qa['question'])
+            questions.append(qa)
+            question_queue.put((qa['question_id'], qa))
+        if logged:
+            print(f"♻️ {len(logged)} вопросов восстановлено из запуска {run_log.run_id}")
+
+        remaining = 0 if run_log and run_log.get_meta('questions_complete') else num_questions - len(logged)
+        # Генерация идет с той же целью, что и в прерванном запуске: первые вопросы повторяются из кэша LLM
+        # и пропускаются по sample_key, а не отсеиваются дедупликацией как почти-дубликаты. В журналах без
+        # sample_key пропускается столько первых вопросов, сколько записано
+        done_keys = {qa['sample_key'] for qa in logged if 'sample_key' in qa}
+        skip = len(logged) - len(done_keys)
+        started = time.perf_counter()
+        for qa in iter_questions(excerpt, num_questions, question_workers) if remaining > 0 else []:
+            if qa.get('sample_key') in done_keys:
+                continue
+            if skip:
+                skip -= 1
+                continue
+            stats.record(time.perf_counter() - started)
+            started = time.perf_counter()
+            duplicate_of = deduplicator.add(qa['question']) if deduplicator is not None else None
+            if duplicate_of is not None:
+                print(f"🧹 Почти-дубликат пропущен: {qa['question'][:50]}...")
+                continue
+            i = len(questions)
+            qa = dict(qa, question_id=i)
+            questions.append(qa)
+            if run_log:
+                run_log.append('questions', qa)
+            print(f"❓ Вопрос {i + 1} сгенерирован: {qa['question'][:50]}...")
+            question_queue.put((i, qa))
+        if run_log:
+            run_log.flush()
+            run_log.set_meta('questions_complete', True)
+    except Exception as e:
+        print(f"❌ Ошибка генерации вопросов через Giskard: {e}")
+        errors.append(('questions', str(e)))
+    finally:
+        for _ in range(consumers):
+            question_queue.put(_DONE)
+
+
+def _answer_worker(model, excerpt, limiter, question_queue, answer_queue, stats, remaining, remaining_lock,
+                   logged_answers, run_log, retriever, top_k):
+    try:
+        with get_profiler().stage('answers'):
+            _answer_loop(model, excerpt, limiter, question_queue, answer_queue, stats, logged_answers, run_log,
+                         retriever, top_k)
+    finally:
+        with remaining_lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                answer_queue.put(_DONE)
+
+
+def _answer_loop(model, excerpt, limiter, question_queue, answer_queue, stats, logged_answers, run_log, retriever,
+                 top_k):
+    while True:
+        item = question_queue.get()
+        if item is _DONE:
+            break
+        i, qa = item
+        record = logged_answers.get(i)
+        if record is None:
+            stats.start()
+            started = time.perf_counter()
+            record = answer_question(model, qa, i, excerpt, limiter, retriever, top_k)
+            stats.record(time.perf_counter() - started)
+            if run_log:
+                run_log.append('answers', record)
+        answer_queue.put((i, qa, record))
+
+
+def run_pipeline(excerpt=None, num_questions=NUM_QUESTIONS, answer_workers=DEFAULT_CONCURRENCY,
+                 queue_size=DEFAULT_QUEUE_SIZE, limiter=None, run_log=None, retrieval_top_k=None,
+                 dedup_threshold=None, question_workers=1, hedge=None):
+    print("=" * 60)
+    print("ПОТОКОВЫЙ КОНВЕЙЕР: ВОПРОСЫ → ОТВЕТЫ → ОЦЕНКА")
+    print("=" * 60)
+
+    if excerpt is None:
+        print("Получение отрывка из романа...")
+        excerpt = load_or_fetch_excerpt(run_log)
+        if not excerpt:
+            print("ОШИБКА: Не удалось получить отрывок через Gemini")
+            return None, None, None
+        print(f"✅ Отрывок получен (длина: {len(excerpt)} символов)")
+
+    model = get_client_registry().text_model(stage='answers', hedge=hedge)
+    if limiter is None:
+        limiter = TokenBucketLimiter(DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE)
+    # Дубликаты хеджирования тоже расходуют квоту: модель берет ее из того же лимитера
+    set_limiter = getattr(model, 'set_limiter', None)
+    if set_limiter is not None:
+        set_limiter(limiter)
+
+    retriever = None
+    if retrieval_top_k:
+        retriever = BM25Index(chunk_text(excerpt))
+        print(f"🔎 Индекс BM25 по {len(retriever.chunks)} фрагментам построен за "
+              f"{retriever.build_seconds * 1000:.1f} мс")
+
+    question_queue = MonitoredQueue(queue_size)
+    answer_queue = MonitoredQueue(queue_size)
+    question_stats = StageStats('questions')
+    answer_stats = StageStats('answers')
+    evaluation_stats = StageStats('evaluation')
+
+    questions = []
+    answers = []
+    evaluation_results = []
+    errors = []
+    remaining = [answer_workers]
+    remaining_lock = threading.Lock()
+    logged_answers = {}
+    logged_evaluations = {}
+    if run_log:
+        logged_answers = {a['question_id']: a for a in run_log.read('answers') if a['gemini_answer'] != ANSWER_ERROR}
+        logged_evaluations = {r['question_id']: r for r in run_log.read('evaluations') if 'verdict_source' in r}
+    scorer = build_scorer()
+    deduplicator = make_deduplicator(dedup_threshold)
+
+    _use_thread_safe_numba_layer()
+    pipeline_started = time.perf_counter()
+    threads = [threading.Thread(
+        target=_produce_questions,
+        args=(excerpt, num_questions, question_queue, questions, question_stats, errors, answer_workers, run_log,
+              deduplicator, question_workers),
+        daemon=True
+    )]
+    for _ in range(answer_workers):
+        threads.append(threading.Thread(
+            target=_answer_worker,
+            args=(model, excerpt, limiter, question_queue, answer_queue, answer_stats, remaining, remaining_lock,
+                  logged_answers, run_log, retriever, retrieval_top_k),
+            daemon=True
+        ))
+    for thread in threads:
+        thread.start()
+
+    with get_profiler().stage('evaluation'):
+        finished = False
+        while not finished:
+            batch, finished = _drain_answers(answer_queue)
+            pending = []
+            for i, qa, record in batch:
+                evaluation_result = logged_evaluations.get(i)
+                if evaluation_result is None or evaluation_result.get('gemini_answer') != record.get('gemini_answer'):
+                    pending.append((i, qa, record))
+                else:
+                    answers.append(record)
+                    evaluation_results.append(evaluation_result)
+            if not pending:
+                continue
+            evaluation_stats.start()
+            started = time.perf_counter()
+            evaluated = evaluate_answer_batch(pending, scorer)
+            evaluation_stats.record(time.perf_counter() - started, items=len(pending))
+            for (_, _, record), evaluation_result in zip(pending, evaluated):
+                if run_log:
+                    run_log.append('evaluations', evaluation_result)
+                answers.append(record)
+                evaluation_results.append(evaluation_result)
+
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - pipeline_started
+    if run_log:
+        run_log.flush()
+
+    if not questions:
+        print("ОШИБКА: Не удалось сгенерировать вопросы через Giskard")
+        return None, None, None
+
+    answers.sort(key=lambda a: a['question_id'])
+    evaluation_results.sort(key=lambda r: r['question_id'])
+
+    questions.sort(key=lambda q: q['question_id'])
+    total_correct = sum(1 for r in evaluation_results if is_counted_correct(r))
+
+    summary_path = run_log.summary_path if run_log else (lambda prefix: None)
+    questions_file = save_questions(questions, summary_path('giskard_questions'))
+    answers_file = save_answers(answers, summary_path('answers'))
+    results = summarize_evaluation(evaluation_results, total_correct, len(questions), len(evaluation_results))
+    results['scoring'].update(scorer.stats())
+    results['pipeline_stats'] = {
+        'wall_seconds': round(wall_seconds, 3),
+        'stages': [question_stats.to_dict(), answer_stats.to_dict(), evaluation_stats.to_dict()],
+        'question_queue': question_queue.depth_stats(),
+        'answer_queue': answer_queue.depth_stats(),
+        'errors': errors
+    }
+    if retriever is not None:
+        results['pipeline_stats']['retrieval'] = retriever.stats()
+    hedge_stats = getattr(model, 'hedge_stats', None)
+    if hedge_stats is not None:
+        results['pipeline_stats']['hedge'] = hedge_stats()
+    if deduplicator is not None:
+        results['pipeline_stats']['dedup'] = deduplicator.stats()
+        if run_log:
+            run_log.set_meta('dedup', deduplicator.stats())
+    evaluation_file = save_evaluation(results, summary_path('giskard_evaluation'))
+    if run_log:
+        record_run_results(run_log, evaluation_results)
+
+    print(f"\n✅ Вопросы: {questions_file}, ответы: {answers_file}, оценка: {evaluation_file}")
+    print(f"⏱️ Общее время конвейера: {wall_seconds:.1f} с")
+    if hedge_stats is not None:
+        print_hedge_stats(results['pipeline_stats']['hedge'])
+    if deduplicator is not None:
+        print_dedup_stats(deduplicator.stats())
+    for stage in results['pipeline_stats']['stages']:
+        print(f"   - {stage['stage']}: {stage['items']} шт., занято {stage['busy_seconds']:.1f} с, "
+              f"{stage['throughput_per_second']:.2f} шт./с")
+    for name in ('question_queue', 'answer_queue'):
+        depth = results['pipeline_stats'][name]
+        print(f"   - {name}: макс. глубина {depth['max_depth']}/{depth['capacity']}, средняя {depth['avg_depth']}")
+
+    return questions, answers, results
@@ -0,0 +1,113 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+DEFAULT_QUESTION_WORKERS = 4
+
+_TASK_DONE = object()
+
+
+class KnowledgeBaseShard:
+    # Вид на общую базу знаний: seed-документы берутся только из своей доли фрагментов,
+    # а соседи для контекста ищутся по всей базе (эмбеддинги, темы и индекс общие)
+    def __init__(self, knowledge_base, documents, seed):
+        self._knowledge_base = knowledge_base
+        self.documents = documents
+        self._rng = np.random.default_rng(seed)
+
+    def get_random_document(self):
+        return self._rng.choice(self.documents)
+
+    def __len__(self):
+        return len(self._knowledge_base)
+
+    def __getitem__(self, doc_id):
+        return self._knowledge_base[doc_id]
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._knowledge_base, name)
+
+
+def split_documents(documents, num_shards):
+    # Соседние фрагменты отрывка попадают в один шард: вопросы каждого шарда опираются на свой участок текста
+    num_shards = max(1, min(num_shards, len(documents)))
+    bounds = np.linspace(0, len(documents), num_shards + 1).astype(int)
+    return [documents[bounds[i]:bounds[i + 1]] for i in range(num_shards)]
+
+
+def _largest_remainder(total, weights, offset=0):
+    weights = np.asarray(weights, dtype=np.float64)
+    exact = total * weights / weights.sum()
+    counts = np.floor(exact).astype(int)
+    remainder = total - counts.sum()
+    # При равных остатках лишние вопросы сдвигаются по шардам вместе с offset, чтобы не копиться в первом
+    order = sorted(range(len(weights)), key=lambda i: (-(exact[i] - counts[i]), (i - offset) % len(weights)))
+    for i in order[:remainder]:
+        counts[i] += 1
+    return counts.tolist()
+
+
+def shard_quotas(num_questions, num_generators, shard_sizes):
+    # Баланс типов как в generate_testset: поровну на генератор, внутри генератора — пропорционально размеру шарда
+    generator_totals = [
+        num_questions // num_generators + (1 if i < num_questions % num_generators else 0)
+        for i in range(num_generators)
+    ]
+    quotas = {}
+    # Сдвиг — число уже распределенных вопросов: когда шардов больше, чем вопросов, следующий генератор
+    # начинает с того шарда, на котором остановился предыдущий
+    offset = 0
+    for generator_index, total in enumerate(generator_totals):
+        for shard_index, n in enumerate(_largest_remainder(total, shard_sizes, offset=offset)):
+            if n:
+                quotas[(generator_index, shard_index)] = n
+        offset += total
+    return quotas
+
+
+def prepare_knowledge_base(knowledge_base):
+    # Эмбеддинги, темы и индекс считаются один раз до запуска потоков, дальше база только читается
+    _ = knowledge_base.topics
+    _ = knowledge_base._index
+    return knowledge_base
+
+
+def iter_sharded_samples(knowledge_base, num_questions, generators, workers=DEFAULT_QUESTION_WORKERS,
+                         num_shards=None, seed=0, **generator_kwargs):
+    # Отдает ((генератор, шард, номер), вопрос) по мере готовности; порядок ключей не зависит от потоков
+    prepare_knowledge_base(knowledge_base)
+    shards = split_documents(knowledge_base._documents, num_shards or workers)
+    quotas = shard_quotas(num_questions, len(generators), [len(shard) for shard in shards])
+    print(f"🧩 Шардов базы знаний: {len(shards)} (фрагментов: {', '.join(str(len(shard)) for shard in shards)}), "
+          f"задач генерации: {len(quotas)}, потоков: {workers}")
+    results = queue.Queue()
+
+    def run_task(generator_index, shard_index, n):
+        view = KnowledgeBaseShard(knowledge_base, shards[shard_index], [seed, generator_index, shard_index])
+        try:
+            for position, sample in enumerate(generators[generator_index].generate_questions(
+                    view, num_questions=n, **generator_kwargs)):
+                results.put(((generator_index, shard_index, position), sample))
+        except Exception as e:
+            print(f"⚠️ Шард {shard_index + 1}, генератор {type(generators[generator_index]).__name__}: {e}")
+        finally:
+            results.put(_TASK_DONE)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='questions')
+    try:
+        for (generator_index, shard_index), n in quotas.items():
+            executor.submit(run_task, generator_index, shard_index, n)
+        pending = len(quotas)
+        while pending:
+            item = results.get()
+            if item is _TASK_DONE:
+                pending -= 1
+            else:
+                yield item
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
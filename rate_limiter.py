@@ -0,0 +1,161 @@
+import multiprocessing
+import threading
+import time
+
+
+def estimate_tokens(text):
+    # Грубая оценка без обращения к API: для кириллицы ~3 символа на токен
+    if not text:
+        return 0
+    return len(text) // 3 + 1
+
+
+class TokenBucketLimiter:
+    def __init__(self, requests_per_minute, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = threading.Lock()
+        self._request_allowance = float(requests_per_minute)
+        self._token_allowance = float(tokens_per_minute) if tokens_per_minute else 0.0
+        self._last_refill = time.monotonic()
+        self.total_wait = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_allowance = min(
+            float(self.requests_per_minute),
+            self._request_allowance + elapsed * self.requests_per_minute / 60.0
+        )
+        if self.tokens_per_minute:
+            self._token_allowance = min(
+                float(self.tokens_per_minute),
+                self._token_allowance + elapsed * self.tokens_per_minute / 60.0
+            )
+
+    def _time_until_available(self, tokens):
+        wait = 0.0
+        if self._request_allowance < 1:
+            wait = (1 - self._request_allowance) * 60.0 / self.requests_per_minute
+        if self.tokens_per_minute and self._token_allowance < tokens:
+            wait = max(wait, (tokens - self._token_allowance) * 60.0 / self.tokens_per_minute)
+        return wait
+
+    def acquire(self, tokens=0):
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                wait = self._time_until_available(tokens)
+                if wait <= 0:
+                    self._request_allowance -= 1
+                    if self.tokens_per_minute:
+                        self._token_allowance -= tokens
+                    self.total_wait += waited
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    def try_acquire(self, tokens=0):
+        # Неблокирующий вариант для необязательных запросов: без свободной квоты запрос не отправляется
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._time_until_available(tokens) > 0:
+                return False
+            self._request_allowance -= 1
+            if self.tokens_per_minute:
+                self._token_allowance -= tokens
+            return True
+
+    def adjust(self, extra_tokens):
+        # Поправка после ответа API, когда известен реальный расход токенов
+        if not self.tokens_per_minute or not extra_tokens:
+            return
+        with self._lock:
+            # Ответ дешевле оценки возвращает токены, но не сверх емкости ведра
+            self._token_allowance = min(float(self.tokens_per_minute), self._token_allowance - extra_tokens)
+
+
+class SharedTokenBucketLimiter(TokenBucketLimiter):
+    # Тот же token bucket, но состояние лежит в общей памяти и разделяется между процессами пула
+    def __init__(self, requests_per_minute, tokens_per_minute=None):
+        context = multiprocessing.get_context()
+        self._state = context.RawArray('d', 4)
+        super().__init__(requests_per_minute, tokens_per_minute)
+        self._lock = context.Lock()
+
+    @property
+    def _request_allowance(self):
+        return self._state[0]
+
+    @_request_allowance.setter
+    def _request_allowance(self, value):
+        self._state[0] = value
+
+    @property
+    def _token_allowance(self):
+        return self._state[1]
+
+    @_token_allowance.setter
+    def _token_allowance(self, value):
+        self._state[1] = value
+
+    @property
+    def _last_refill(self):
+        return self._state[2]
+
+    @_last_refill.setter
+    def _last_refill(self, value):
+        self._state[2] = value
+
+    @property
+    def total_wait(self):
+        return self._state[3]
+
+    @total_wait.setter
+    def total_wait(self, value):
+        self._state[3] = value
+
+
+class RateLimitedLLMClient:
+    # Обертка над LLM-клиентом Giskard: до API доходят только промахи кэша, и каждый проходит через общий лимитер
+    def __init__(self, client):
+        self._client = client
+
+    def complete(self, messages, temperature=1, max_tokens=None, caller_id=None, seed=None, format=None):
+        limiter = get_llm_client_limiter()
+        if limiter is not None:
+            limiter.acquire(sum(estimate_tokens(m.content) for m in messages))
+        out = self._client.complete(
+            messages=messages, temperature=temperature, max_tokens=max_tokens,
+            caller_id=caller_id, seed=seed, format=format
+        )
+        if limiter is not None:
+            limiter.adjust(estimate_tokens(out.content))
+        return out
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._client, name)
+
+
+_llm_client_limiter = None
+_llm_client_limiter_lock = threading.Lock()
+
+
+def get_llm_client_limiter():
+    # По умолчанию лимитера нет: вызовы Giskard ограничиваются только в пакетном режиме
+    with _llm_client_limiter_lock:
+        return _llm_client_limiter
+
+
+def set_llm_client_limiter(limiter):
+    global _llm_client_limiter
+    with _llm_client_limiter_lock:
+        _llm_client_limiter = limiter
+    return limiter
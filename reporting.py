@@ -0,0 +1,57 @@
+from embedding_store import default_embedding_store_stats
+from llm_cache import get_default_cache
+from retry_policy import get_default_policy
+
+
+def print_summary(evaluation_results, answers_count):
+    print("\n📊 ИТОГОВЫЕ РЕЗУЛЬТАТЫ:")
+    print(f"   Вопросов сгенерировано (Giskard): {evaluation_results.get('total_questions', 0)}")
+    print(f"   Ответов получено: {answers_count}")
+    print(f"   Точность: {evaluation_results.get('accuracy', 0):.2%}")
+    print(f"   Процент успеха: {evaluation_results.get('success_rate', 0):.1f}%")
+
+    if 'automatic_metrics' in evaluation_results:
+        auto_metrics = evaluation_results['automatic_metrics']
+        print(f"\n🤖 АВТОМАТИЧЕСКИЕ МЕТРИКИ GISKARD:")
+        print(f"   - Правильных ответов: {auto_metrics.get('correct_answers', 0)}/{auto_metrics.get('total_questions', 0)}")
+        print(f"   - Точность: {auto_metrics.get('accuracy', 0):.2%}")
+        print(f"   - Процент успеха: {auto_metrics.get('success_rate', 0):.1f}%")
+
+    if 'scoring' in evaluation_results:
+        scoring = evaluation_results['scoring']
+        sources = scoring.get('verdict_sources', {})
+        local = sum(count for source, count in sources.items() if source.startswith('local'))
+        print(f"   - Вердиктов локально: {local}, LLM-судьей: {sources.get('judge', 0)} "
+              f"(доля вердиктов судьи {scoring.get('judge_verdict_share', 0):.0%}, вызовов судьи в этом запуске "
+              f"{scoring.get('judge_call_rate', 0):.0%}), средний F1: {scoring.get('mean_score', 0):.2f}")
+        if 'reused' in scoring:
+            print(f"   - Вердиктов из хранилища: {scoring['reused']}, вычислено заново: {scoring['computed']}")
+
+    if 'evaluation_results' in evaluation_results:
+        print(f"\n📋 ДЕТАЛЬНЫЕ РЕЗУЛЬТАТЫ (первые 5 вопросов):")
+        for i, result in enumerate(evaluation_results['evaluation_results'][:5]):
+            print(f"   Вопрос {result['question_id']+1}: {'✅' if result.get('correctness', False) else '❌'} "
+                  f"(F1 {result.get('score', 0):.2f}, {result.get('verdict_source', '-')})")
+            print(f"      Вопрос (Giskard): {result['question'][:60]}...")
+            print(f"      Ответ: {result['gemini_answer'][:60]}...")
+            print()
+
+        if len(evaluation_results['evaluation_results']) > 5:
+            print(f"   ... и еще {len(evaluation_results['evaluation_results']) - 5} вопросов")
+
+
+def print_cache_stats():
+    cache_stats = get_default_cache().stats()
+    print(f"\n💾 Кэш LLM: попаданий {cache_stats['hits']}, промахов {cache_stats['misses']} "
+          f"({cache_stats['hit_rate']:.0%}), записей {cache_stats['entries']}")
+    embedding_stats = default_embedding_store_stats()
+    if embedding_stats:
+        print(f"🧠 Хранилище эмбеддингов: попаданий {embedding_stats['hits']}, промахов {embedding_stats['misses']}, "
+              f"векторов {embedding_stats['entries']} ({embedding_stats['size_bytes'] / 1024 / 1024:.1f} МБ)")
+
+
+def print_retry_stats():
+    retry_stats = get_default_policy().stats()
+    print(f"🔁 Повторов LLM: {retry_stats['retries']} (backoff {retry_stats['backoff_seconds']:.1f} с), "
+          f"пауз предохранителя: {retry_stats['breaker_trips']} ({retry_stats['breaker_wait_seconds']:.1f} с), "
+          f"исчерпано попыток: {retry_stats['gave_up']}")
@@ -0,0 +1,203 @@
+import os
+import re
+from datetime import datetime
+from urllib.parse import quote, unquote
+
+from run_store import RUNS_DIR, RunLog
+
+
+DEFAULT_RESULTS_DIR = 'results'
+TREND_COLUMNS = ('correct', 'score', 'latency_ms', 'prompt_tokens', 'output_tokens')
+TREND_GROUPS = ('run', 'day')
+_RUN_DATE_RE = re.compile(r'(\d{4})(\d{2})(\d{2})_\d{6}')
+
+
+def _pyarrow():
+    # pyarrow нужен только хранилищу результатов и импортируется при первом обращении
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError(f"для хранилища результатов нужен pyarrow ({e})") from e
+    return pyarrow
+
+
+def _schema(pa):
+    return pa.schema([
+        ('run_id', pa.string()),
+        ('question_id', pa.int32()),
+        ('question', pa.string()),
+        ('answer', pa.string()),
+        ('reference_answer', pa.string()),
+        ('correct', pa.bool_()),
+        ('score', pa.float64()),
+        ('verdict_source', pa.string()),
+        ('latency_ms', pa.float64()),
+        ('prompt_tokens', pa.int32()),
+        ('output_tokens', pa.int32())
+    ])
+
+
+def run_key(run_log):
+    # Отрывки пакетного режима лежат в runs/batch_<ID>/<отрывок>: ключ включает пакет, иначе имена совпадут
+    relative = os.path.relpath(run_log.path, RUNS_DIR)
+    return run_log.run_id if relative.startswith('..') else relative.replace(os.sep, '/')
+
+
+def run_date_for(run_id):
+    # Дата раздела берется из идентификатора запуска, чтобы повторная оценка попадала в тот же файл
+    match = _RUN_DATE_RE.search(run_id)
+    if match:
+        return '-'.join(match.groups())
+    return datetime.now().strftime('%Y-%m-%d')
+
+
+def _row(run_id, result):
+    return {
+        'run_id': run_id,
+        'question_id': result['question_id'],
+        'question': result.get('question'),
+        'answer': result.get('gemini_answer'),
+        'reference_answer': result.get('reference_answer'),
+        'correct': bool(result.get('correctness')),
+        'score': result.get('score'),
+        'verdict_source': result.get('verdict_source'),
+        'latency_ms': result.get('latency_ms'),
+        'prompt_tokens': result.get('prompt_tokens'),
+        'output_tokens': result.get('output_tokens')
+    }
+
+
+class ResultsStore:
+    # Результаты всех запусков — один Parquet-датасет: по файлу на запуск в разделе run_date=ГГГГ-ММ-ДД.
+    # Запросы читают только нужные колонки и разделы и агрегируют по одной группе за раз
+    def __init__(self, base_dir=None):
+        self.base_dir = base_dir or os.environ.get('RESULTS_STORE_DIR', DEFAULT_RESULTS_DIR)
+
+    def _path(self, run_id, run_date):
+        # Имя файла — идентификатор запуска в URL-кодировке: '/' ключей пакетного режима обратимо превращается в %2F
+        return os.path.join(self.base_dir, f"run_date={run_date}", quote(run_id, safe='') + '.parquet')
+
+    def has_run(self, run_id):
+        return os.path.exists(self._path(run_id, run_date_for(run_id)))
+
+    def write_run(self, run_id, evaluation_results, run_date=None):
+        pa = _pyarrow()
+        path = self._path(run_id, run_date or run_date_for(run_id))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pylist([_row(run_id, result) for result in evaluation_results], schema=_schema(pa))
+        # Файл запуска перезаписывается целиком: повторная оценка не дублирует строки. Временное имя
+        # начинается с точки, поэтому читатели датасета его не видят
+        tmp_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+        pa.parquet.write_table(table, tmp_path, compression='zstd')
+        os.replace(tmp_path, path)
+        return path
+
+    def dataset(self):
+        pa = _pyarrow()
+        partitioning = pa.dataset.partitioning(pa.schema([('run_date', pa.string())]), flavor='hive')
+        schema = _schema(pa).append(pa.field('run_date', pa.string()))
+        return pa.dataset.dataset(self.base_dir, format='parquet', partitioning=partitioning, schema=schema)
+
+    def _groups(self, by, since, until):
+        ds = _pyarrow().dataset
+        expression = None
+        if since:
+            expression = ds.field('run_date') >= since
+        if until:
+            upper = ds.field('run_date') <= until
+            expression = upper if expression is None else expression & upper
+        # Фильтр по разделу отсекает каталоги дат до чтения файлов. Храним только пути: прочитанный фрагмент
+        # держит метаданные файла, и на тысячах запусков память росла бы с их числом
+        groups = {}
+        for fragment in self.dataset().get_fragments(filter=expression):
+            run_date = ds.get_partition_keys(fragment.partition_expression)['run_date']
+            key = run_date if by == 'day' else unquote(os.path.basename(fragment.path)[:-len('.parquet')])
+            groups.setdefault((run_date, key), []).append(fragment.path)
+        return groups
+
+    def trends(self, by='run', since=None, until=None, last=None):
+        if by not in TREND_GROUPS:
+            raise ValueError(f"Неизвестная группировка: {by}")
+        pa = _pyarrow()
+        pc = pa.compute
+        if not os.path.isdir(self.base_dir):
+            return []
+        groups = self._groups(by, since, until)
+        # Порядок — по дате раздела, а не по строке ключа: иначе batch_<ID>/... шли бы после всех обычных запусков
+        keys = sorted(groups)
+        if last:
+            keys = keys[-last:]
+
+        rows = []
+        for group in keys:
+            key = group[1]
+            table = pa.concat_tables([pa.parquet.ParquetFile(path).read(columns=list(TREND_COLUMNS))
+                                      for path in groups[group]])
+            total = table.num_rows
+            if not total:
+                continue
+            latency = table['latency_ms']
+            p50, p99 = pc.quantile(latency, q=[0.5, 0.99]).to_pylist() if latency.null_count < total else (None, None)
+            tokens = (pc.sum(table['prompt_tokens']).as_py() or 0) + (pc.sum(table['output_tokens']).as_py() or 0)
+            correct = pc.sum(table['correct']).as_py() or 0
+            rows.append({
+                by: key,
+                'questions': total,
+                'correct': correct,
+                'accuracy': correct / total,
+                'mean_score': pc.mean(table['score']).as_py(),
+                'latency_p50_ms': round(p50, 1) if p50 is not None else None,
+                'latency_p99_ms': round(p99, 1) if p99 is not None else None,
+                'tokens_per_question': tokens / total
+            })
+        return rows
+
+    def backfill(self, runs_dir=RUNS_DIR):
+        # Запуски, оцененные до появления хранилища, переносятся из evaluations.jsonl; уже записанные пропускаются
+        added = 0
+        for root, _, files in os.walk(runs_dir):
+            if 'evaluations.jsonl' not in files:
+                continue
+            run_log = RunLog.resume(os.path.basename(root), base_dir=os.path.dirname(root))
+            key = os.path.relpath(root, runs_dir).replace(os.sep, '/')
+            if not self.has_run(key):
+                records = run_log.read('evaluations')
+                if records:
+                    self.write_run(key, records)
+                    added += 1
+            run_log.close()
+        return added
+
+
+def record_run_results(run_log, evaluation_results):
+    # Хранилище дополняет JSON-сводки: без pyarrow запуск не прерывается, а только предупреждает
+    try:
+        path = ResultsStore().write_run(run_key(run_log), evaluation_results)
+    except ImportError as e:
+        print(f"⚠️ Результаты не добавлены в хранилище: {e}")
+        return None
+    print(f"🗃️ Результаты добавлены в хранилище: {path}")
+    return path
+
+
+def print_trends(rows, by='run'):
+    if not rows:
+        print("В хранилище результатов нет запусков")
+        return
+    title = 'Запуск' if by == 'run' else 'День'
+    width = max(len(title), max(len(str(row[by])) for row in rows))
+    print(f"{title:<{width}}  вопросов  точность  ср. F1  p50, мс   p99, мс   токенов/вопрос")
+
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else '-'
+
+    for row in rows:
+        print(f"{row[by]:<{width}}  {row['questions']:>8}  {row['accuracy']:>8.1%}  {fmt(row['mean_score'], '>6.2f')}  "
+              f"{fmt(row['latency_p50_ms'], '>7.1f')}  {fmt(row['latency_p99_ms'], '>8.1f')}  "
+              f"{row['tokens_per_question']:>14.0f}")
+    questions = sum(row['questions'] for row in rows)
+    correct = sum(row['correct'] for row in rows)
+    print(f"Итого: {len(rows)} групп, {questions} вопросов, точность {correct / questions:.1%}")
@@ -0,0 +1,95 @@
+import re
+import threading
+import time
+
+import numpy as np
+
+
+DEFAULT_TOP_K = 3
+STEM_LENGTH = 6
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    # Грубый стемминг усечением: для русского языка склеивает большинство словоформ
+    return [word[:STEM_LENGTH] for word in _WORD_RE.findall(text.lower().replace('ё', 'е')) if len(word) > 1]
+
+
+class BM25Index:
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        started = time.perf_counter()
+        self.chunks = [c for c in chunks if c and c.strip()]
+        self.query_seconds = 0.0
+        self.queries = 0
+        self._stats_lock = threading.Lock()
+
+        doc_tokens = [tokenize(chunk) for chunk in self.chunks]
+        doc_lengths = np.array([len(tokens) for tokens in doc_tokens], dtype=np.float32)
+        avg_length = float(doc_lengths.mean()) if len(doc_lengths) and doc_lengths.mean() > 0 else 1.0
+        n_docs = len(self.chunks)
+
+        postings = {}
+        for doc_id, tokens in enumerate(doc_tokens):
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, ([], []))
+                postings[token][0].append(doc_id)
+                postings[token][1].append(count)
+
+        # Для каждого терма заранее считаем готовые BM25-веса по документам, запрос сводится к сложению массивов
+        self._postings = {}
+        for token, (doc_ids, counts) in postings.items():
+            doc_ids = np.array(doc_ids, dtype=np.int32)
+            tf = np.array(counts, dtype=np.float32)
+            idf = np.log(1.0 + (n_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            norm = k1 * (1.0 - b + b * doc_lengths[doc_ids] / avg_length)
+            self._postings[token] = (doc_ids, (idf * tf * (k1 + 1.0) / (tf + norm)).astype(np.float32))
+
+        self.build_seconds = time.perf_counter() - started
+
+    def scores(self, query):
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = self._postings.get(token)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        return scores
+
+    def search(self, query, top_k=DEFAULT_TOP_K):
+        started = time.perf_counter()
+        scores = self.scores(query)
+        top_k = min(top_k, len(scores))
+        if top_k == 0:
+            result = []
+        else:
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+            result = sorted(candidates.tolist(), key=lambda i: -scores[i])
+            # Нулевые совпадения отбрасываем, если нашлось хоть что-то релевантное
+            if scores[result[0]] > 0:
+                result = [i for i in result if scores[i] > 0]
+        with self._stats_lock:
+            self.query_seconds += time.perf_counter() - started
+            self.queries += 1
+        return result
+
+    def context(self, queries, top_k=DEFAULT_TOP_K):
+        if isinstance(queries, str):
+            queries = [queries]
+        selected = set()
+        for query in queries:
+            selected.update(self.search(query, top_k))
+        # Фрагменты идут в порядке текста, чтобы сохранить связность повествования
+        return "\n\n".join(self.chunks[i] for i in sorted(selected))
+
+    def stats(self):
+        return {
+            'chunks': len(self.chunks),
+            'terms': len(self._postings),
+            'build_seconds': round(self.build_seconds, 6),
+            'queries': self.queries,
+            'query_seconds_total': round(self.query_seconds, 6),
+            'query_seconds_avg': round(self.query_seconds / self.queries, 6) if self.queries else 0.0
+        }
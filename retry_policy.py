@@ -0,0 +1,288 @@
+import multiprocessing
+import os
+import random
+import re
+import threading
+import time
+
+from instrumentation import get_profiler
+
+
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BASE_DELAY = 2.0
+DEFAULT_MAX_DELAY = 120.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_PROVIDER = 'gemini'
+
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+TRANSIENT_MARKERS = (
+    'internal error', 'unavailable', 'timeout', 'timed out', 'deadline exceeded',
+    'connection', 'overloaded', 'temporarily'
+)
+RATE_LIMIT_MARKERS = ('429', 'quota', 'rate limit', 'resource has been exhausted', 'too many requests')
+
+_RETRY_DELAY_PATTERNS = (
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE),
+    re.compile(r"retry-after\W{0,3}([\d.]+)", re.IGNORECASE),
+)
+
+
+def _status_code(error):
+    for attribute in ('status_code', 'code'):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return int(value)
+    return None
+
+
+def is_rate_limit_error(error):
+    if _status_code(error) == 429:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+
+def is_retryable_error(error):
+    if is_rate_limit_error(error) or isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    message = str(error).lower()
+    if any(message.startswith(str(code)) for code in RETRYABLE_STATUS_CODES):
+        return True
+    return any(marker in message for marker in TRANSIENT_MARKERS)
+
+
+def parse_retry_after(error):
+    # Пауза, названная сервером: атрибут исключения, заголовок Retry-After или текст ошибки Gemini
+    value = getattr(error, 'retry_after', None)
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if headers is not None:
+        try:
+            header = headers.get('retry-after')
+            if header is not None:
+                return float(header)
+        except (AttributeError, TypeError, ValueError):
+            pass
+
+    message = str(error)
+    for pattern in _RETRY_DELAY_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class CircuitBreaker:
+    # Предохранитель провайдера: после 429 или серии ошибок все потоки ждут вместе, а не бьют в лимит по очереди
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD):
+        self.failure_threshold = failure_threshold
+        self._lock = threading.Lock()
+        self._open_until = 0.0
+        self._failures = 0
+        self.trips = 0
+        self.total_wait = 0.0
+
+    def remaining(self):
+        return max(0.0, self._open_until - time.monotonic())
+
+    def trip(self, seconds):
+        with self._lock:
+            now = time.monotonic()
+            if self._open_until <= now:
+                self.trips += 1
+            self._open_until = max(self._open_until, now + seconds)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            return self._failures >= self.failure_threshold
+
+    def wait(self):
+        waited = 0.0
+        while True:
+            with self._lock:
+                remaining = self._open_until - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(remaining)
+            waited += remaining
+        if waited:
+            with self._lock:
+                self.total_wait += waited
+        return waited
+
+
+class SharedCircuitBreaker(CircuitBreaker):
+    # Состояние предохранителя в общей памяти: пауза действует на все процессы пула
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD):
+        context = multiprocessing.get_context()
+        self._state = context.RawArray('d', 4)
+        super().__init__(failure_threshold)
+        self._lock = context.Lock()
+
+    @property
+    def _open_until(self):
+        return self._state[0]
+
+    @_open_until.setter
+    def _open_until(self, value):
+        self._state[0] = value
+
+    @property
+    def _failures(self):
+        return int(self._state[1])
+
+    @_failures.setter
+    def _failures(self, value):
+        self._state[1] = value
+
+    @property
+    def trips(self):
+        return int(self._state[2])
+
+    @trips.setter
+    def trips(self, value):
+        self._state[2] = value
+
+    @property
+    def total_wait(self):
+        return self._state[3]
+
+    @total_wait.setter
+    def total_wait(self, value):
+        self._state[3] = value
+
+
+class RetryPolicy:
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 breakers=None, seed=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Предохранитель на провайдера: 429 от Gemini не останавливает вызовы Giskard к OpenAI, и наоборот
+        self.breakers = dict(breakers or {})
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.backoff_seconds = 0.0
+        self.gave_up = 0
+
+    def breaker(self, provider=DEFAULT_PROVIDER):
+        with self._lock:
+            breaker = self.breakers.get(provider)
+            if breaker is None:
+                breaker = self.breakers[provider] = CircuitBreaker()
+            return breaker
+
+    def backoff_delay(self, attempt, error=None):
+        server_delay = parse_retry_after(error) if error is not None else None
+        with self._lock:
+            if server_delay is not None:
+                # Разброс поверх названной сервером паузы, чтобы потоки не вернулись в одну и ту же секунду;
+                # пауза сервера тоже ограничена max_delay
+                jitter = self._rng.uniform(0, min(1.0, 0.1 * server_delay + 0.1))
+                return min(self.max_delay, server_delay + jitter)
+            # Экспоненциальный рост с "equal jitter": половина паузы фиксирована, половина случайна
+            cap = min(self.max_delay, self.base_delay * 2 ** attempt)
+            return cap / 2 + self._rng.uniform(0, cap / 2)
+
+    def call(self, fn, *args, stage='llm', label=None, provider=DEFAULT_PROVIDER, **kwargs):
+        profiler = get_profiler()
+        breaker = self.breaker(provider)
+        attempt = 0
+        while True:
+            profiler.record_breaker_wait(stage, breaker.wait())
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable_error(e):
+                    raise
+                threshold_reached = breaker.record_failure()
+                if attempt >= self.max_retries:
+                    with self._lock:
+                        self.gave_up += 1
+                    raise
+                delay = self.backoff_delay(attempt, e)
+                attempt += 1
+                if is_rate_limit_error(e) or threshold_reached:
+                    breaker.trip(delay)
+                print(f"{label or 'Запрос к LLM'}, попытка {attempt}/{self.max_retries + 1}: {e} "
+                      f"(повтор через {delay:.1f} с)")
+                with self._lock:
+                    self.retries += 1
+                    self.backoff_seconds += delay
+                profiler.record_retry(stage, delay)
+                time.sleep(delay)
+                continue
+            breaker.record_success()
+            return result
+
+    def stats(self):
+        with self._lock:
+            breakers = dict(self.breakers)
+        return {
+            'retries': self.retries,
+            'backoff_seconds': round(self.backoff_seconds, 3),
+            'gave_up': self.gave_up,
+            'breaker_trips': sum(breaker.trips for breaker in breakers.values()),
+            'breaker_wait_seconds': round(sum(breaker.total_wait for breaker in breakers.values()), 3),
+            'breakers': {
+                provider: {'trips': breaker.trips, 'wait_seconds': round(breaker.total_wait, 3)}
+                for provider, breaker in sorted(breakers.items())
+            }
+        }
+
+
+class RetryingLLMClient:
+    wraps_llm_client = True
+
+    def __init__(self, client, stage, policy=None):
+        self._client = client
+        self.stage = stage
+        self._policy = policy
+
+    def complete(self, messages, temperature=1, max_tokens=None, caller_id=None, seed=None, format=None):
+        policy = self._policy or get_default_policy()
+        return policy.call(
+            self._client.complete, stage=self.stage, label=f"Giskard {caller_id or self.stage}", provider='openai',
+            messages=messages, temperature=temperature, max_tokens=max_tokens,
+            caller_id=caller_id, seed=seed, format=format
+        )
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._client, name)
+
+
+_default_policy = None
+_default_policy_lock = threading.Lock()
+
+
+def get_default_policy():
+    global _default_policy
+    with _default_policy_lock:
+        if _default_policy is None:
+            _default_policy = RetryPolicy(
+                max_retries=int(os.environ.get('LLM_RETRY_MAX_RETRIES', DEFAULT_MAX_RETRIES)),
+                base_delay=float(os.environ.get('LLM_RETRY_BASE_DELAY', DEFAULT_BASE_DELAY)),
+                max_delay=float(os.environ.get('LLM_RETRY_MAX_DELAY', DEFAULT_MAX_DELAY))
+            )
+        return _default_policy
+
+
+def set_default_policy(policy):
+    global _default_policy
+    with _default_policy_lock:
+        _default_policy = policy
+    return policy
@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+
+RUNS_DIR = 'runs'
+DEFAULT_FSYNC_EVERY = 10
+STAGES = ('questions', 'answers', 'evaluations')
+
+
+def new_run_id():
+    # Микросекунды: запуски, начатые в одну секунду (процессы пакета, параллельные команды cli), не делят каталог
+    return datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+
+
+def claim_run_id(base_dir=RUNS_DIR, prefix=''):
+    # Каталог нового запуска создается атомарно; если идентификатор уже занят, берется следующий
+    os.makedirs(base_dir, exist_ok=True)
+    while True:
+        run_id = new_run_id()
+        try:
+            os.mkdir(os.path.join(base_dir, prefix + run_id))
+        except FileExistsError:
+            continue
+        return run_id
+
+
+class RunLog:
+    # Журнал запуска: по одному append-only JSONL файлу на этап + meta.json
+    def __init__(self, run_id=None, base_dir=RUNS_DIR, fsync_every=DEFAULT_FSYNC_EVERY):
+        self.run_id = run_id or claim_run_id(base_dir)
+        self.path = os.path.join(base_dir, self.run_id)
+        self.fsync_every = fsync_every
+        self._lock = threading.Lock()
+        self._files = {}
+        self._pending = {}
+        os.makedirs(self.path, exist_ok=True)
+        self._meta = self._load_meta()
+
+    @classmethod
+    def resume(cls, run_id, base_dir=RUNS_DIR, fsync_every=DEFAULT_FSYNC_EVERY):
+        if not os.path.isdir(os.path.join(base_dir, run_id)):
+            raise FileNotFoundError(f"Запуск {run_id} не найден в {base_dir}")
+        return cls(run_id, base_dir=base_dir, fsync_every=fsync_every)
+
+    def _stage_path(self, stage):
+        if stage not in STAGES:
+            raise ValueError(f"Неизвестный этап: {stage}")
+        return os.path.join(self.path, f"{stage}.jsonl")
+
+    def _load_meta(self):
+        meta_path = os.path.join(self.path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return {}
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def get_meta(self, key, default=None):
+        return self._meta.get(key, default)
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._meta[key] = value
+            meta_path = os.path.join(self.path, 'meta.json')
+            tmp_path = meta_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._meta, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, meta_path)
+
+    def append(self, stage, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            f = self._files.get(stage)
+            if f is None:
+                f = open(self._stage_path(stage), 'a', encoding='utf-8')
+                self._files[stage] = f
+                self._pending[stage] = 0
+            f.write(line)
+            self._pending[stage] += 1
+            if self._pending[stage] >= self.fsync_every:
+                self._sync(stage)
+
+    def _sync(self, stage):
+        f = self._files[stage]
+        f.flush()
+        os.fsync(f.fileno())
+        self._pending[stage] = 0
+
+    def flush(self):
+        with self._lock:
+            for stage in self._files:
+                self._sync(stage)
+
+    def close(self):
+        with self._lock:
+            for stage, f in self._files.items():
+                self._sync(stage)
+                f.close()
+            self._files = {}
+
+    def read(self, stage):
+        # Последняя запись с тем же question_id побеждает; оборванная последняя строка пропускается
+        self.flush()
+        path = self._stage_path(stage)
+        if not os.path.exists(path):
+            return []
+        records = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[record['question_id']] = record
+        return [records[key] for key in sorted(records)]
+
+    def completed_ids(self, stage):
+        return {record['question_id'] for record in self.read(stage)}
+
+    def summary_path(self, prefix):
+        return os.path.join(self.path, f"{prefix}_{self.run_id}.json")
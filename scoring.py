@@ -0,0 +1,212 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from evaluation_store import make_evaluation_key
+from retrieval import tokenize
+
+
+PASS_THRESHOLD = 0.6
+FAIL_THRESHOLD = 0.15
+DEFAULT_JUDGE_CONCURRENCY = 4
+# Меняется вместе с правилами локальной оценки, чтобы старые вердикты в хранилище не переиспользовались
+SCORER_VERSION = 1
+
+# Служебные слова не должны давать совпадение между ответом и эталоном
+STOP_WORDS = set(tokenize(
+    "и в во не что он она оно они на я с со как а то все так его ее их но да ты к у же вы за бы по только "
+    "мне было вот от меня еще нет о из ему теперь когда даже ну ли если уже или ни быть был была были "
+    "него до вас нибудь опять уж вам ведь там потом себя ничего ей может тут где есть надо для мы тебя "
+    "чем сам чтобы без будто чего раз тоже себе под будет тогда кто этот того потому этого какой совсем "
+    "ним здесь этом один почти мой тем чтоб нее сейчас куда зачем всех никогда можно при наконец два об "
+    "другой хоть после над больше тот через эти нас про всего них какая много разве три эту моя впрочем "
+    "хорошо свою этой перед иногда лучше чуть том нельзя такой им более всегда конечно всю между это"
+))
+
+
+def _encode(texts, vocabulary):
+    rows = []
+    ids = []
+    for row, text in enumerate(texts):
+        for token in tokenize(text or ''):
+            if token not in STOP_WORDS:
+                rows.append(row)
+                ids.append(vocabulary.setdefault(token, len(vocabulary)))
+    return np.array(rows, dtype=np.int64), np.array(ids, dtype=np.int64)
+
+
+def token_f1_scores(answers, references):
+    # Все пары считаются разом: (строка, терм) кодируется одним int64, пересечение мультимножеств — через intersect1d
+    n = len(answers)
+    if n == 0:
+        return np.zeros(0, dtype=np.float64)
+    vocabulary = {}
+    answer_rows, answer_ids = _encode(answers, vocabulary)
+    reference_rows, reference_ids = _encode(references, vocabulary)
+    width = max(len(vocabulary), 1)
+
+    answer_keys, answer_counts = np.unique(answer_rows * width + answer_ids, return_counts=True)
+    reference_keys, reference_counts = np.unique(reference_rows * width + reference_ids, return_counts=True)
+    common, answer_index, reference_index = np.intersect1d(
+        answer_keys, reference_keys, assume_unique=True, return_indices=True
+    )
+    overlap = np.bincount(
+        common // width,
+        weights=np.minimum(answer_counts[answer_index], reference_counts[reference_index]),
+        minlength=n
+    )
+    answer_lengths = np.bincount(answer_rows, minlength=n)
+    reference_lengths = np.bincount(reference_rows, minlength=n)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(answer_lengths > 0, overlap / answer_lengths, 0.0)
+        recall = np.where(reference_lengths > 0, overlap / reference_lengths, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return f1
+
+
+class TieredScorer:
+    # Уровень 1: локальный token F1 по всем ответам; уровень 2: LLM-судья только для неуверенной полосы
+    def __init__(self, judge=None, pass_threshold=PASS_THRESHOLD, fail_threshold=FAIL_THRESHOLD,
+                 judge_concurrency=DEFAULT_JUDGE_CONCURRENCY, store=None):
+        self.judge = judge
+        self.store = store
+        self.pass_threshold = pass_threshold
+        self.fail_threshold = fail_threshold
+        self.judge_concurrency = judge_concurrency
+        self._lock = threading.Lock()
+        self._stats = {
+            'total': 0, 'reused': 0, 'local_pass': 0, 'local_fail': 0, 'judged': 0, 'judge_errors': 0,
+            'score_sum': 0.0, 'local_seconds': 0.0, 'judge_seconds': 0.0
+        }
+
+    def config(self):
+        # Все, от чего зависит вердикт при том же тексте: пороги, версия оценщика, модель и промпт судьи
+        return {
+            'scorer': 'tiered-token-f1',
+            'version': SCORER_VERSION,
+            'pass_threshold': self.pass_threshold,
+            'fail_threshold': self.fail_threshold,
+            'judge': getattr(self.judge, 'config', repr(self.judge)) if self.judge is not None else None
+        }
+
+    def _judge_one(self, item, score):
+        started = time.perf_counter()
+        try:
+            correctness, reason = self.judge(item['question'], item['answer'], item['reference'])
+            verdict = {'correctness': bool(correctness), 'correctness_reason': reason or '', 'verdict_source': 'judge'}
+            error = False
+        except Exception as e:
+            # Судья недоступен: решаем по середине неуверенной полосы, чтобы оценка не падала целиком
+            midpoint = (self.pass_threshold + self.fail_threshold) / 2
+            verdict = {
+                'correctness': bool(score >= midpoint),
+                'correctness_reason': f"LLM-судья недоступен: {e}",
+                'verdict_source': 'local_fallback'
+            }
+            error = True
+        with self._lock:
+            self._stats['judged'] += 1
+            self._stats['judge_errors'] += int(error)
+            self._stats['judge_seconds'] += time.perf_counter() - started
+        return verdict
+
+    def score(self, items):
+        # items: список словарей с ключами question, answer, reference и флагом has_reference
+        if self.store is None:
+            return self._score_fresh(items)
+
+        config = self.config()
+        keys = [make_evaluation_key(item['question'], item['reference'], item['answer'], config) for item in items]
+        stored = self.store.get_many(keys)
+        fresh = [i for i, key in enumerate(keys) if key not in stored]
+        verdicts = [None] * len(items)
+        for i, verdict in zip(fresh, self._score_fresh([items[i] for i in fresh])):
+            verdicts[i] = verdict
+        # Ответ по запасному правилу из-за ошибки судьи не сохраняем: в следующий раз судья попробует снова
+        self.store.put_many([
+            (keys[i], verdicts[i]) for i in fresh
+            if self.judge is None or verdicts[i]['verdict_source'] != 'local_fallback'
+        ])
+
+        reused_scores = 0.0
+        for i, key in enumerate(keys):
+            if verdicts[i] is None:
+                verdicts[i] = dict(stored[key])
+                reused_scores += verdicts[i].get('score', 0.0)
+        with self._lock:
+            self._stats['total'] += len(items) - len(fresh)
+            self._stats['reused'] += len(items) - len(fresh)
+            self._stats['score_sum'] += reused_scores
+        return verdicts
+
+    def _score_fresh(self, items):
+        if not items:
+            return []
+        started = time.perf_counter()
+        scores = token_f1_scores([item['answer'] for item in items], [item['reference'] for item in items])
+
+        verdicts = [None] * len(items)
+        uncertain = []
+        local_pass = local_fail = 0
+        for i, (item, score) in enumerate(zip(items, scores)):
+            score = float(score)
+            if not item['answer']:
+                verdicts[i] = {'correctness': False, 'correctness_reason': 'Пустой ответ', 'verdict_source': 'local'}
+                local_fail += 1
+            elif not item.get('has_reference', True) or self.fail_threshold < score < self.pass_threshold:
+                uncertain.append(i)
+            elif score >= self.pass_threshold:
+                verdicts[i] = {'correctness': True, 'correctness_reason': '', 'verdict_source': 'local'}
+                local_pass += 1
+            else:
+                verdicts[i] = {'correctness': False, 'correctness_reason': '', 'verdict_source': 'local'}
+                local_fail += 1
+        local_seconds = time.perf_counter() - started
+
+        if uncertain and self.judge is None:
+            for i in uncertain:
+                verdicts[i] = {
+                    'correctness': bool(scores[i] >= (self.pass_threshold + self.fail_threshold) / 2),
+                    'correctness_reason': '',
+                    'verdict_source': 'local_fallback'
+                }
+        elif uncertain:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.judge_concurrency, len(uncertain)))) as executor:
+                judged = executor.map(lambda i: self._judge_one(items[i], float(scores[i])), uncertain)
+                for i, verdict in zip(uncertain, judged):
+                    verdicts[i] = verdict
+
+        with self._lock:
+            self._stats['total'] += len(items)
+            self._stats['local_pass'] += local_pass
+            self._stats['local_fail'] += local_fail
+            self._stats['score_sum'] += float(scores.sum())
+            self._stats['local_seconds'] += local_seconds
+
+        for verdict, score in zip(verdicts, scores):
+            verdict['score'] = round(float(score), 4)
+        return verdicts
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats.pop('total')
+        score_sum = stats.pop('score_sum')
+        return {
+            'total': total,
+            'reused': stats['reused'],
+            'computed': total - stats['reused'],
+            'pass_threshold': self.pass_threshold,
+            'fail_threshold': self.fail_threshold,
+            'local_pass': stats['local_pass'],
+            'local_fail': stats['local_fail'],
+            'judged': stats['judged'],
+            'judge_errors': stats['judge_errors'],
+            'judge_call_rate': stats['judged'] / total if total else 0.0,
+            'mean_score': score_sum / total if total else 0.0,
+            'local_seconds': round(stats['local_seconds'], 6),
+            'judge_seconds': round(stats['judge_seconds'], 3)
+        }
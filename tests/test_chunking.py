@@ -0,0 +1,89 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chunking import MIN_CHUNKS, chunk_file, chunk_text, iter_chunks, iter_sentences  # noqa: E402
+from rate_limiter import estimate_tokens  # noqa: E402
+
+DIALOGUE = (
+    "— Куда ты? — спросил он. — Домой, — ответила она. Потом ушла.\n\n"
+    "Роман написал М. А. Булгаков, а издали его много позже. «Мастер и Маргарита» вышел в журнале. "
+    "Он сказал: «Приходи завтра». Она кивнула.\n\n"
+    "Новый абзац! — Правда? — Да."
+)
+
+
+def _sentences(text, **kwargs):
+    return [sentence for sentence, _ in iter_sentences(text, **kwargs)]
+
+
+def test_dialogue_dash_after_question_continues_the_line():
+    sentences = _sentences(DIALOGUE)
+    assert sentences[:3] == ['— Куда ты? — спросил он.', '— Домой, — ответила она.', 'Потом ушла.']
+    assert sentences[-2:] == ['— Правда?', '— Да.']
+
+
+def test_initials_do_not_end_sentence():
+    assert 'Роман написал М. А. Булгаков, а издали его много позже.' in _sentences(DIALOGUE)
+
+
+def test_guillemets_open_and_close_sentences():
+    sentences = _sentences(DIALOGUE)
+    assert '«Мастер и Маргарита» вышел в журнале.' in sentences
+    assert 'Он сказал: «Приходи завтра».' in sentences
+    assert 'Она кивнула.' in sentences
+
+
+def test_paragraph_breaks_are_reported():
+    starts = [sentence for sentence, new_paragraph in iter_sentences(DIALOGUE) if new_paragraph]
+    assert starts == ['— Куда ты? — спросил он.', 'Роман написал М. А. Булгаков, а издали его много позже.',
+                      'Новый абзац!']
+
+
+@pytest.mark.parametrize('block_size', [1, 2, 7, 64, 1 << 16])
+def test_chunks_do_not_depend_on_block_size(block_size):
+    text = DIALOGUE * 20
+    assert list(iter_sentences(text, block_size=block_size)) == list(iter_sentences(text))
+    assert list(iter_chunks(text, 40, 10, block_size=block_size)) == list(iter_chunks(text, 40, 10))
+
+
+def test_chunks_respect_budget_and_overlap():
+    # Короткие предложения одной длины: в перекрытие всегда помещается хвостовое предложение
+    text = ' '.join(f'Предложение номер {i}.' for i in range(100))
+    chunks = list(iter_chunks(text, 40, 10))
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 40 for chunk in chunks)
+    # Каждый следующий фрагмент начинается с хвостовых предложений предыдущего
+    for previous, current in zip(chunks, chunks[1:]):
+        first = _sentences(current)[0]
+        assert first in _sentences(previous)
+
+
+def test_long_sentence_is_split_by_words():
+    sentence = ' '.join(['слово'] * 200) + '.'
+    chunks = list(iter_chunks(sentence, 30, 0))
+    assert len(chunks) > 1
+    assert ' '.join(chunks).split() == sentence.split()
+
+
+def test_short_text_falls_back_to_word_chunks():
+    text = 'Короткий текст из одного предложения без точки'
+    chunks = chunk_text(text)
+    assert len(chunks) >= MIN_CHUNKS
+    assert ' '.join(chunks).split() == text.split()
+
+
+def test_single_word_stays_one_chunk():
+    assert chunk_text('Одно') == ['Одно']
+    assert chunk_text('   ') == []
+
+
+def test_chunk_file_matches_chunk_text(tmp_path):
+    path = tmp_path / 'book.txt'
+    text = DIALOGUE * 20
+    path.write_text(text, encoding='utf-8')
+    assert list(chunk_file(str(path), 40, 10)) == list(iter_chunks(text, 40, 10))
@@ -0,0 +1,87 @@
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dedup import QuestionDeduplicator, jaccard, make_deduplicator, normalize_question, shingle_hashes  # noqa: E402
+from fake_llm import fake_sentence  # noqa: E402
+
+QUESTIONS = [
+    "Кто такой Воланд в романе «Мастер и Маргарита»?",
+    "Почему Маргарита согласилась стать королевой бала?",
+    "Что сжег Мастер в своей квартире?",
+    "Кто такой Воланд в романе Мастер и Маргарита",
+    "Почему Маргарита согласилась стать королевой бала у Воланда?",
+    "Кто такой Азазелло?",
+    "Где работал Берлиоз?",
+    "Что Мастер сжег в своей квартире?",
+    "Чем закончился сеанс черной магии в Варьете?",
+    "Чем закончился сеанс чёрной магии в Варьете",
+]
+
+
+def brute_force(questions, threshold):
+    # Эталон без LSH: каждый вопрос сравнивается со всеми оставленными
+    kept = []
+    for question in questions:
+        hashes = shingle_hashes(question)
+        if all(jaccard(hashes, shingle_hashes(other)) < threshold for other in kept):
+            kept.append(question)
+    return kept
+
+
+def test_normalize_question():
+    assert normalize_question("  Чёрная МАГИЯ — в Варьете?!") == "черная магия в варьете"
+
+
+def test_paraphrases_dropped_distinct_kept():
+    deduplicator = QuestionDeduplicator(threshold=0.7)
+    kept, dropped = deduplicator.filter([{'question': q} for q in QUESTIONS])
+
+    assert [qa['question'] for qa in kept] == [
+        "Кто такой Воланд в романе «Мастер и Маргарита»?",
+        "Почему Маргарита согласилась стать королевой бала?",
+        "Что сжег Мастер в своей квартире?",
+        "Кто такой Азазелло?",
+        "Где работал Берлиоз?",
+        "Что Мастер сжег в своей квартире?",
+        "Чем закончился сеанс черной магии в Варьете?",
+    ]
+    # Перестановка слов дает Jaccard ~0.66 — ниже порога, такой вопрос остается
+    assert dropped[0] == ("Кто такой Воланд в романе Мастер и Маргарита",
+                          "Кто такой Воланд в романе «Мастер и Маргарита»?")
+    assert deduplicator.stats()['duplicates'] == 3
+
+
+def test_lsh_matches_brute_force():
+    # LSH вероятностный: на парах вдали от порога он обязан находить те же дубликаты, что и полный перебор
+    rng = random.Random(7)
+    questions = list(QUESTIONS)
+    for _ in range(40):
+        words = fake_sentence(rng, 14)[:-1].split()
+        questions.append(' '.join(words) + '?')
+        # Почти-копия: добавлено одно слово в конце
+        questions.append(' '.join(words + [fake_sentence(rng, 1)[:-1].lower()]))
+    rng.shuffle(questions)
+
+    hashes = [shingle_hashes(q) for q in questions]
+    similarities = [jaccard(a, b) for i, a in enumerate(hashes) for b in hashes[i + 1:]]
+    assert all(abs(similarity - 0.7) > 0.04 for similarity in similarities)
+
+    kept, _ = QuestionDeduplicator(threshold=0.7).filter([{'question': q} for q in questions])
+    assert [qa['question'] for qa in kept] == brute_force(questions, 0.7)
+    assert len(kept) < len(questions) - 30
+
+
+def test_lsh_compares_only_candidates():
+    deduplicator = QuestionDeduplicator()
+    rng = random.Random(1)
+    for _ in range(200):
+        deduplicator.add(fake_sentence(rng, 10))
+    assert deduplicator.comparisons < 200
+
+
+def test_threshold_one_disables_filter():
+    assert make_deduplicator(1.0) is None
@@ -0,0 +1,97 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from embedding_store import CachedEmbedding, EmbeddingStore  # noqa: E402
+
+DIMENSION = 3
+
+
+def vectors(*rows):
+    return np.array(rows, dtype=np.float32)
+
+
+@pytest.fixture
+def store_dir(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put_many(['a', 'b', 'c'], vectors([1, 1, 1], [2, 2, 2], [3, 3, 3]))
+    store.close()
+    return str(tmp_path)
+
+
+def vector_path(store_dir):
+    return os.path.join(store_dir, f"vectors_{DIMENSION}.f32")
+
+
+def test_round_trip(store_dir):
+    store = EmbeddingStore(store_dir)
+    found = store.get_many(['a', 'c', 'нет'])
+    assert sorted(found) == ['a', 'c']
+    np.testing.assert_array_equal(found['c'], [3, 3, 3])
+    assert (store.hits, store.misses) == (2, 1)
+    store.close()
+
+
+def test_reopens_after_torn_tail_and_appends_aligned(store_dir):
+    # Сбой посреди записи: в файле полвектора сверх трех целых
+    with open(vector_path(store_dir), 'ab') as f:
+        f.write(np.array([9, 9], dtype=np.float32).tobytes())
+
+    store = EmbeddingStore(store_dir)
+    found = store.get_many(['a', 'b', 'c'])
+    np.testing.assert_array_equal(np.stack([found[k] for k in 'abc']), vectors([1, 1, 1], [2, 2, 2], [3, 3, 3]))
+
+    store.put_many(['d'], vectors([4, 1, 2]))
+    np.testing.assert_array_equal(store.get_many(['d'])['d'], [4, 1, 2])
+    assert os.path.getsize(vector_path(store_dir)) == 4 * 4 * DIMENSION
+    store.close()
+
+
+def test_file_cut_mid_record_keeps_intact_prefix(store_dir):
+    # Файл обрезан посреди третьего вектора, а индекс еще указывает на него
+    os.truncate(vector_path(store_dir), 4 * DIMENSION * 2 + 4)
+
+    store = EmbeddingStore(store_dir)
+    found = store.get_many(['a', 'b', 'c'])
+    assert sorted(found) == ['a', 'b']
+    np.testing.assert_array_equal(found['b'], [2, 2, 2])
+
+    # Потерянный вектор досчитывается и ложится на место оборванного, не смешиваясь со старой записью индекса
+    store.put_many(['c', 'e'], vectors([30, 30, 30], [5, 5, 5]))
+    found = store.get_many(['a', 'b', 'c', 'e'])
+    np.testing.assert_array_equal(np.stack([found[k] for k in 'abce']),
+                                  vectors([1, 1, 1], [2, 2, 2], [30, 30, 30], [5, 5, 5]))
+    store.close()
+
+
+def test_empty_vector_file(store_dir):
+    os.truncate(vector_path(store_dir), 0)
+    store = EmbeddingStore(store_dir)
+    assert store.get_many(['a']) == {}
+    store.close()
+
+
+def test_cached_embedding_computes_only_missing(tmp_path):
+    class Embedding:
+        model_name = 'fake-embedding'
+
+        def __init__(self):
+            self.calls = []
+
+        def embed(self, texts):
+            self.calls.append(list(texts))
+            return np.array([[len(text), 0, 1] for text in texts], dtype=np.float32)
+
+    embedding = Embedding()
+    cached = CachedEmbedding(embedding, EmbeddingStore(str(tmp_path)))
+    first = cached.embed(['Воланд', 'Мастер'])
+    second = cached.embed(['Мастер', 'Маргарита', 'Мастер'])
+    assert embedding.calls == [['Воланд', 'Мастер'], ['Маргарита']]
+    np.testing.assert_array_equal(second[0], first[1])
+    assert second.shape == (3, DIMENSION)
+    cached.store.close()
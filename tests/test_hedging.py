@@ -0,0 +1,150 @@
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from hedging import HEDGE_STAGE, HedgedModel  # noqa: E402
+from instrumentation import RunProfiler, get_profiler, set_profiler  # noqa: E402
+from rate_limiter import TokenBucketLimiter, set_llm_client_limiter  # noqa: E402
+
+SLOW_SECONDS = 2.0
+
+
+class SlowModel:
+    # Основная модель отвечает, только когда тест ее отпустит (или по таймауту)
+    model_name = 'slow'
+
+    def __init__(self):
+        self.released = threading.Event()
+        self.calls = 0
+
+    def release_later(self, seconds=0.1):
+        threading.Timer(seconds, self.released.set).start()
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        self.released.wait(SLOW_SECONDS)
+        return SimpleNamespace(text='медленный ответ')
+
+
+class FastModel:
+    model_name = 'fast'
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(
+            text='быстрый ответ',
+            usage_metadata=SimpleNamespace(prompt_token_count=12, candidates_token_count=5)
+        )
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def _hedged(primary, fallback):
+    # Окно заполнено заранее: порог дубликата ~10 мс, бюджет не мешает первому вызову
+    model = HedgedModel(primary, fallback, budget=1.0, min_samples=5)
+    model._window.extend([0.01] * 5)
+    return model
+
+
+def _exhausted_limiter():
+    limiter = TokenBucketLimiter(1)
+    assert limiter.try_acquire()
+    return limiter
+
+
+@pytest.fixture
+def profiler():
+    previous = get_profiler()
+    set_llm_client_limiter(None)
+    yield set_profiler(RunProfiler())
+    set_profiler(previous)
+    set_llm_client_limiter(None)
+
+
+def test_slow_primary_loses_to_fast_fallback(profiler):
+    primary, fallback = SlowModel(), FastModel()
+    model = _hedged(primary, fallback)
+
+    started = time.perf_counter()
+    response = model.generate_content('вопрос')
+    elapsed = time.perf_counter() - started
+    primary.released.set()
+
+    assert response.text == 'быстрый ответ'
+    assert elapsed < SLOW_SECONDS / 2
+    stats = model.hedge_stats()
+    assert stats['hedges'] == 1
+    assert stats['hedge_wins'] == 1
+    assert stats['extra_calls'] == 1
+
+
+def test_hedge_call_is_recorded_in_profiler(profiler):
+    primary, fallback = SlowModel(), FastModel()
+    model = _hedged(primary, fallback)
+
+    model.generate_content('вопрос')
+    primary.released.set()
+
+    hedge = profiler.to_dict()['stages'][HEDGE_STAGE]
+    assert hedge['calls'] == 1
+    assert hedge['input_tokens'] == 12
+    assert hedge['output_tokens'] == 5
+
+
+def test_failed_hedge_call_is_recorded_as_error(profiler):
+    primary, fallback = SlowModel(), FastModel(error=ConnectionError('сбой'))
+    model = _hedged(primary, fallback)
+    primary.release_later()
+
+    assert model.generate_content('вопрос').text == 'медленный ответ'
+    assert profiler.to_dict()['stages'][HEDGE_STAGE]['errors'] == 1
+
+
+def test_stage_limiter_bounds_fallback_outside_batch_mode(profiler):
+    primary, fallback = SlowModel(), FastModel()
+    model = _hedged(primary, fallback)
+    model.set_limiter(_exhausted_limiter())
+    primary.release_later()
+
+    response = model.generate_content('вопрос')
+
+    assert response.text == 'медленный ответ'
+    assert fallback.calls == 0
+    assert model.hedge_stats()['limiter_denied'] == 1
+
+
+def test_batch_limiter_takes_precedence_for_fallback(profiler):
+    primary, fallback = SlowModel(), FastModel()
+    model = _hedged(primary, fallback)
+    model.set_limiter(_exhausted_limiter())
+    set_llm_client_limiter(TokenBucketLimiter(60))
+
+    response = model.generate_content('вопрос')
+    primary.released.set()
+
+    assert response.text == 'быстрый ответ'
+    assert model.hedge_stats()['limiter_denied'] == 0
+
+
+def test_rate_limited_primary_fails_over_to_fallback(profiler):
+    fallback = FastModel()
+    model = _hedged(FastModel(error=RateLimitError('429 Too Many Requests')), fallback)
+
+    assert model.generate_content('вопрос').text == 'быстрый ответ'
+    assert fallback.calls == 1
+    assert model.hedge_stats()['failovers'] == 1
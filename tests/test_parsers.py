@@ -0,0 +1,73 @@
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from gemini_answer_generation import _extract_json, answer_batch, parse_batch_response  # noqa: E402
+from rate_limiter import TokenBucketLimiter  # noqa: E402
+
+
+class ScriptedModel:
+    # Отвечает заготовленными текстами по порядку вызовов
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.prompts = []
+
+    def generate_content(self, contents, **kwargs):
+        self.prompts.append(contents)
+        return SimpleNamespace(text=self.replies.pop(0), usage_metadata=None)
+
+
+def test_extract_json_fenced():
+    text = "Вот ответы:\n```json\n{\"answers\": {\"0\": \"Воланд\"}}\n```\nГотово."
+    assert _extract_json(text) == {'answers': {'0': 'Воланд'}}
+
+
+def test_extract_json_text_around_list():
+    assert _extract_json('Ответ: [{"id": 1, "answer": "Да"}] конец') == [{'id': 1, 'answer': 'Да'}]
+
+
+def test_parse_fenced_answers_dict():
+    text = "```json\n{\"answers\": {\"0\": \"Воланд\", \"1\": \"Маргарита\"}}\n```"
+    assert parse_batch_response(text, [0, 1]) == {0: 'Воланд', 1: 'Маргарита'}
+
+
+def test_parse_list_instead_of_dict():
+    text = json.dumps([
+        {'question_id': 0, 'answer': ' Понтий Пилат '},
+        {'id': '1', 'answer': 'Иешуа'},
+        'мусор'
+    ], ensure_ascii=False)
+    assert parse_batch_response(text, [0, 1]) == {0: 'Понтий Пилат', 1: 'Иешуа'}
+
+
+def test_parse_bracketed_keys():
+    text = json.dumps({'[3]': 'Бегемот', 'Вопрос [4]': {'answer': 'Коровьев'}}, ensure_ascii=False)
+    assert parse_batch_response(text, [3, 4]) == {3: 'Бегемот', 4: 'Коровьев'}
+
+
+def test_parse_ignores_unexpected_and_empty():
+    text = json.dumps({'0': 'Азазелло', '7': 'лишний', '1': '  '}, ensure_ascii=False)
+    assert parse_batch_response(text, [0, 1]) == {0: 'Азазелло'}
+
+
+def test_parse_truncated_reply():
+    assert parse_batch_response('{"answers": {"0": "Воланд", "1": "Марг', [0, 1]) == {}
+    assert parse_batch_response(None, [0]) == {}
+
+
+def test_answer_batch_falls_back_for_missing_ids():
+    batch = [(0, {'question': 'Кто такой Воланд?', 'answer': 'Сатана'}),
+             (1, {'question': 'Кто написал роман о Пилате?', 'answer': 'Мастер'})]
+    model = ScriptedModel(['{"0": "Воланд — это сатана"}', 'Роман о Пилате написал Мастер'])
+    records, stats = answer_batch(model, batch, "Отрывок.", TokenBucketLimiter(10 ** 6))
+
+    assert len(model.prompts) == 2
+    assert {r['question_id']: r['gemini_answer'] for r in records} == {
+        0: 'Воланд — это сатана', 1: 'Роман о Пилате написал Мастер'
+    }
+    assert stats['answered_in_batch'] == 1
+    assert stats['fallback_questions'] == 1
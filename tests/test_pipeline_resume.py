@@ -0,0 +1,73 @@
+import os
+import queue
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pipeline  # noqa: E402
+from dedup import QuestionDeduplicator  # noqa: E402
+from fake_llm import fake_sentence  # noqa: E402
+from run_store import RunLog  # noqa: E402
+
+
+def replayed_questions(interrupt_after=None):
+    # Как генерация на кэше LLM с фиксированным seed: каждый запуск отдает тот же поток вопросов с начала
+    def iter_questions(excerpt, num_questions, workers=1):
+        for position in range(num_questions):
+            if position == interrupt_after:
+                raise KeyboardInterrupt
+            rng = random.Random(position)
+            yield {'question': fake_sentence(rng, 10)[:-1] + '?', 'answer': fake_sentence(rng),
+                   'sample_key': f"0:{position}"}
+    return iter_questions
+
+
+def produce(run_log, num_questions, deduplicator):
+    questions, errors = [], []
+    pipeline._produce_questions_inner(
+        "Отрывок.", num_questions, queue.Queue(), questions, pipeline.StageStats('questions'), errors, 0, run_log,
+        deduplicator, 1
+    )
+    return questions, errors
+
+
+def test_resume_continues_after_logged_questions(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, 'iter_questions', replayed_questions(interrupt_after=10))
+    run_log = RunLog('20260101_000000', base_dir=str(tmp_path))
+    try:
+        produce(run_log, 20, QuestionDeduplicator())
+    except KeyboardInterrupt:
+        pass
+    run_log.close()
+    assert len(run_log.read('questions')) == 10
+    assert not run_log.get_meta('questions_complete')
+
+    monkeypatch.setattr(pipeline, 'iter_questions', replayed_questions())
+    resumed = RunLog.resume('20260101_000000', base_dir=str(tmp_path))
+    deduplicator = QuestionDeduplicator()
+    questions, errors = produce(resumed, 20, deduplicator)
+    resumed.close()
+
+    assert not errors
+    assert [qa['question_id'] for qa in questions] == list(range(20))
+    assert len({qa['question'] for qa in questions}) == 20
+    assert deduplicator.stats()['duplicates'] == 0
+    assert [qa['question_id'] for qa in resumed.read('questions')] == list(range(20))
+    assert resumed.get_meta('questions_complete')
+
+
+def test_resume_without_sample_keys_skips_logged_prefix(tmp_path, monkeypatch):
+    # Журнал старого формата: вопросы записаны без sample_key
+    run_log = RunLog('20260101_000000', base_dir=str(tmp_path))
+    for i, qa in enumerate(replayed_questions()("Отрывок.", 5)):
+        run_log.append('questions', {'question': qa['question'], 'answer': qa['answer'], 'question_id': i})
+    run_log.close()
+
+    monkeypatch.setattr(pipeline, 'iter_questions', replayed_questions())
+    resumed = RunLog.resume('20260101_000000', base_dir=str(tmp_path))
+    questions, _ = produce(resumed, 8, None)
+    resumed.close()
+    assert len(questions) == 8
+    assert len({qa['question'] for qa in questions}) == 8
@@ -0,0 +1,15 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import giskard_question_generation  # noqa: E402
+
+
+def test_generate_questions_without_openai_client(monkeypatch):
+    def missing_key():
+        raise RuntimeError("Missing credentials")
+
+    monkeypatch.setattr(giskard_question_generation, 'configure_giskard_llm', missing_key)
+    assert giskard_question_generation.generate_questions("Отрывок. " * 20) == []
@@ -0,0 +1,88 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from question_sharding import iter_sharded_samples, shard_quotas, split_documents  # noqa: E402
+
+
+def generator_totals(quotas, num_generators):
+    return [sum(n for (g, _), n in quotas.items() if g == generator) for generator in range(num_generators)]
+
+
+@pytest.mark.parametrize('num_questions, num_generators, shard_sizes', [
+    (20, 2, [5, 5, 5, 5]),
+    (7, 2, [4, 4, 4]),
+    (11, 3, [3, 7, 2, 9]),
+    (3, 2, [5, 5, 5, 5]),
+    (5, 2, [1] * 12),
+    (1, 2, [2, 2]),
+])
+def test_quotas_sum_to_num_questions(num_questions, num_generators, shard_sizes):
+    quotas = shard_quotas(num_questions, num_generators, shard_sizes)
+    assert sum(quotas.values()) == num_questions
+    assert all(n > 0 for n in quotas.values())
+    assert all(shard < len(shard_sizes) for _, shard in quotas)
+    # Типы вопросов сбалансированы как в generate_testset: поровну, остаток — первым генераторам
+    totals = generator_totals(quotas, num_generators)
+    assert max(totals) - min(totals) <= 1
+    assert totals == sorted(totals, reverse=True)
+
+
+def test_quotas_follow_shard_sizes():
+    quotas = shard_quotas(20, 1, [10, 30])
+    assert quotas == {(0, 0): 5, (0, 1): 15}
+
+
+def test_more_shards_than_questions_spread_across_shards():
+    quotas = shard_quotas(4, 2, [1] * 10)
+    assert sum(quotas.values()) == 4
+    # Остатки сдвигаются по генераторам: вопросы не копятся в первых шардах
+    assert len({shard for _, shard in quotas}) == 4
+
+
+def test_zero_questions():
+    assert shard_quotas(0, 2, [3, 3]) == {}
+
+
+def test_split_documents_contiguous():
+    shards = split_documents(list(range(10)), 3)
+    assert [len(shard) for shard in shards] == [3, 3, 4]
+    assert sum(shards, []) == list(range(10))
+    assert split_documents(list(range(2)), 5) == [[0], [1]]
+
+
+def test_iter_sharded_samples_keys_are_deterministic():
+    class KnowledgeBase:
+        topics = {0: 'тема'}
+        _index = object()
+
+        def __init__(self):
+            self._documents = [f"doc_{i}" for i in range(8)]
+
+        def __len__(self):
+            return len(self._documents)
+
+    class Generator:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_questions(self, knowledge_base, num_questions, **kwargs):
+            for _ in range(num_questions):
+                yield {'question': f"{self.name}: {knowledge_base.get_random_document()}?"}
+
+    def run(workers):
+        samples = iter_sharded_samples(KnowledgeBase(), 10, [Generator('simple'), Generator('complex')],
+                                       workers=workers, num_shards=3, seed=1234)
+        return sorted(samples, key=lambda item: item[0])
+
+    first = run(workers=1)
+    assert len(first) == 10
+    assert run(workers=3) == first
+    # Seed-документы шарда берутся только из его доли фрагментов
+    shards = split_documents([f"doc_{i}" for i in range(8)], 3)
+    for (_, shard, _), sample in first:
+        assert sample['question'].split(': ')[1][:-1] in shards[shard]
@@ -0,0 +1,124 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import rate_limiter  # noqa: E402
+from rate_limiter import (  # noqa: E402
+    RateLimitedLLMClient, SharedTokenBucketLimiter, TokenBucketLimiter, estimate_tokens, set_llm_client_limiter
+)
+
+
+class FakeClock:
+    # Подменяет time.monotonic и time.sleep модуля: ожидание лимитера сдвигает часы, а не спит
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, 'sleep', clock.sleep)
+    return clock
+
+
+@pytest.fixture(params=[TokenBucketLimiter, SharedTokenBucketLimiter])
+def limiter_class(request):
+    return request.param
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('абвгдеж') == 3
+
+
+def test_burst_up_to_capacity_then_waits(clock, limiter_class):
+    limiter = limiter_class(60)
+    assert [limiter.acquire() for _ in range(60)] == [0.0] * 60
+    # Ведро пусто: следующий запрос ждет одну секунду при 60 RPM
+    assert limiter.acquire() == pytest.approx(1.0)
+    assert limiter.total_wait == pytest.approx(1.0)
+
+
+def test_refill_is_capped(clock, limiter_class):
+    limiter = limiter_class(60, tokens_per_minute=600)
+    for _ in range(60):
+        limiter.acquire()
+    clock.now += 3600
+    # Час простоя не копит больше одной минуты квоты
+    assert [limiter.acquire() for _ in range(60)] == [0.0] * 60
+    assert limiter.acquire() > 0
+
+
+def test_tokens_limit_wait(clock, limiter_class):
+    limiter = limiter_class(1000, tokens_per_minute=600)
+    assert limiter.acquire(600) == 0.0
+    # 300 токенов при 600 TPM набираются за 30 секунд
+    assert limiter.acquire(300) == pytest.approx(30.0)
+
+
+def test_request_larger_than_capacity_does_not_hang(clock, limiter_class):
+    limiter = limiter_class(60, tokens_per_minute=100)
+    assert limiter.acquire(10 ** 6) == 0.0
+
+
+def test_adjust_charges_extra_tokens(clock, limiter_class):
+    limiter = limiter_class(1000, tokens_per_minute=600)
+    limiter.acquire(100)
+    limiter.adjust(200)
+    assert limiter._token_allowance == pytest.approx(300)
+
+
+def test_negative_adjust_is_clamped_to_capacity(clock, limiter_class):
+    limiter = limiter_class(1000, tokens_per_minute=600)
+    limiter.acquire(100)
+    limiter.adjust(-10 ** 6)
+    assert limiter._token_allowance == pytest.approx(600)
+
+
+def test_adjust_without_token_limit_is_noop(clock):
+    limiter = TokenBucketLimiter(60)
+    limiter.adjust(500)
+    assert limiter._token_allowance == 0.0
+
+
+def test_try_acquire_does_not_wait(clock, limiter_class):
+    limiter = limiter_class(2)
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire()
+    assert clock.slept == 0.0
+    clock.now += 30
+    assert limiter.try_acquire()
+
+
+def test_rate_limited_client_uses_active_limiter(clock):
+    class Client:
+        model = 'fake-gpt'
+
+        def complete(self, messages, **kwargs):
+            return SimpleNamespace(content='ответ')
+
+    limiter = TokenBucketLimiter(1)
+    client = RateLimitedLLMClient(Client())
+    messages = [SimpleNamespace(content='вопрос')]
+    set_llm_client_limiter(limiter)
+    try:
+        client.complete(messages)
+        client.complete(messages)
+    finally:
+        set_llm_client_limiter(None)
+    assert limiter.total_wait == pytest.approx(60.0)
+    assert client.model == 'fake-gpt'
@@ -0,0 +1,92 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import results_store  # noqa: E402
+from results_store import ResultsStore, record_run_results, run_date_for, run_key  # noqa: E402
+from run_store import RunLog  # noqa: E402
+
+
+def _results(correct):
+    return [
+        {'question_id': i, 'question': f'Вопрос {i}?', 'gemini_answer': 'ответ', 'reference_answer': 'ответ',
+         'correctness': ok, 'score': 1.0 if ok else 0.0, 'verdict_source': 'local', 'latency_ms': 10.0 * (i + 1),
+         'prompt_tokens': 100, 'output_tokens': 20}
+        for i, ok in enumerate(correct)
+    ]
+
+
+def test_run_date_for_uses_run_id():
+    assert run_date_for('20260102_030405_123456') == '2026-01-02'
+    assert run_date_for('batch_20251231_235959/anna') == '2025-12-31'
+
+
+def test_run_key_keeps_batch_prefix(monkeypatch, tmp_path):
+    monkeypatch.setattr(results_store, 'RUNS_DIR', str(tmp_path))
+    run_log = RunLog('anna', base_dir=str(tmp_path / 'batch_20260101_000000'))
+    assert run_key(run_log) == 'batch_20260101_000000/anna'
+    run_log.close()
+
+    outside = RunLog('20260101_000000', base_dir=str(tmp_path.parent / 'elsewhere'))
+    assert run_key(outside) == '20260101_000000'
+    outside.close()
+
+
+def test_record_run_results_warns_without_pyarrow(monkeypatch, tmp_path, capsys):
+    def missing():
+        raise ImportError('для хранилища результатов нужен pyarrow (No module named pyarrow)')
+
+    monkeypatch.setattr(results_store, '_pyarrow', missing)
+    monkeypatch.setenv('RESULTS_STORE_DIR', str(tmp_path / 'results'))
+    run_log = RunLog('20260101_000000', base_dir=str(tmp_path / 'runs'))
+
+    assert record_run_results(run_log, _results([True])) is None
+    assert 'Результаты не добавлены в хранилище' in capsys.readouterr().out
+    assert not (tmp_path / 'results').exists()
+    run_log.close()
+
+
+def test_round_trip_and_trends(tmp_path):
+    # exc_type=ImportError: несовместимая сборка pyarrow (например, под другой NumPy) тоже пропускает тест
+    pytest.importorskip('pyarrow', exc_type=ImportError)
+    store = ResultsStore(str(tmp_path / 'results'))
+    store.write_run('20260101_120000', _results([True, False]))
+    store.write_run('batch_20260102_080000/anna', _results([True, True, True, False]))
+    # Повторная оценка перезаписывает файл запуска, а не дописывает строки
+    store.write_run('20260101_120000', _results([True, True]))
+
+    assert store.has_run('batch_20260102_080000/anna')
+    table = store.dataset().to_table()
+    assert table.num_rows == 6
+    assert sorted(set(table['run_date'].to_pylist())) == ['2026-01-01', '2026-01-02']
+
+    rows = store.trends(by='run')
+    assert [row['run'] for row in rows] == ['20260101_120000', 'batch_20260102_080000/anna']
+    assert [row['accuracy'] for row in rows] == [1.0, 0.75]
+    assert rows[1]['tokens_per_question'] == 120
+    assert rows[1]['latency_p50_ms'] is not None
+
+    assert [row['day'] for row in store.trends(by='day', since='2026-01-02')] == ['2026-01-02']
+    assert [row['run'] for row in store.trends(by='run', last=1)] == ['batch_20260102_080000/anna']
+    with pytest.raises(ValueError):
+        store.trends(by='week')
+
+
+def test_backfill_skips_stored_runs(tmp_path):
+    pytest.importorskip('pyarrow', exc_type=ImportError)
+    runs_dir = tmp_path / 'runs'
+    for run_id in ('20260101_000000', '20260103_000000'):
+        run_log = RunLog(run_id, base_dir=str(runs_dir))
+        for record in _results([True, False]):
+            run_log.append('evaluations', record)
+        run_log.close()
+    store = ResultsStore(str(tmp_path / 'results'))
+    store.write_run('20260101_000000', _results([True]))
+
+    assert store.backfill(str(runs_dir)) == 1
+    assert store.backfill(str(runs_dir)) == 0
+    assert [row['questions'] for row in store.trends()] == [1, 2]
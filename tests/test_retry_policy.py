@@ -0,0 +1,149 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import retry_policy  # noqa: E402
+from retry_policy import (  # noqa: E402
+    CircuitBreaker, RetryPolicy, SharedCircuitBreaker, is_rate_limit_error, is_retryable_error, parse_retry_after
+)
+
+
+class HTTPError(Exception):
+    def __init__(self, message, status_code=None, headers=None):
+        super().__init__(message)
+        self.status_code = status_code
+        if headers is not None:
+            self.response = SimpleNamespace(headers=headers)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(retry_policy.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(retry_policy.time, 'sleep', clock.sleep)
+    return clock
+
+
+def flaky(errors, result='ok'):
+    errors = list(errors)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    fn.calls = calls
+    return fn
+
+
+def test_parse_retry_after_sources():
+    assert parse_retry_after(SimpleNamespace(retry_after=7)) == 7.0
+    assert parse_retry_after(HTTPError('429', 429, headers={'retry-after': '12'})) == 12.0
+    assert parse_retry_after(Exception("429 Quota exceeded. Please retry in 31.5s.")) == 31.5
+    assert parse_retry_after(Exception("retry_delay {\n  seconds: 44\n}")) == 44.0
+    assert parse_retry_after(Exception("Retry-After: 3")) == 3.0
+    assert parse_retry_after(Exception("400 Bad request")) is None
+    assert parse_retry_after(HTTPError('429', 429, headers={'retry-after': 'Wed, 21 Oct 2026 07:28:00 GMT'})) is None
+
+
+def test_error_classification():
+    assert is_rate_limit_error(HTTPError('too many', 429))
+    assert is_rate_limit_error(Exception("Resource has been exhausted (e.g. check quota)."))
+    assert is_retryable_error(HTTPError('bad gateway', 502))
+    assert is_retryable_error(TimeoutError())
+    assert is_retryable_error(Exception("503 Service Unavailable"))
+    assert not is_retryable_error(HTTPError('bad request', 400))
+    assert not is_retryable_error(ValueError("Ответ заблокирован фильтром безопасности"))
+
+
+def test_backoff_grows_and_is_capped():
+    policy = RetryPolicy(base_delay=2.0, max_delay=10.0, seed=1)
+    for attempt, cap in enumerate([2.0, 4.0, 8.0, 10.0, 10.0]):
+        delay = policy.backoff_delay(attempt)
+        assert cap / 2 <= delay <= cap
+
+
+def test_server_delay_is_used_and_clamped():
+    policy = RetryPolicy(max_delay=60.0, seed=1)
+    assert 30.0 <= policy.backoff_delay(0, Exception("retry in 30s")) <= 31.0
+    assert policy.backoff_delay(0, Exception("retry in 3600s")) == 60.0
+
+
+def test_retries_then_succeeds(clock):
+    policy = RetryPolicy(max_retries=3, base_delay=1.0, seed=1)
+    fn = flaky([HTTPError('503 unavailable', 503), TimeoutError()])
+    assert policy.call(fn) == 'ok'
+    assert len(fn.calls) == 3
+    assert policy.stats()['retries'] == 2
+    assert policy.stats()['gave_up'] == 0
+
+
+def test_non_retryable_error_raises_immediately(clock):
+    policy = RetryPolicy()
+    fn = flaky([HTTPError('bad request', 400)])
+    with pytest.raises(HTTPError):
+        policy.call(fn)
+    assert len(fn.calls) == 1
+    assert clock.sleeps == []
+
+
+def test_gives_up_after_max_retries(clock):
+    policy = RetryPolicy(max_retries=2, base_delay=1.0, seed=1)
+    fn = flaky([TimeoutError()] * 5)
+    with pytest.raises(TimeoutError):
+        policy.call(fn)
+    assert len(fn.calls) == 3
+    assert policy.stats()['gave_up'] == 1
+
+
+def test_rate_limit_trips_only_its_provider(clock):
+    policy = RetryPolicy(max_retries=1, max_delay=60.0, seed=1)
+    policy.call(flaky([HTTPError('429 retry in 20s', 429)]), provider='gemini')
+
+    # Пауза Gemini выдержана в повторе; следующий вызов Gemini ждет остаток, вызов OpenAI — нет
+    policy.breaker('gemini').trip(15.0)
+    before = len(clock.sleeps)
+    assert policy.call(flaky([]), provider='openai') == 'ok'
+    assert len(clock.sleeps) == before
+    assert policy.call(flaky([]), provider='gemini') == 'ok'
+    assert clock.sleeps[-1] == pytest.approx(15.0)
+
+    stats = policy.stats()
+    assert stats['breakers']['gemini']['trips'] == 2
+    assert stats['breakers']['openai']['trips'] == 0
+    assert stats['breaker_trips'] == 2
+
+
+def test_failure_threshold_trips_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=2)
+    policy = RetryPolicy(max_retries=3, base_delay=1.0, breakers={'gemini': breaker}, seed=1)
+    policy.call(flaky([TimeoutError(), TimeoutError()]))
+    assert breaker.trips == 1
+    assert breaker._failures == 0
+
+
+def test_shared_breaker_state(clock):
+    breaker = SharedCircuitBreaker()
+    breaker.trip(5.0)
+    assert breaker.remaining() == pytest.approx(5.0)
+    assert breaker.wait() == pytest.approx(5.0)
+    assert (breaker.trips, breaker.total_wait) == (1, pytest.approx(5.0))
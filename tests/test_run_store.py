@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from results_store import run_date_for  # noqa: E402
+from run_store import RunLog  # noqa: E402
+
+
+def test_run_log_last_record_wins(tmp_path):
+    run_log = RunLog('20260101_000000', base_dir=str(tmp_path))
+    run_log.append('answers', {'question_id': 1, 'gemini_answer': 'первый'})
+    run_log.append('answers', {'question_id': 0, 'gemini_answer': 'ноль'})
+    run_log.append('answers', {'question_id': 1, 'gemini_answer': 'повтор'})
+    run_log.close()
+
+    resumed = RunLog.resume('20260101_000000', base_dir=str(tmp_path))
+    assert [r['gemini_answer'] for r in resumed.read('answers')] == ['ноль', 'повтор']
+    assert resumed.completed_ids('answers') == {0, 1}
+    resumed.close()
+
+
+def test_run_log_skips_torn_last_line(tmp_path):
+    run_log = RunLog('20260101_000000', base_dir=str(tmp_path))
+    run_log.append('questions', {'question_id': 0, 'question': 'Кто?'})
+    run_log.close()
+    with open(os.path.join(run_log.path, 'questions.jsonl'), 'a', encoding='utf-8') as f:
+        f.write('{"question_id": 1, "quest')
+
+    resumed = RunLog.resume('20260101_000000', base_dir=str(tmp_path))
+    assert resumed.completed_ids('questions') == {0}
+    resumed.close()
+
+
+def test_run_log_resume_missing_run(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        RunLog.resume('нет_такого', base_dir=str(tmp_path))
+
+
+def test_run_ids_are_unique_within_a_second(tmp_path):
+    run_logs = [RunLog(base_dir=str(tmp_path)) for _ in range(50)]
+    assert len({run_log.run_id for run_log in run_logs}) == 50
+    run_id = run_logs[0].run_id
+    assert run_date_for(run_id) == f"{run_id[:4]}-{run_id[4:6]}-{run_id[6:8]}"
+    for run_log in run_logs:
+        run_log.close()
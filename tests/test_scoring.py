@@ -0,0 +1,104 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import scoring  # noqa: E402
+from scoring import FAIL_THRESHOLD, PASS_THRESHOLD, TieredScorer, token_f1_scores  # noqa: E402
+
+
+def item(answer, reference='эталон', has_reference=True):
+    return {'question': 'Вопрос?', 'answer': answer, 'reference': reference, 'has_reference': has_reference}
+
+
+def test_f1_ignores_case_punctuation_and_yo():
+    scores = token_f1_scores(["Воланд — ВСЁ ЗНАЛ!"], ["воланд, все знал"])
+    assert scores[0] == pytest.approx(1.0)
+
+
+def test_f1_matches_russian_word_forms_by_stem():
+    # Усечение до 6 символов склеивает падежи: «Маргаритой» и «Маргарита»
+    scores = token_f1_scores(["с Маргаритой"], ["Маргарита"])
+    assert scores[0] == pytest.approx(1.0)
+
+
+def test_f1_skips_stop_words():
+    assert token_f1_scores(["и в не что он"], ["и в не что он"])[0] == 0.0
+
+
+def test_f1_partial_overlap():
+    # Ответ из 2 значимых слов, эталон из 4, общее одно: P = 1/2, R = 1/4
+    scores = token_f1_scores(["Мастер писатель"], ["Мастер сжег рукопись романа"])
+    assert scores[0] == pytest.approx(2 * 0.5 * 0.25 / 0.75)
+
+
+def test_f1_counts_repeated_words_once_per_match():
+    scores = token_f1_scores(["кот кот кот"], ["кот"])
+    assert scores[0] == pytest.approx(2 * (1 / 3) * 1 / (1 / 3 + 1))
+
+
+def test_f1_empty_inputs():
+    assert token_f1_scores([], []).shape == (0,)
+    assert list(token_f1_scores(["", "Воланд"], ["Воланд", ""])) == [0.0, 0.0]
+
+
+def test_tier_boundaries(monkeypatch):
+    # На границах решает локальный уровень: F1 = 0.6 — верно, F1 = 0.15 — неверно; строго между — судье
+    scores = [PASS_THRESHOLD, FAIL_THRESHOLD, PASS_THRESHOLD - 1e-6, FAIL_THRESHOLD + 1e-6, 0.95, 0.0]
+    monkeypatch.setattr(scoring, 'token_f1_scores', lambda answers, references: np.array(scores[:len(answers)]))
+    judged = []
+
+    def judge(question, answer, reference):
+        judged.append(answer)
+        return True, 'судья'
+
+    scorer = TieredScorer(judge=judge)
+    verdicts = scorer.score([item(f"ответ {i}") for i in range(len(scores))])
+
+    assert [v['verdict_source'] for v in verdicts] == ['local', 'local', 'judge', 'judge', 'local', 'local']
+    assert [v['correctness'] for v in verdicts] == [True, False, True, True, True, False]
+    assert sorted(judged) == ['ответ 2', 'ответ 3']
+    stats = scorer.stats()
+    assert (stats['local_pass'], stats['local_fail'], stats['judged']) == (2, 2, 2)
+    assert stats['judge_call_rate'] == pytest.approx(2 / 6)
+
+
+def test_missing_reference_always_goes_to_judge(monkeypatch):
+    monkeypatch.setattr(scoring, 'token_f1_scores', lambda answers, references: np.array([1.0]))
+    scorer = TieredScorer(judge=lambda q, a, r: (False, 'нет эталона'))
+    verdict, = scorer.score([item("Воланд", has_reference=False)])
+    assert verdict['verdict_source'] == 'judge'
+    assert verdict['correctness'] is False
+
+
+def test_empty_answer_fails_locally():
+    verdict, = TieredScorer(judge=lambda q, a, r: (True, '')).score([item('')])
+    assert verdict == {'correctness': False, 'correctness_reason': 'Пустой ответ', 'verdict_source': 'local',
+                       'score': 0.0}
+
+
+def test_local_fallback_without_judge(monkeypatch):
+    # Без судьи неуверенная полоса решается по ее середине
+    midpoint = (PASS_THRESHOLD + FAIL_THRESHOLD) / 2
+    monkeypatch.setattr(scoring, 'token_f1_scores', lambda answers, references: np.array([midpoint, midpoint - 0.01]))
+    verdicts = TieredScorer(judge=None).score([item('первый'), item('второй')])
+    assert [v['verdict_source'] for v in verdicts] == ['local_fallback', 'local_fallback']
+    assert [v['correctness'] for v in verdicts] == [True, False]
+
+
+def test_local_fallback_when_judge_fails(monkeypatch):
+    monkeypatch.setattr(scoring, 'token_f1_scores', lambda answers, references: np.array([0.5]))
+
+    def broken_judge(question, answer, reference):
+        raise RuntimeError("429")
+
+    scorer = TieredScorer(judge=broken_judge)
+    verdict, = scorer.score([item('ответ')])
+    assert verdict['verdict_source'] == 'local_fallback'
+    assert verdict['correctness'] is True
+    assert 'LLM-судья недоступен' in verdict['correctness_reason']
+    assert scorer.stats()['judge_errors'] == 1